@@ -1,33 +1,100 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import threading
 import logging
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime
 
+from sqlalchemy import tuple_
+
 from backend.database import init_db, SessionLocal, MemoryEvent, ActionItem
-from backend.ingest.watcher import start_watching
+from backend.ingest import watcher
+from backend.ingest.watcher import start_watching, SETTLE
 from backend.retrieval.reasoning import ReasoningEngine
 from backend.maintenance.jobs import job_runner
+from backend.maintenance.reindex import reindexer
+from backend.maintenance.clustering import cluster_summaries
+from backend.memory.vector_store import store, claim_store
+from backend.memory.tag_index import KINDS, facets, lookup
+from backend.memory.content_store import content_store
+from backend.memory.graph import graph_builder
+from backend.memory import feeds
+from backend.ingest.job_queue import job_queue
+from backend.utils.llm_client import list_running_models, json_generation_stats
+from backend.utils.model_scheduler import scheduler
+from backend.utils.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from backend.utils import tracing
+from backend.utils.warmup import warmup
+from backend.ingest.uploads import Upload, UploadTooLarge, guess_source_type, upload_status
+from backend.config import TRACE_ALL_QUERIES, WARMUP_ON_START, QUERY_BATCH_MAX, WATCH_DIRS, REINDEX_ON_STALE
+from backend.utils.pagination import encode_cursor, decode_cursor, parse_datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI MINDS API", version="1.0")
+watcher_thread: Optional[threading.Thread] = None
+started = False  # set once the lifespan startup has run
+
+
+def start_services():
+    """Everything the API needs besides the routes. Runs at startup, not at import."""
+    global watcher_thread, started
+    # Only one process may write the vector store (fails while a backfill/reindex CLI runs)
+    claim_store()
+
+    # Initialize DB
+    init_db()
+
+    # Start Watcher in background
+    try:
+        watcher_thread = threading.Thread(target=start_watching, name="watcher", daemon=True)
+        watcher_thread.start()
+        logger.info("Background watcher started successfully.")
+    except Exception as e:
+        logger.error(f"Failed to start background watcher: {e}")
+
+    # Start Maintenance Job
+    job_runner.start()
+
+    # Keep the memory graph up to date as vectors arrive
+    graph_builder.start()
 
-# Initialize DB
-init_db()
+    # An index embedded differently from current queries is rebuilt in the background;
+    # until the swap, ingestion holds new vectors back (VectorStore.add_events)
+    if REINDEX_ON_STALE:
+        threading.Thread(target=_reindex_if_stale, name="stale-check", daemon=True).start()
 
-# Start Watcher in background
-try:
-    watcher_thread = threading.Thread(target=start_watching, daemon=True)
-    watcher_thread.start()
-    logger.info("Background watcher started successfully.")
-except Exception as e:
-    logger.error(f"Failed to start background watcher: {e}")
+    # Load the vector index and the query-path models before /ready admits traffic
+    if WARMUP_ON_START:
+        warmup.start()
+    started = True
 
-# Start Maintenance Job
-job_runner.start()
+
+def _reindex_if_stale():
+    store.ensure_loaded()
+    if store.is_stale():
+        logger.warning(f"Vector index holds '{store.embedding_version}' embeddings; starting a reindex.")
+        reindexer.start()
+
+
+def stop_services():
+    warmup.stop()
+    graph_builder.stop()
+    job_runner.stop()
+    watcher.STOP_EVENT.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_services()
+    yield
+    stop_services()
+
+
+app = FastAPI(title="AI MINDS API", version="1.0", lifespan=lifespan)
 
 # Reasoning Engine
 engine = ReasoningEngine()
@@ -35,6 +102,8 @@ engine = ReasoningEngine()
 class QueryRequest(BaseModel):
     query: str
     filters: Optional[Dict[str, Any]] = None
+    expand: bool = False  # add one-hop graph neighbors of the top hits to the context
+    debug: bool = False  # return the timing trace (spans, tokens, prompt sizes) with the answer
 
 class QueryResponse(BaseModel):
     answer: str
@@ -42,57 +111,428 @@ class QueryResponse(BaseModel):
     citations: List[str]
     intent: str
     uncertainty_flags: List[str]
+    trace: Optional[Dict[str, Any]] = None  # only with debug=true
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=QUERY_BATCH_MAX)
+    filters: Optional[Dict[str, Any]] = None  # shared by all queries
+    expand: bool = False
+    debug: bool = False
+
+class BatchQueryResult(QueryResponse):
+    error: Optional[str] = None  # this question failed; the others are unaffected
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    trace: Optional[Dict[str, Any]] = None
 
 @app.get("/status")
 def get_status():
-    return {"status": "running", "watcher": watcher_thread.is_alive()}
+    return {
+        "status": "running",
+        "watcher": watcher_thread is not None and watcher_thread.is_alive(),
+        "warmup": warmup.status(),
+        "json_generation": json_generation_stats(),
+        "vector_index_stale": store.is_stale() if store.loaded else None,
+        "ingest_queue": job_queue.stats(),
+        "settling": SETTLE.stats(),
+        "graph": graph_builder.stats(),
+    }
+
+# Queue depths and sizes owned by other components, sampled at scrape time
+INGEST_JOBS = REGISTRY.gauge("ingest_jobs", "Durable ingest jobs by state", ["state"])
+INGEST_IN_FLIGHT = REGISTRY.gauge("ingest_in_flight", "Files submitted to the pipeline and not finished yet")
+INGEST_LANE_QUEUED = REGISTRY.gauge("ingest_lane_queued", "Queued pipeline items per lane", ["lane", "stage"])
+INGEST_WRITE_QUEUE = REGISTRY.gauge("ingest_write_queue", "Batches waiting for the DB writer")
+SETTLE_PENDING = REGISTRY.gauge("ingest_settling", "Files waiting for writes to settle")
+LLM_QUEUED = REGISTRY.gauge("llm_queued", "Calls waiting for a model slot", ["model"])
+VECTORS = REGISTRY.gauge("vector_store_vectors", "Vectors in the live index")
+
+
+@REGISTRY.collector
+def _sample_queues():
+    for state, n in job_queue.stats().items():
+        INGEST_JOBS.set(n, state=state)
+    pipeline = watcher.PIPELINE
+    if pipeline is not None:
+        stats = pipeline.stats()
+        INGEST_IN_FLIGHT.set(stats["in_flight"])
+        INGEST_WRITE_QUEUE.set(stats["write_queue"])
+        for lane, lane_stats in stats["lanes"].items():
+            INGEST_LANE_QUEUED.set(lane_stats["queued"], lane=lane, stage="parse")
+            INGEST_LANE_QUEUED.set(lane_stats["model_queued"], lane=lane, stage="model")
+    SETTLE_PENDING.set(SETTLE.stats()["pending"])
+    for model, model_stats in scheduler.stats()["models"].items():
+        LLM_QUEUED.set(model_stats["queued"], model=model)
+    if store.loaded:
+        VECTORS.set(store.index.ntotal)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition: stage latency histograms, call/token counters, queue gauges."""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/ready")
+def get_ready():
+    """Readiness probe: 200 once startup and warmup are done (index loaded, models resident), else 503."""
+    ready = started and (warmup.ready() or not WARMUP_ON_START)
+    body = {"ready": ready, "started": started, "warmup": warmup.status()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/models")
+def get_models():
+    """Model residency: scheduler view plus what Ollama actually holds in memory."""
+    return {"scheduler": scheduler.stats(), "ollama_running": list_running_models()}
+
+@app.get("/maintenance")
+def get_maintenance(job: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Scheduled maintenance jobs (cadence, budget, last run) and the run history."""
+    return {**job_runner.status(), "runs": job_runner.history(job, limit)}
 
-@app.post("/query", response_model=QueryResponse)
-def query_endpoint(request: QueryRequest):
+@app.post("/maintenance/{job}")
+def run_maintenance(job: str):
+    """Run a maintenance job now, regardless of its cadence and the idle rule."""
     try:
-        result = engine.process_query(request.query)
-        return QueryResponse(
-            answer=result.get("answer", "I'm unsure."),
-            confidence=int(result.get("confidence", 0)),
-            citations=result.get("citations", []),
-            intent=result.get("intent", "unknown"),
-            uncertainty_flags=result.get("uncertainty_flags", [])
-        )
+        return job_runner.run_now(job)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown maintenance job '{job}'")
+
+@app.get("/reindex")
+def get_reindex():
+    return reindexer.status()
+
+@app.post("/reindex")
+def start_reindex(restart: bool = False):
+    """Re-embed all events into a new index in the background; queries keep using the live one."""
+    started = reindexer.start(restart=restart)
+    return {"started": started, **reindexer.status()}
+
+@app.post("/query", response_model=QueryResponse, response_model_exclude_none=True)
+def query_endpoint(request: QueryRequest, response: Response):
+    job_runner.note_query()
+    traced = request.debug or TRACE_ALL_QUERIES
+    try:
+        with tracing.trace("query", query=request.query[:200]) if traced else nullcontext() as trace:
+            result = engine.process_query(request.query, request.filters, expand=request.expand)
+        if trace is not None:
+            response.headers["X-Trace-Id"] = trace.id
+        return _query_response(result, trace=trace.to_dict() if request.debug else None)
     except Exception as e:
         logger.error(f"Query error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/batch", response_model=BatchQueryResponse, response_model_exclude_none=True)
+def query_batch_endpoint(request: BatchQueryRequest, response: Response):
+    """Many questions in one call: one embedding request and one vector search for all, answers in parallel."""
+    for _ in request.queries:
+        job_runner.note_query()
+    traced = request.debug or TRACE_ALL_QUERIES
+    with tracing.trace("query_batch", queries=len(request.queries)) if traced else nullcontext() as trace:
+        results = engine.process_queries(request.queries, request.filters, expand=request.expand)
+    if trace is not None:
+        response.headers["X-Trace-Id"] = trace.id
+    return BatchQueryResponse(
+        results=[
+            BatchQueryResult(answer="", confidence=0, citations=[], intent="unknown", uncertainty_flags=["error"], error=r["error"])
+            if "error" in r else _query_response(r, model=BatchQueryResult)
+            for r in results
+        ],
+        trace=trace.to_dict() if request.debug else None,
+    )
+
+def _query_response(result: Dict[str, Any], model=QueryResponse, **extra):
+    return model(
+        answer=result.get("answer", "I'm unsure."),
+        confidence=int(result.get("confidence", 0)),
+        citations=result.get("citations", []),
+        intent=result.get("intent", "unknown"),
+        uncertainty_flags=result.get("uncertainty_flags", []),
+        **extra,
+    )
+
+@app.post("/ingest", status_code=202)
+async def ingest_upload(request: Request, filename: str, source_type: Optional[str] = None):
+    """
+    Ingest a file sent as the raw request body (e.g. curl --data-binary @notes.pdf
+    "/ingest?filename=notes.pdf"). The body is streamed to disk chunk by chunk and
+    queued ahead of watched files; poll GET /ingest/{job_id} for progress.
+    source_type defaults to a guess from the file extension.
+    """
+    source_type = source_type or guess_source_type(filename)
+    if source_type not in WATCH_DIRS:
+        raise HTTPException(status_code=400, detail=f"Unknown source_type, use one of {list(WATCH_DIRS)}")
+    # All disk I/O runs in the threadpool so a large upload does not stall the event loop
+    upload = await run_in_threadpool(Upload, filename, source_type)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(upload.write, chunk)
+    except UploadTooLarge as e:
+        await run_in_threadpool(upload.abort)
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(upload.abort)
+        raise
+    if not upload.bytes:
+        await run_in_threadpool(upload.abort)
+        raise HTTPException(status_code=400, detail="Empty upload")
+    return await run_in_threadpool(upload.commit)
+
+@app.get("/ingest/{job_id}")
+def get_ingest_job(job_id: str):
+    status = upload_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    return status
+
+@app.get("/traces")
+def get_traces(limit: int = Query(20, ge=1, le=200)):
+    """Slowest of the recently traced queries (debug=true, or all with TRACE_ALL_QUERIES)."""
+    return tracing.recent_traces.slowest(limit)
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    trace = tracing.recent_traces.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (expired from the recent buffer?)")
+    return trace
+
+@app.get("/facets/{kind}")
+def get_facets(kind: str, prefix: Optional[str] = None, limit: int = Query(20, ge=1, le=200)):
+    """Most frequent entities or topics (optionally by name prefix), with event counts."""
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown facet '{kind}', use one of {list(KINDS)}")
+    session = SessionLocal()
+    try:
+        return facets(session, kind, prefix=prefix, limit=limit)
+    finally:
+        session.close()
+
+@app.get("/lookup")
+def lookup_events(
+    entity: Optional[List[str]] = Query(None),
+    topic: Optional[List[str]] = Query(None),
+    match: str = Query("all", pattern="^(all|any)$"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Events tagged with the given entities/topics (newest first), plus topic/entity facets of the matches."""
+    if not entity and not topic:
+        raise HTTPException(status_code=400, detail="Pass at least one entity or topic")
+    session = SessionLocal()
+    try:
+        ids = list(lookup(session, entities=entity, topics=topic, match=match))
+        events = []
+        for i in range(0, len(ids), 500):
+            events.extend(session.query(
+                MemoryEvent.id, MemoryEvent.created_at, MemoryEvent.source_type, MemoryEvent.summary_1line
+            ).filter(MemoryEvent.id.in_(ids[i : i + 500])))
+        events.sort(key=lambda e: (e.created_at or datetime.min, e.id), reverse=True)
+        return {
+            "total": len(ids),
+            "events": [{
+                "id": e.id,
+                "created_at": e.created_at.isoformat() if e.created_at else None,
+                "source_type": e.source_type,
+                "summary": e.summary_1line,
+            } for e in events[:limit]],
+            "facets": {kind: facets(session, kind, limit=10, event_ids=ids) for kind in KINDS},
+        }
+    finally:
+        session.close()
+
+@app.get("/clusters")
+def get_clusters(limit: int = Query(20, ge=1, le=200)):
+    """Memory clusters with their cached summaries, most active recently first."""
+    session = SessionLocal()
+    try:
+        return cluster_summaries(session, limit=limit)
+    finally:
+        session.close()
+
+@app.get("/events/{event_id}/text")
+def get_event_text(event_id: str, start: int = Query(0, ge=0), length: Optional[int] = Query(None, ge=1)):
+    """Full text of an event, or the passage [start, start+length); long bodies are read from the content store."""
+    session = SessionLocal()
+    try:
+        text = content_store.event_text(session, event_id, start, length)
+    finally:
+        session.close()
+    if text is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return {"id": event_id, "start": start, "text": text}
+
+def _bad_cursor():
+    return HTTPException(status_code=400, detail="Invalid cursor")
+
+def _decode_since(since: str):
+    key = decode_cursor(since, 2)
+    if key is None or not isinstance(key[0], int) or not isinstance(key[1], (str, type(None))):
+        raise _bad_cursor()
+    return key[0], key[1]
+
+def _feed_delta(session, response: Response, feed: str, query, model, since: str, version: int, limit: int,
+                to_dict, keep=None):
+    """
+    ?since= mode shared by /timeline and /actions: rows written after the
+    cursor, oldest change first, with {"id", "deleted": true} for rows that
+    were removed (or no longer pass keep). X-Next-Cursor means more changes
+    are pending: call again with it as ?since=.
+    """
+    after = _decode_since(since)
+    if after[0] > version:
+        raise HTTPException(status_code=410, detail="Cursor is ahead of the feed (database reset?); reload without since")
+    if after == (version, None):
+        response.headers["X-Feed-Cursor"] = since
+        return []  # nothing written since: no scan
+    changed, more = feeds.changes(session, feed, query, model, after, version, limit)
+    if more:
+        response.headers["X-Next-Cursor"] = encode_cursor(changed[-1][0], changed[-1][1])
+        response.headers["X-Feed-Cursor"] = response.headers["X-Next-Cursor"]
+    else:
+        response.headers["X-Feed-Cursor"] = encode_cursor(version, None)
+    return [
+        to_dict(row) if row is not None and (keep is None or keep(row)) else {"id": item_id, "deleted": True}
+        for _, item_id, row in changed
+    ]
+
+def _timeline_row(e) -> Dict[str, Any]:
+    return {
+        "id": e.id,
+        "created_at": e.created_at.isoformat() if e.created_at else None,
+        "source_type": e.source_type,
+        "summary": e.summary_1line,
+        "topics": e.topics
+    }
+
+def _action_row(i) -> Dict[str, Any]:
+    return {
+        "id": i.id,
+        "task": i.task,
+        "owner": i.owner,
+        "priority": i.priority,
+        "status": i.status,
+        "due_date": i.due_date.isoformat() if i.due_date else None
+    }
+
 @app.get("/timeline")
-def get_timeline(limit: int = 50):
+def get_timeline(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    source_type: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """
+    Newest first. Keyset pagination: pass the X-Next-Cursor header of one
+    page as ?cursor= to get the next one (an index seek, whatever the depth).
+
+    Incremental polling: X-Feed-Cursor is the feed version a response
+    reflects; pass it as ?since= to get only the events written after it.
+    The first page carries an ETag; with If-None-Match an unchanged first
+    page is a 304 without any scan.
+    """
     session = SessionLocal()
     try:
-        events = session.query(MemoryEvent).order_by(MemoryEvent.created_at.desc()).limit(limit).all()
-        return [{
-            "id": e.id,
-            "created_at": e.created_at.isoformat() if e.created_at else None,
-            "source_type": e.source_type,
-            "summary": e.summary_1line,
-            "topics": e.topics
-        } for e in events]
+        version = feeds.version(session, feeds.TIMELINE)
+        tag = feeds.etag(feeds.TIMELINE, version, source_type, limit)
+        if not cursor and not since and feeds.not_modified(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers={"ETag": tag})
+
+        query = session.query(
+            MemoryEvent.id, MemoryEvent.created_at, MemoryEvent.source_type, MemoryEvent.summary_1line, MemoryEvent.topics,
+            MemoryEvent.change_seq,
+        )
+        if source_type:
+            query = query.filter(MemoryEvent.source_type == source_type)
+        if since:
+            return _feed_delta(session, response, feeds.TIMELINE, query, MemoryEvent, since, version, limit, _timeline_row)
+        if cursor:
+            key = decode_cursor(cursor, 2)
+            if key is None:
+                raise _bad_cursor()
+            try:
+                created_at = parse_datetime(key[0])
+            except (TypeError, ValueError):
+                raise _bad_cursor()
+            query = query.filter(tuple_(MemoryEvent.created_at, MemoryEvent.id) < tuple_(created_at, key[1]))
+        rows = query.order_by(MemoryEvent.created_at.desc(), MemoryEvent.id.desc()).limit(limit + 1).all()
+
+        response.headers["X-Feed-Cursor"] = encode_cursor(version, None)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+        elif not cursor:
+            response.headers["ETag"] = tag
+        return [_timeline_row(e) for e in rows]
     finally:
         session.close()
 
 @app.get("/actions")
-def get_actions(status: Optional[str] = None):
+def get_actions(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """
+    Soonest due first, undated last. Without ?limit= / ?cursor= every item
+    is returned (as before pagination); otherwise keyset pages of `limit`
+    (default 200) via X-Next-Cursor / ?cursor=, served by the
+    (status, due_date, id) and (due_date, id) indexes.
+    ?since= / If-None-Match work as on /timeline.
+    """
+    unpaged = limit is None and not cursor and not since
+    limit = limit or 200
     session = SessionLocal()
     try:
-        query = session.query(ActionItem)
+        version = feeds.version(session, feeds.ACTIONS)
+        tag = feeds.etag(feeds.ACTIONS, version, status, None if unpaged else limit)
+        if not cursor and not since and feeds.not_modified(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers={"ETag": tag})
+
+        base = session.query(ActionItem)
+        if since:
+            # Unfiltered, so an item whose status no longer matches comes back as deleted
+            keep = (lambda i: i.status == status) if status else None
+            return _feed_delta(session, response, feeds.ACTIONS, base, ActionItem, since, version, limit, _action_row, keep)
         if status:
-            query = query.filter(ActionItem.status == status)
-        items = query.order_by(ActionItem.due_date.asc().nullslast()).all()
-        return [{
-            "id": i.id,
-            "task": i.task,
-            "owner": i.owner,
-            "priority": i.priority,
-            "status": i.status,
-            "due_date": i.due_date.isoformat() if i.due_date else None
-        } for i in items]
+            base = base.filter(ActionItem.status == status)
+
+        after_due, after_id = None, None
+        if cursor:
+            key = decode_cursor(cursor, 2)
+            if key is None:
+                raise _bad_cursor()
+            try:
+                after_due, after_id = parse_datetime(key[0]), key[1]
+            except (TypeError, ValueError):
+                raise _bad_cursor()
+
+        # Two index range scans instead of one NULLS LAST sort: dated items, then undated ones
+        items = []
+        if not cursor or after_due is not None:
+            dated = base.filter(ActionItem.due_date.isnot(None))
+            if after_due is not None:
+                dated = dated.filter(tuple_(ActionItem.due_date, ActionItem.id) > tuple_(after_due, after_id))
+            dated = dated.order_by(ActionItem.due_date.asc(), ActionItem.id.asc())
+            items = (dated if unpaged else dated.limit(limit + 1)).all()
+        if unpaged or len(items) <= limit:
+            undated = base.filter(ActionItem.due_date.is_(None))
+            if cursor and after_due is None:
+                undated = undated.filter(ActionItem.id > after_id)
+            undated = undated.order_by(ActionItem.id.asc())
+            items += (undated if unpaged else undated.limit(limit + 1 - len(items))).all()
+
+        response.headers["X-Feed-Cursor"] = encode_cursor(version, None)
+        if not unpaged and len(items) > limit:
+            items = items[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(items[-1].due_date, items[-1].id)
+        elif not cursor:
+            response.headers["ETag"] = tag
+        return [_action_row(i) for i in items]
     finally:
         session.close()
 
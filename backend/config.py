@@ -1,11 +1,11 @@
 import os
 from pathlib import Path
 
-# Base Paths
+# Base Paths (AI_MINDS_* env vars let tools/benchmarks point at scratch data)
 BASE_DIR = Path(__file__).resolve().parent.parent
-INBOX_DIR = BASE_DIR / "inbox"
-DB_PATH = BASE_DIR / "backend" / "ai_minds.db"
-VECTOR_STORE_PATH = BASE_DIR / "backend" / "vector_store"
+INBOX_DIR = Path(os.environ.get("AI_MINDS_INBOX_DIR", BASE_DIR / "inbox"))
+DB_PATH = Path(os.environ.get("AI_MINDS_DB_PATH", BASE_DIR / "backend" / "ai_minds.db"))
+VECTOR_STORE_PATH = Path(os.environ.get("AI_MINDS_VECTOR_STORE_PATH", BASE_DIR / "backend" / "vector_store"))
 
 # Folder Monitoring (Path objects)
 WATCH_DIRS = {
@@ -16,16 +16,163 @@ WATCH_DIRS = {
 }
 
 # Model Configuration
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 MODEL_MAIN = "qwen2.5:3b-instruct"
 MODEL_EMBEDDING = "nomic-embed-text"
 MODEL_VISION = "qwen2.5vl:3b"
 MODEL_BACKUP = "phi:2.7b"
+EMBEDDING_VERSION = f"{MODEL_EMBEDDING}:api-embed-normalized"  # bump when stored vectors are no longer comparable
+
+# Model scheduling (keep hot models resident, avoid Ollama swap/reload)
+# keep_alive values use Ollama's duration syntax ("30m", "-1" = forever, "0" = unload now)
+OLLAMA_KEEP_ALIVE = {
+    MODEL_MAIN: "30m",
+    MODEL_EMBEDDING: "30m",
+    MODEL_VISION: "5m",
+    MODEL_BACKUP: "5m",
+}
+OLLAMA_DEFAULT_KEEP_ALIVE = "5m"
+LLM_WORKERS = 2  # concurrent requests admitted for the active model
+MODEL_SWITCH_MAX_WAIT_S = 5.0  # other models' jobs wait at most this long before a swap
+VERIFY_WITH_MAIN_MODEL = False  # True = skip the phi swap, verify with MODEL_MAIN
 
 # Whisper Configuration (Local)
-WHISPER_EXE = r"C:\whisper\main.exe"
-WHISPER_MODEL = r"C:\whisper\models\ggml-small.bin"
+WHISPER_EXE = os.environ.get("AI_MINDS_WHISPER_EXE", r"C:\whisper\main.exe")
+WHISPER_MODEL = os.environ.get("AI_MINDS_WHISPER_MODEL", r"C:\whisper\models\ggml-small.bin")
+WHISPER_PROCESSES = 2  # concurrent whisper.cpp processes
+WHISPER_THREADS = 2  # -t per process
+WHISPER_SEGMENT_TIMEOUT_S = 300
+WHISPER_FILE_TIMEOUT_S = 600  # whole-file runs (no ffmpeg to split the container)
+TRANSCRIPT_CACHE_DIR = Path(os.environ.get("AI_MINDS_TRANSCRIPT_CACHE_DIR", BASE_DIR / "backend" / "transcripts"))
+
+# Audio segmentation (split on silence, transcribe segments in parallel)
+AUDIO_SEGMENT_MIN_S = 10
+AUDIO_SEGMENT_MAX_S = 45
+AUDIO_MIN_SILENCE_S = 0.3
+AUDIO_PART_S = 300  # transcript seconds per incrementally ingested event
+AUDIO_INCREMENTAL_MIN_S = 600  # longer recordings are ingested part by part
 
 # System Settings
 CONFIDENCE_THRESHOLD = 60
 MAX_SEARCH_RESULTS = 5
+INGEST_BATCH_SIZE = 8  # files drained per worker pass (phase-ordered: captions, metadata, embeddings)
+
+# Staged ingestion pipeline (parse -> model calls -> single DB writer)
+INGEST_PARSE_PROCESSES = max(1, (os.cpu_count() or 2) - 1)  # text/PDF parsing; 0 = use threads
+INGEST_IO_WORKERS = 2  # image/audio parsing (waits on VLM / whisper)
+INGEST_MODEL_WORKERS = 2  # concurrent metadata + embedding batches
+INGEST_QUEUE_MAXSIZE = 64  # bound between stages (backpressure)
+WRITER_BATCH_SIZE = 32  # DB/vector writes grouped per commit
+WRITER_FLUSH_S = 0.5  # max wait to fill a writer batch
+
+# Per-source_type ingestion lanes: fair-share weight, concurrent parses, queued files before backpressure
+INGEST_LANES = {
+    "text": {"weight": 8, "concurrency": 4, "max_queue": 256},
+    "docs": {"weight": 4, "concurrency": 2, "max_queue": 64},
+    "images": {"weight": 2, "concurrency": 2, "max_queue": 64},
+    "audio": {"weight": 1, "concurrency": 1, "max_queue": 16},
+}
+
+# Durable ingest queue (SQLite table ingest_jobs)
+INGEST_CLAIM_BATCH = 16  # jobs claimed per queue round-trip
+INGEST_JOB_MAX_ATTEMPTS = 3  # then the job stays "failed"
+INGEST_JOB_RETRY_BACKOFF_S = 30  # doubled per attempt
+INGEST_RECONCILE_PRIORITY = -10  # files found by the startup scan yield to live events
+
+# Uploads (POST /ingest): streamed to disk, then enqueued directly (not watched)
+UPLOAD_DIR = Path(os.environ.get("AI_MINDS_UPLOAD_DIR", INBOX_DIR / "uploads"))
+UPLOAD_MAX_BYTES = 512 * 1024 * 1024
+INGEST_UPLOAD_PRIORITY = 10  # an uploader is waiting on the job id
+
+# File settle tracking (watchdog events -> settled files -> job queue)
+SETTLE_QUIET_S = 1.0  # size/mtime unchanged this long = copy finished
+SETTLE_TICK_S = 0.25  # one timer loop re-stats every pending path per tick
+SETTLE_GIVE_UP_S = 600  # still changing after this: drop (the next event re-adds it)
+SETTLE_MAX_PENDING = 10000  # beyond this, files go straight to the queue
+SETTLE_DEBOUNCE_S = 2.0  # repeat events for an unchanged, just-queued file are dropped
+SETTLE_DEBOUNCE_MAX = 4096  # bounded debounce memory
+
+# PDF extraction
+PDF_PAGE_RANGE = 16  # pages per process-pool task
+PDF_PARALLEL_MIN_PAGES = 48  # below this, extract serially in-process
+PDF_PAGES_PER_BATCH = 10  # pages per incrementally ingested event
+PDF_INCREMENTAL_MIN_PAGES = 30  # larger PDFs are ingested batch by batch
+
+# Metadata extraction (map-reduce for long content)
+METADATA_CHUNK_CHARS = 3000  # single-call limit; longer text is chunked
+METADATA_MAP_CONCURRENCY = 2  # parallel chunk extractions per document
+
+# Image preprocessing before the VLM
+VLM_MAX_IMAGE_SIDE = 1024  # longest side sent to MODEL_VISION (px)
+VLM_JPEG_QUALITY = 85
+PHASH_MAX_DISTANCE = 6  # Hamming distance (of 64 bits) treated as near-duplicate
+
+# Bulk backfill (python -m backend.ingest.backfill <dir>)
+BACKFILL_BATCH_SIZE = 32  # files per parse/metadata/embed/write round
+BACKFILL_EMBED_BATCH = 64  # texts per /api/embed request
+BACKFILL_CHECKPOINT_DIR = Path(os.environ.get("AI_MINDS_BACKFILL_DIR", BASE_DIR / "backend" / "backfill"))
+
+# Online re-embedding (rebuilds the vector index after EMBEDDING_VERSION changes)
+REINDEX_BATCH_SIZE = 256  # events read per keyset page
+REINDEX_CONCURRENCY = 2  # parallel /api/embed requests per page
+REINDEX_MAX_EVENTS_PER_S = 50  # leave embedding capacity for live queries; 0 = unlimited
+REINDEX_CHECKPOINT_BATCHES = 4  # persist the partial index every N pages (resume point)
+REINDEX_ON_STALE = True  # API startup re-embeds an index built with another EMBEDDING_VERSION
+
+# Out-of-row content store (backend.memory.content_store)
+CONTENT_INLINE_CHARS = 4000  # longer bodies are stored compressed; raw_text keeps this prefix
+CONTENT_CHUNK_CHARS = 64 * 1024  # independently compressed chunk (unit of a range read)
+CONTENT_ZSTD_LEVEL = 3  # used when the zstandard package is installed, else zlib
+CONTENT_ZLIB_LEVEL = 6
+
+# Memory graph (backend.memory.graph): precomputed edges for one-hop expansion
+GRAPH_NEIGHBORS = 8  # kNN per vector considered for "related" edges
+GRAPH_MAX_DISTANCE = 0.6  # squared L2 on normalized embeddings (~cosine >= 0.7)
+GRAPH_BATCH_SIZE = 128  # vectors per batched FAISS search
+GRAPH_TEMPORAL_MAX_GAP_S = 6 * 3600  # consecutive events further apart get no "temporal" edge
+GRAPH_INTERVAL_S = 30  # the builder also wakes on new vectors
+GRAPH_EXPAND_SEEDS = 3  # top hits expanded by one hop
+GRAPH_EXPAND_PER_SEED = 3  # neighbors added per seed
+GRAPH_TEMPORAL_WEIGHT = 0.5  # edge weight of a temporal neighbor (related edges use similarity)
+
+# Memory clustering (backend.maintenance.clustering), run by the maintenance scheduler
+CLUSTER_MIN_EVENTS = 20  # nothing is clustered below this many vectors
+CLUSTER_MAX_K = 64
+CLUSTER_BATCH_SIZE = 1024  # vectors per mini-batch k-means step
+CLUSTER_ITERATIONS = 100
+CLUSTER_RECLUSTER_GROWTH = 1.5  # full re-cluster once the index grew by this factor; else assign only
+CLUSTER_RESUMMARIZE_FRACTION = 0.2  # membership churn that invalidates a cached summary
+CLUSTER_SUMMARY_SAMPLE = 20  # member summaries (nearest the centroid) given to the LLM
+CLUSTER_SUMMARIES_PER_RUN = 4  # LLM calls per maintenance cycle
+CLUSTER_ROUTE_TOP = 5  # cluster summaries read by broad questions
+CLUSTER_ROUTE_RECENT_DAYS = 14  # "what have I been working on": rank clusters by recent members
+
+# Maintenance scheduler (backend.maintenance.jobs): jobs run only while the system is idle
+MAINT_TICK_S = 15  # how often due jobs are checked
+MAINT_IDLE_MAX_INGEST_JOBS = 0  # pending + running ingest jobs above this = busy
+MAINT_IDLE_MAX_QUERIES_PER_MIN = 2  # /query rate above this = busy
+MAINT_HISTORY_PER_JOB = 200  # run records kept per job
+CLUSTER_EVERY_S = 300
+WAL_CHECKPOINT_EVERY_S = 900
+ANALYZE_EVERY_S = 24 * 3600
+ANALYZE_LIMIT_ROWS = 1000  # PRAGMA analysis_limit: sampled ANALYZE, bounded cost
+VACUUM_EVERY_S = 6 * 3600
+VACUUM_PAGES_PER_STEP = 256  # PRAGMA incremental_vacuum step (budget checked between steps)
+VACUUM_FULL_MIN_FREE_FRACTION = 0.25  # free pages that justify a one-off full VACUUM (switches to incremental)
+VECTOR_COMPACT_EVERY_S = 6 * 3600
+VECTOR_COMPACT_MIN_ORPHAN_FRACTION = 0.05  # orphaned vectors (no live event) that justify a rebuild
+
+# Request tracing (backend.utils.tracing): opt-in per query with {"debug": true}
+TRACE_ALL_QUERIES = False  # also trace queries that did not ask for it (kept for /traces only)
+TRACE_RECENT = 200  # recent traces kept in memory; /traces lists the slowest of them
+TRACE_MODEL_LOAD_S = 0.1  # Ollama load_duration above this counts as a cold model (residency miss)
+
+# API startup (backend.utils.warmup): /ready stays 503 until the warmup has finished
+WARMUP_ON_START = True  # load the vector index and preload the query-path models in the background
+WARMUP_MODELS = [MODEL_EMBEDDING, MODEL_MAIN] + ([] if VERIFY_WITH_MAIN_MODEL else [MODEL_BACKUP])
+WARMUP_TIMEOUT_S = 180  # per model load
+WARMUP_RETRY_S = 15  # failed warmup steps (e.g. Ollama not up yet) are retried this often
+
+# Batch queries (POST /query/batch)
+QUERY_BATCH_MAX = 64  # questions per request
+QUERY_BATCH_CONCURRENCY = 4  # questions answered at once (the model scheduler still queues per model)
@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey, JSON, event
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey, JSON, BigInteger, Integer, Float, Index, LargeBinary, event
+from sqlalchemy.orm import declarative_base, deferred, relationship, sessionmaker
 from datetime import datetime
 import uuid
 import os
+import time
 
 from backend.config import DB_PATH
+from backend.utils.metrics import REGISTRY
+from backend.utils import tracing
 
 Base = declarative_base()
 
@@ -19,7 +22,11 @@ class MemoryEvent(Base):
     source_path = Column(Text)
     content_hash = Column(String(64), unique=True)
 
-    raw_text = Column(Text)
+    # Full text up to CONTENT_INLINE_CHARS; longer bodies keep only that prefix
+    # here and live compressed in content_chunks (see backend.memory.content_store).
+    # Deferred: loaded on first access, not with every row.
+    raw_text = deferred(Column(Text))
+    content_ref = Column(String(64), nullable=True)
     vision_caption = Column(Text, nullable=True)
     metadata_json = Column(JSON, default={})
 
@@ -31,6 +38,18 @@ class MemoryEvent(Base):
     intent_label = Column(String(100))
 
     embedding_ref = Column(String(50))
+    cluster_id = Column(Integer, nullable=True)  # backend.maintenance.clustering
+    change_seq = Column(Integer, nullable=True)  # timeline feed version of the last write (backend.memory.feeds)
+
+    __table_args__ = (
+        # Keyset pagination: (created_at, id) is the timeline order and cursor
+        Index("ix_memory_events_created_id", "created_at", "id"),
+        Index("ix_memory_events_source_created_id", "source_type", "created_at", "id"),
+        Index("ix_memory_events_embedding_ref", "embedding_ref"),
+        Index("ix_memory_events_cluster_id", "cluster_id", "created_at"),
+        Index("ix_memory_events_source_path", "source_path"),  # upload progress (events per file)
+        Index("ix_memory_events_change_seq", "change_seq", "id"),  # /timeline?since= deltas
+    )
 
     action_items = relationship("ActionItem", back_populates="event", cascade="all, delete-orphan")
     graph_edges_from = relationship(
@@ -56,6 +75,15 @@ class ActionItem(Base):
     status = Column(String(20), default="open")
     evidence_event_id = Column(String(36), ForeignKey("memory_events.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_seq = Column(Integer, nullable=True)  # actions feed version of the last write
+
+    __table_args__ = (
+        # Keyset pagination: (due_date, id) is the /actions order and cursor
+        Index("ix_action_items_due_id", "due_date", "id"),
+        Index("ix_action_items_status_due_id", "status", "due_date", "id"),
+        Index("ix_action_items_evidence_event_id", "evidence_event_id"),
+        Index("ix_action_items_change_seq", "change_seq", "id"),
+    )
 
     event = relationship("MemoryEvent", back_populates="action_items")
 
@@ -63,14 +91,66 @@ class ActionItem(Base):
 class Entity(Base):
     __tablename__ = "entities"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    name = Column(String(200), unique=True)
+    name = Column(String(200), unique=True)  # normalized key (see backend.memory.tag_index)
     description = Column(Text)
+    display_name = Column(String(200))  # first spelling seen
+    event_count = Column(Integer, default=0, nullable=False)
 
 
 class Topic(Base):
     __tablename__ = "topics"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    name = Column(String(200), unique=True)
+    name = Column(String(200), unique=True)  # normalized key
+    display_name = Column(String(200))
+    event_count = Column(Integer, default=0, nullable=False)
+
+
+class EventEntity(Base):
+    """Inverted index: entity -> events (the JSON column stays the per-event copy)."""
+    __tablename__ = "event_entities"
+    entity_id = Column(String(36), ForeignKey("entities.id"), primary_key=True)
+    event_id = Column(String(36), ForeignKey("memory_events.id"), primary_key=True)
+
+    __table_args__ = (Index("ix_event_entities_event_id", "event_id"),)
+
+
+class EventTopic(Base):
+    __tablename__ = "event_topics"
+    topic_id = Column(String(36), ForeignKey("topics.id"), primary_key=True)
+    event_id = Column(String(36), ForeignKey("memory_events.id"), primary_key=True)
+
+    __table_args__ = (Index("ix_event_topics_event_id", "event_id"),)
+
+
+class ContentBlob(Base):
+    """A large text body, content-addressed by sha256 and split into compressed chunks."""
+    __tablename__ = "content_blobs"
+    key = Column(String(64), primary_key=True)
+    codec = Column(String(16))  # zstd, zlib
+    length = Column(Integer)  # characters
+    chunk_chars = Column(Integer)
+    stored_bytes = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ContentChunk(Base):
+    __tablename__ = "content_chunks"
+    key = Column(String(64), ForeignKey("content_blobs.key"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary)
+
+
+class MemoryCluster(Base):
+    """A k-means cluster of event vectors with its cached consolidated summary."""
+    __tablename__ = "memory_clusters"
+    id = Column(Integer, primary_key=True)  # centroid row in the clustering state file
+    size = Column(Integer, default=0)
+    label = Column(String(200), nullable=True)
+    summary = Column(Text, nullable=True)
+    summary_size = Column(Integer, default=0)  # size when the summary was written
+    changed = Column(Integer, default=0)  # members added/removed since then
+    last_event_at = Column(DateTime, nullable=True)
+    summarized_at = Column(DateTime, nullable=True)
 
 
 class GraphEdge(Base):
@@ -79,11 +159,87 @@ class GraphEdge(Base):
     from_event_id = Column(String(36), ForeignKey("memory_events.id"))
     to_event_id = Column(String(36), ForeignKey("memory_events.id"))
     relation_type = Column(String(50))  # temporal, causal, related
+    weight = Column(Float, nullable=True)  # related: similarity, temporal: GRAPH_TEMPORAL_WEIGHT
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # related edges are stored once per pair (from < to); lookups go both ways
+        Index("ux_graph_edges_from_to_type", "from_event_id", "to_event_id", "relation_type", unique=True),
+        Index("ix_graph_edges_to_event_id", "to_event_id"),
+    )
 
     from_event = relationship("MemoryEvent", foreign_keys=[from_event_id], back_populates="graph_edges_from")
     to_event = relationship("MemoryEvent", foreign_keys=[to_event_id], back_populates="graph_edges_to")
 
 
+class FileFingerprint(Base):
+    """Raw-file identity checked before any parser runs (skip unchanged / byte-identical files)."""
+    __tablename__ = "file_fingerprints"
+    path = Column(Text, primary_key=True)  # normalized absolute path
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    raw_hash = Column(String(64), index=True)  # sha256 of file bytes
+    status = Column(String(20), default="done")  # done, failed
+    event_id = Column(String(36), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ImageCaption(Base):
+    """VLM captions keyed by perceptual hash, reused for near-identical images."""
+    __tablename__ = "image_captions"
+    phash = Column(String(16), primary_key=True)  # 64-bit pHash, hex
+    caption = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IngestJob(Base):
+    """Durable ingest queue: one row per file, re-enqueueing resets it to pending."""
+    __tablename__ = "ingest_jobs"
+    path = Column(Text, primary_key=True)  # normalized absolute path
+    source_type = Column(String(50))
+    state = Column(String(20), default="pending")  # pending, running, done, failed
+    priority = Column(Integer, default=0)  # higher is claimed first
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, default=datetime.utcnow)  # retry backoff
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_ingest_jobs_claim", "state", "priority", "available_at"),)
+
+
+class MaintenanceRun(Base):
+    """Run history of scheduled maintenance jobs (backend.maintenance.jobs)."""
+    __tablename__ = "maintenance_runs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job = Column(String(64))
+    started_at = Column(DateTime, default=datetime.utcnow)
+    duration_s = Column(Float)
+    cpu_s = Column(Float)
+    status = Column(String(20))  # ok, error
+    detail = Column(JSON, default={})
+
+    __table_args__ = (Index("ix_maintenance_runs_job_started", "job", "started_at"),)
+
+
+class FeedVersion(Base):
+    """Change counter per UI feed (timeline, actions), bumped by the ingestion writer."""
+    __tablename__ = "feed_versions"
+    name = Column(String(32), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
+class FeedTombstone(Base):
+    """A row deleted from a feed, so ?since= deltas can tell clients to drop it."""
+    __tablename__ = "feed_tombstones"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    feed = Column(String(32))
+    item_id = Column(String(36))
+    change_seq = Column(Integer)
+
+    __table_args__ = (Index("ix_feed_tombstones_feed_seq", "feed", "change_seq", "item_id"),)
+
+
 # Ensure directory exists for DB
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
@@ -98,14 +254,95 @@ engine = create_engine(
 @event.listens_for(engine, "connect")
 def set_sqlite_pragmas(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
+    # Only takes effect on a new database (or after VACUUM); lets maintenance return free pages incrementally
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL;")
     cursor.execute("PRAGMA journal_mode=WAL;")
     cursor.execute("PRAGMA synchronous=NORMAL;")
     cursor.execute("PRAGMA busy_timeout=30000;")
     cursor.close()
 
 
+# --------------------
+# Metrics: statement latency by kind, commits, pool usage (plus per-span SQL totals when traced)
+# --------------------
+SQL_SECONDS = REGISTRY.histogram("sql_statement_seconds", "SQLite statement latency by statement kind", ["kind"])
+SQL_COMMITS = REGISTRY.counter("sql_commits_total", "Committed transactions")
+SQL_CONNECTIONS = REGISTRY.gauge("sql_connections_checked_out", "Pooled connections currently in use")
+_SQL_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "WITH"}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_t0", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _sql_done(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_t0")
+    if starts:
+        dt = time.perf_counter() - starts.pop()
+        kind = statement.lstrip()[:7].split(None, 1)[0].upper() if statement.strip() else ""
+        SQL_SECONDS.observe(dt, kind=kind if kind in _SQL_KINDS else "other")
+        if tracing.active():
+            tracing.add("sql_statements")
+            tracing.add("sql_s", dt)
+
+
+@event.listens_for(engine, "handle_error")
+def _sql_error(context):
+    if context.connection is not None:
+        context.connection.info.pop("query_t0", None)
+
+
+@event.listens_for(engine, "commit")
+def _sql_commit(conn):
+    SQL_COMMITS.inc()
+
+
+@REGISTRY.collector
+def _pool_usage():
+    SQL_CONNECTIONS.set(engine.pool.checkedout())
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _migrate_columns()
+    _migrate_indexes()
+
+
+def _migrate_columns():
+    """Add columns declared after a table was created (ALTER TABLE ADD COLUMN). Idempotent."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f" NOT NULL DEFAULT {default!r}" if not column.nullable else f" DEFAULT {default!r}"
+                conn.exec_driver_sql(ddl)
+                print(f"Added column {table.name}.{column.name}")
+
+
+def _migrate_indexes():
+    """
+    create_all() only creates indexes together with new tables, so databases
+    created before an index was declared get it here. Idempotent.
+    """
+    created = []
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn, checkfirst=True)
+                    created.append(index.name)
+        if created:
+            conn.exec_driver_sql("ANALYZE")  # let the planner see the new indexes
+    if created:
+        print(f"Created missing indexes: {', '.join(created)}")
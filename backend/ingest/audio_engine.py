@@ -0,0 +1,216 @@
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from backend.config import (
+    WHISPER_PROCESSES,
+    WHISPER_FILE_TIMEOUT_S,
+    AUDIO_SEGMENT_MIN_S,
+    AUDIO_SEGMENT_MAX_S,
+    AUDIO_MIN_SILENCE_S,
+)
+from backend.utils.whisper_client import transcribe_file_cached
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_FRAME_S = 0.03  # energy analysis window
+_READ_BLOCK_S = 10.0  # stream the file in blocks so memory stays flat
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class Segment(NamedTuple):
+    index: int
+    start_s: float
+    end_s: float
+    text: str
+
+
+def _whisper_pool() -> ThreadPoolExecutor:
+    """Each task drives one whisper.cpp process, so this bounds concurrent processes."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, WHISPER_PROCESSES), thread_name_prefix="whisper")
+        return _pool
+
+
+def _is_pcm_wav(path: str) -> bool:
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getcomptype() == "NONE" and w.getsampwidth() in (1, 2, 4)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def _to_wav(path: str, tmpdir: str) -> Optional[str]:
+    """PCM WAV as-is; anything else via ffmpeg (16 kHz mono) when it is installed."""
+    if _is_pcm_wav(path):
+        return path
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    out = os.path.join(tmpdir, "converted.wav")
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-i", path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", out],
+            check=True, timeout=600, capture_output=True,
+        )
+        return out
+    except Exception as e:
+        logger.warning(f"ffmpeg conversion failed for {path}: {e}")
+        return None
+
+
+def audio_duration_s(path: str) -> Optional[float]:
+    """Duration for PCM WAV files; None when it cannot be read cheaply."""
+    if not _is_pcm_wav(path):
+        return None
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def _frame_energy(path: str) -> Tuple[np.ndarray, int, int]:
+    """RMS per analysis frame. Returns (rms, samples_per_frame, framerate)."""
+    with wave.open(path, "rb") as w:
+        rate, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+        per_frame = max(1, int(rate * _FRAME_S))
+        block = per_frame * max(1, int(_READ_BLOCK_S / _FRAME_S))
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+        scale = float(2 ** (8 * width - 1))
+
+        energies: List[np.ndarray] = []
+        while True:
+            raw = w.readframes(block)
+            if not raw:
+                break
+            x = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+            if width == 1:
+                x -= 128.0
+            x = x.reshape(-1, channels).mean(axis=1) / scale
+            n = len(x) // per_frame
+            if n:
+                energies.append(np.sqrt((x[: n * per_frame].reshape(n, per_frame) ** 2).mean(axis=1)))
+    rms = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    return rms, per_frame, rate
+
+
+def find_cut_frames(rms: np.ndarray) -> List[int]:
+    """
+    Cut points (in analysis frames). Each segment is AUDIO_SEGMENT_MIN_S to
+    AUDIO_SEGMENT_MAX_S long and ends in the middle of the longest silence
+    in that window, or hard-cuts at the max when there is no silence.
+    """
+    total = len(rms)
+    min_f = int(AUDIO_SEGMENT_MIN_S / _FRAME_S)
+    max_f = int(AUDIO_SEGMENT_MAX_S / _FRAME_S)
+    if total <= max_f:
+        return []
+
+    # Silence threshold relative to this recording's noise floor and speech level
+    floor, speech = float(np.percentile(rms, 5)), float(np.percentile(rms, 95))
+    threshold = max(floor + 0.1 * (speech - floor), 1e-4)
+    silent = np.concatenate(([0], (rms <= threshold).astype(np.int8), [0]))
+    edges = np.diff(silent)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_run = max(1, int(math.ceil(AUDIO_MIN_SILENCE_S / _FRAME_S)))
+    runs = [(s, e) for s, e in zip(starts, ends) if e - s >= min_run]
+
+    cuts = []
+    cursor = 0
+    while total - cursor > max_f:
+        lo, hi = cursor + min_f, cursor + max_f
+        best = None
+        for s, e in runs:
+            mid = (s + e) // 2
+            if lo <= mid <= hi and (best is None or e - s > best[1] - best[0]):
+                best = (s, e)
+        cut = (best[0] + best[1]) // 2 if best else hi
+        cuts.append(cut)
+        cursor = cut
+    return cuts
+
+
+def split_on_silence(wav_path: str, tmpdir: str) -> List[Tuple[float, float, str]]:
+    """Write segment WAVs into tmpdir. Returns [(start_s, end_s, path)]."""
+    rms, per_frame, rate = _frame_energy(wav_path)
+    cuts = find_cut_frames(rms)
+
+    with wave.open(wav_path, "rb") as src:
+        params = src.getparams()
+        total_samples = src.getnframes()
+        bounds = [0] + [int(c) * per_frame for c in cuts] + [total_samples]
+        if len(bounds) == 2:
+            return [(0.0, total_samples / float(rate), wav_path)]
+
+        segments = []
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            if end <= start:
+                continue
+            src.setpos(start)
+            out = os.path.join(tmpdir, f"seg_{i:05d}.wav")
+            with wave.open(out, "wb") as dst:
+                dst.setparams(params)
+                dst.writeframes(src.readframes(end - start))
+            segments.append((start / float(rate), end / float(rate), out))
+    return segments
+
+
+def iter_transcript_segments(audio_path: str) -> Iterator[Segment]:
+    """
+    Split on silence and transcribe segments on the bounded whisper pool,
+    yielding them in order as soon as each is ready (partial transcripts).
+    Segments are cached by audio hash, so re-ingesting a recording, or one
+    that shares segments with another, skips whisper for the known parts.
+    """
+    t0 = time.time()
+    with tempfile.TemporaryDirectory(prefix="ai_minds_audio_") as tmpdir:
+        wav = _to_wav(audio_path, tmpdir)
+        if wav is None:
+            # Unknown container and no ffmpeg: one whisper run over the whole file, still on the bounded pool
+            future = _whisper_pool().submit(transcribe_file_cached, audio_path, None, WHISPER_FILE_TIMEOUT_S)
+            yield Segment(0, 0.0, 0.0, future.result())
+            return
+
+        segments = split_on_silence(wav, tmpdir)
+        logger.info(f"[STAGE] audio_split segments={len(segments)} dt={time.time()-t0:.2f}s")
+
+        pool = _whisper_pool()
+        window = max(2, WHISPER_PROCESSES * 2)
+        todo = deque(enumerate(segments))
+        pending: Deque = deque()
+        while todo or pending:
+            while todo and len(pending) < window:
+                i, (start_s, end_s, path) = todo.popleft()
+                pending.append((i, start_s, end_s, pool.submit(transcribe_file_cached, path)))
+            i, start_s, end_s, future = pending.popleft()
+            text = future.result()
+            logger.info(f"[STAGE] audio_segment {i + 1}/{len(segments)} {start_s:.0f}-{end_s:.0f}s dt={time.time()-t0:.2f}s")
+            yield Segment(i, start_s, end_s, text.strip())
+
+
+def transcribe_segmented(audio_path: str) -> str:
+    if not os.path.exists(audio_path):
+        logger.error(f"File not found: {audio_path}")
+        return ""
+    try:
+        return "\n".join(seg.text for seg in iter_transcript_segments(audio_path) if seg.text).strip()
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Whisper command failed: {e.stderr.decode('utf-8', 'ignore') if e.stderr else e}")
+        return ""
+    except Exception as e:
+        logger.error(f"Unexpected error in whisper transcription: {e}")
+        return ""
@@ -0,0 +1,356 @@
+"""
+Bulk backfill: ingest an existing directory tree (years of notes, a photo
+archive, a folder of recordings) without going through the watcher.
+
+    python -m backend.ingest.backfill /path/to/archive [--batch-size 32] [--restart]
+
+Files are walked in a stable order and processed in rounds of
+BACKFILL_BATCH_SIZE: parse (process/thread pools), one placeholder commit,
+metadata, batched /api/embed requests, one final commit + vector-store save.
+After each round a checkpoint records the last written path, so an
+interrupted run resumes where it stopped. Fingerprints make re-running over
+already ingested files cheap either way.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.config import (
+    WATCH_DIRS,
+    BACKFILL_BATCH_SIZE,
+    BACKFILL_EMBED_BATCH,
+    BACKFILL_CHECKPOINT_DIR,
+    INGEST_PARSE_PROCESSES,
+    INGEST_IO_WORKERS,
+    INGEST_MODEL_WORKERS,
+)
+from backend.database import SessionLocal, init_db
+from backend.ingest.fingerprints import fingerprints
+from backend.ingest.parsers import parse_job, is_incremental_pdf, iter_pdf_jobs, is_incremental_audio, iter_audio_jobs
+from backend.ingest.processor import IngestionProcessor
+from backend.memory.vector_store import claim_store, StoreInUse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Used when a file is not inside one of the WATCH_DIRS folders
+EXTENSION_TYPES = {
+    ".txt": "text", ".md": "text",
+    ".pdf": "docs",
+    ".png": "images", ".jpg": "images", ".jpeg": "images", ".webp": "images", ".bmp": "images",
+    ".wav": "audio", ".mp3": "audio", ".m4a": "audio", ".ogg": "audio", ".flac": "audio",
+}
+
+_IO_BOUND_SOURCES = {"images", "audio"}
+_CHARS_PER_TOKEN = 4  # rough estimate for throughput reporting
+
+
+def detect_source_type(path: Path) -> Optional[str]:
+    resolved = path.resolve()
+    for type_name, folder in WATCH_DIRS.items():
+        try:
+            resolved.relative_to(Path(folder).resolve())
+            return type_name
+        except ValueError:
+            continue
+    return EXTENSION_TYPES.get(path.suffix.lower())
+
+
+def _is_ignored(name: str) -> bool:
+    return name.startswith(".") or name.startswith("~$") or name.endswith(".tmp")
+
+
+def walk_files(root: Path, after: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], Path, str]]:
+    """
+    Supported files under root as (relative parts, path, source_type), in
+    lexicographic order of their path components. Everything at or before
+    `after` is skipped, and whole directories before it are never listed.
+    """
+    def walk(directory: Path, prefix: Tuple[str, ...]):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Cannot list {directory}: {e}")
+            return
+        for entry in entries:
+            if _is_ignored(entry.name):
+                continue
+            parts = prefix + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if after and parts < after[: len(parts)]:
+                    continue  # finished subtree
+                yield from walk(Path(entry.path), parts)
+            elif entry.is_file():
+                if after and parts <= after:
+                    continue
+                source_type = detect_source_type(Path(entry.path))
+                if source_type:
+                    yield parts, Path(entry.path), source_type
+
+    yield from walk(root, ())
+
+
+# --------------------
+# Checkpoint
+# --------------------
+class Checkpoint:
+    """Per-root JSON file: last written path and running totals."""
+
+    def __init__(self, root: Path, directory: Path = BACKFILL_CHECKPOINT_DIR):
+        key = hashlib.sha1(str(root.resolve()).encode("utf-8")).hexdigest()[:16]
+        self.path = Path(directory) / f"{key}.json"
+        self.data: Dict[str, Any] = {"root": str(root.resolve()), "cursor": [], "done": 0, "complete": False}
+
+    def load(self) -> "Checkpoint":
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+        if self.data.get("complete"):
+            # A finished run starts over; fingerprints skip what is already ingested
+            self.data.update(cursor=[], done=0, complete=False)
+        return self
+
+    @property
+    def cursor(self) -> Tuple[str, ...]:
+        return tuple(self.data.get("cursor") or ())
+
+    def advance(self, cursor: Tuple[str, ...], done: int) -> None:
+        self.data["cursor"] = list(cursor)
+        self.data["done"] = self.data.get("done", 0) + done
+        self.save()
+
+    def finish(self) -> None:
+        self.data["complete"] = True
+        self.save()
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**self.data, "updated_at": time.time()}, f)
+        os.replace(tmp, self.path)
+
+
+# --------------------
+# Throughput
+# --------------------
+class StageMeter:
+    """Busy time, files and (estimated) tokens for one stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.files = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def add(self, files: int, seconds: float, chars: int = 0) -> None:
+        self.files += files
+        self.seconds += seconds
+        self.tokens += chars // _CHARS_PER_TOKEN
+
+    def describe(self) -> str:
+        if not self.files or not self.seconds:
+            return f"{self.name} -"
+        out = f"{self.name} {self.files / self.seconds:.1f} files/s"
+        if self.tokens:
+            out += f" {self.tokens / self.seconds:.0f} tok/s"
+        return out
+
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+# --------------------
+# Backfill
+# --------------------
+class Backfill:
+    STAGES = ("scan", "parse", "insert", "metadata", "embed", "write")
+
+    def __init__(self, root: Path, batch_size: int = BACKFILL_BATCH_SIZE, out=sys.stdout):
+        self.root = Path(root)
+        self.batch_size = max(1, batch_size)
+        self.out = out
+        self.processor = IngestionProcessor()
+        self.checkpoint = Checkpoint(self.root)
+        self.meters = {name: StageMeter(name) for name in self.STAGES}
+        self.counters = {"skipped": 0, "duplicates": 0, "stored": 0, "failed": 0}
+
+    def run(self, restart: bool = False) -> Dict[str, Any]:
+        init_db()
+        if restart:
+            self.checkpoint.clear()
+        self.checkpoint.load()
+        after = self.checkpoint.cursor
+        if after:
+            self._print(f"Resuming after {os.path.join(*after)} ({self.checkpoint.data['done']} files done earlier)")
+
+        total = sum(1 for _ in walk_files(self.root, after))
+        self._print(f"{total} files to backfill under {self.root}")
+
+        t_start = time.time()
+        done = 0
+        cpu_pool = ProcessPoolExecutor(max_workers=INGEST_PARSE_PROCESSES) if INGEST_PARSE_PROCESSES > 0 else None
+        io_pool = ThreadPoolExecutor(max_workers=max(1, INGEST_IO_WORKERS), thread_name_prefix="backfill-io")
+        try:
+            batch: List[Tuple[Tuple[str, ...], Path, str]] = []
+            for item in walk_files(self.root, after):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    done += self._run_batch(batch, cpu_pool or io_pool, io_pool)
+                    self._report(done, total, t_start)
+                    batch = []
+            if batch:
+                done += self._run_batch(batch, cpu_pool or io_pool, io_pool)
+                self._report(done, total, t_start)
+        finally:
+            io_pool.shutdown(wait=True)
+            if cpu_pool is not None:
+                cpu_pool.shutdown(wait=True)
+
+        self.checkpoint.finish()
+        elapsed = time.time() - t_start
+        summary = {
+            "files": done,
+            "elapsed_s": round(elapsed, 2),
+            "files_per_s": round(done / elapsed, 2) if elapsed else 0.0,
+            **self.counters,
+            "stages": {m.name: {"files": m.files, "tokens": m.tokens, "busy_s": round(m.seconds, 2)} for m in self.meters.values()},
+        }
+        self._print(f"Backfill complete: {json.dumps(summary)}")
+        return summary
+
+    def _run_batch(self, batch: List[Tuple[Tuple[str, ...], Path, str]], cpu_pool, io_pool) -> int:
+        # Scan: fingerprint check (stat + hash) before anything is parsed
+        t = time.time()
+        todo, aliases = [], []
+        for _, path, source_type in batch:
+            skip, fp = fingerprints.check(str(path))
+            if skip:
+                aliases.append(fp)
+            else:
+                todo.append((str(path), source_type, fp))
+        self.counters["skipped"] += len(batch) - len(todo)
+        self.meters["scan"].add(len(batch), time.time() - t)
+
+        # Parse: CPU-bound sources on processes, VLM/whisper-bound ones on threads
+        t = time.time()
+        jobs = self._parse(todo, cpu_pool, io_pool)
+        self.meters["parse"].add(len(todo), time.time() - t, sum(len(j["content"] or "") for j in jobs))
+
+        session = SessionLocal()
+        try:
+            if any(aliases):
+                fingerprints.record(session, aliases)
+                session.commit()
+
+            t = time.time()
+            accepted = self.processor.insert_minimal_batch(session, jobs)
+            self.counters["duplicates"] += len(jobs) - len(accepted)
+            self.meters["insert"].add(len(jobs), time.time() - t)
+
+            t = time.time()
+            self.processor.extract_metadata_batch(accepted, workers=INGEST_MODEL_WORKERS)
+            self.meters["metadata"].add(
+                len(accepted), time.time() - t,
+                sum(len(j["content"] or j["vision_caption"] or "") for j in accepted),
+            )
+
+            t = time.time()
+            self.processor.embed_batch(accepted, batch_size=BACKFILL_EMBED_BATCH)
+            embedded = [j for j in accepted if not j.get("error")]
+            self.meters["embed"].add(
+                len(embedded), time.time() - t, sum(len(self.processor.embedding_text(j)) for j in embedded)
+            )
+
+            t = time.time()
+            self.processor.store_enriched_batch(session, accepted)
+            self.meters["write"].add(len(accepted), time.time() - t)
+        finally:
+            session.close()
+
+        failed = sum(1 for j in accepted if j.get("error"))
+        self.counters["failed"] += failed + (len(todo) - len({j["path"] for j in jobs}))
+        self.counters["stored"] += len(accepted) - failed
+
+        self.checkpoint.advance(batch[-1][0], len(batch))
+        return len(batch)
+
+    def _parse(self, todo: List[Tuple[str, str, Any]], cpu_pool, io_pool) -> List[Dict[str, Any]]:
+        jobs: List[Dict[str, Any]] = []
+        futures = []
+        for path, source_type, fp in todo:
+            if source_type == "docs" and is_incremental_pdf(path):
+                futures.append(io_pool.submit(list, iter_pdf_jobs(path, source_type, fp, cpu_pool)))
+            elif source_type == "audio" and is_incremental_audio(path):
+                futures.append(io_pool.submit(list, iter_audio_jobs(path, source_type, fp)))
+            else:
+                pool = io_pool if source_type in _IO_BOUND_SOURCES else cpu_pool
+                futures.append(pool.submit(parse_job, path, source_type, fp))
+
+        for (path, _, _), future in zip(todo, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception(f"Parse failed for {path}: {e}")
+                continue
+            if isinstance(result, list):
+                jobs.extend(result)
+            elif result is not None:
+                jobs.append(result)
+        return jobs
+
+    def _report(self, done: int, total: int, t_start: float) -> None:
+        elapsed = time.time() - t_start
+        rate = done / elapsed if elapsed else 0.0
+        eta = _format_eta((total - done) / rate) if rate else "?"
+        pct = 100.0 * done / total if total else 100.0
+        stages = " | ".join(m.describe() for m in self.meters.values())
+        self._print(f"[backfill] {done}/{total} ({pct:.1f}%) {rate:.1f} files/s ETA {eta} | {stages}")
+
+    def _print(self, line: str) -> None:
+        print(line, file=self.out, flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-ingest an existing directory tree.")
+    parser.add_argument("root", help="directory to backfill")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="files per round")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and walk from the start")
+    parser.add_argument("--verbose", action="store_true", help="keep per-file stage logs")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root)
+    if not root.is_dir():
+        parser.error(f"not a directory: {root}")
+    if not args.verbose:
+        logging.getLogger("backend").setLevel(logging.WARNING)
+    try:
+        claim_store()
+    except StoreInUse as e:
+        print(f"{e}. Stop the API first (or drop the files into the inbox folders / POST /ingest).", file=sys.stderr)
+        return 2
+
+    Backfill(root, batch_size=args.batch_size).run(restart=args.restart)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
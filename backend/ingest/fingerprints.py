@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.database import SessionLocal, FileFingerprint
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def normalize_path(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def stat_fingerprint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"path": normalize_path(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Persistent (path, size, mtime, raw-bytes hash) index of completed files.
+
+    Completed rows are cached in memory, so an unchanged file is rejected with
+    one os.stat() and a dict lookup, and a byte-identical copy with one hash
+    pass. Nothing is parsed, captioned or transcribed in either case. Writes
+    go through record(), which the single DB writer calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_path: Optional[Dict[str, Tuple[int, int, str]]] = None
+        self._by_hash: Dict[str, Optional[str]] = {}  # raw_hash -> event_id
+
+    def _ensure_loaded(self) -> None:
+        if self._by_path is not None:
+            return
+        session = SessionLocal()
+        try:
+            rows = session.query(
+                FileFingerprint.path, FileFingerprint.size, FileFingerprint.mtime_ns,
+                FileFingerprint.raw_hash, FileFingerprint.event_id,
+            ).filter(FileFingerprint.status == "done").all()
+        finally:
+            session.close()
+
+        by_path, by_hash = {}, {}
+        for path, size, mtime_ns, raw_hash, event_id in rows:
+            by_path[path] = (size, mtime_ns, raw_hash)
+            by_hash.setdefault(raw_hash, event_id)
+        self._by_path, self._by_hash = by_path, by_hash
+        logger.info(f"Fingerprint index loaded: {len(by_path)} files")
+
+    def is_current(self, path: str) -> bool:
+        """Stat-only: ingested and unchanged since (no hashing). Used by the startup reconciliation scan."""
+        fp = stat_fingerprint(path)
+        if fp is None:
+            return False
+        with self._lock:
+            self._ensure_loaded()
+            known = self._by_path.get(fp["path"])
+        return bool(known) and known[0] == fp["size"] and known[1] == fp["mtime_ns"]
+
+    def check(self, path: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Returns (skip, fingerprint). skip=True when the file is unchanged since
+        it was ingested, or its bytes match an already ingested file. The
+        fingerprint (with raw_hash once computed) should travel with the job
+        so the writer can record() it.
+        """
+        fp = stat_fingerprint(path)
+        if fp is None:
+            return False, None  # vanished: let the parse stage log it
+
+        with self._lock:
+            self._ensure_loaded()
+            known = self._by_path.get(fp["path"])
+        if known and known[0] == fp["size"] and known[1] == fp["mtime_ns"]:
+            return True, None  # unchanged, nothing to record
+
+        try:
+            fp["raw_hash"] = hash_file(path)
+        except OSError:
+            return False, None
+
+        with self._lock:
+            if fp["raw_hash"] in self._by_hash:
+                fp["event_id"] = self._by_hash[fp["raw_hash"]]
+                return True, fp  # same bytes under another path / touched mtime
+        return False, fp
+
+    def record(self, session, fingerprints: List[Dict[str, Any]], status: str = "done") -> None:
+        """Upsert fingerprints (caller commits) and refresh the in-memory cache."""
+        rows = []
+        for fp in fingerprints:
+            if not fp or not fp.get("raw_hash"):
+                continue
+            rows.append({
+                "path": fp["path"],
+                "size": fp["size"],
+                "mtime_ns": fp["mtime_ns"],
+                "raw_hash": fp["raw_hash"],
+                "status": status,
+                "event_id": fp.get("event_id"),
+                "updated_at": datetime.utcnow(),
+            })
+        if not rows:
+            return
+
+        stmt = sqlite_insert(FileFingerprint).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FileFingerprint.path],
+            set_={c: stmt.excluded[c] for c in ("size", "mtime_ns", "raw_hash", "status", "event_id", "updated_at")},
+        )
+        session.execute(stmt)
+
+        if status != "done":
+            return
+        with self._lock:
+            self._ensure_loaded()
+            for row in rows:
+                self._by_path[row["path"]] = (row["size"], row["mtime_ns"], row["raw_hash"])
+                self._by_hash.setdefault(row["raw_hash"], row["event_id"])
+
+
+# Singleton shared by the pipeline and inline processing
+fingerprints = FingerprintIndex()
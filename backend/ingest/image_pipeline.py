@@ -0,0 +1,123 @@
+import io
+import logging
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import VLM_MAX_IMAGE_SIDE, VLM_JPEG_QUALITY, PHASH_MAX_DISTANCE
+from backend.database import SessionLocal, ImageCaption
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0, :] = np.sqrt(1.0 / n)
+    return m
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit DCT perceptual hash (low-frequency 8x8 block vs. its median)."""
+    gray = img.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    bits = low > np.median(low[1:])  # DC term excluded from the threshold
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def prepare_image(file_path: str) -> Optional[Tuple[bytes, int]]:
+    """
+    Decode any Pillow-readable format (.jfif, .png, .webp, ...), apply EXIF
+    orientation, downscale to VLM_MAX_IMAGE_SIDE and re-encode as JPEG.
+    Returns (jpeg_bytes, phash) or None if the file cannot be decoded.
+    """
+    try:
+        with Image.open(file_path) as src:
+            img = ImageOps.exif_transpose(src)
+            if img.mode not in ("RGB", "L"):
+                # Flatten transparency onto white so screenshots keep their contrast
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.split()[-1])
+            else:
+                img = img.convert("RGB")
+            img.thumbnail((VLM_MAX_IMAGE_SIDE, VLM_MAX_IMAGE_SIDE), Image.LANCZOS)
+
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=VLM_JPEG_QUALITY, optimize=True)
+            return buf.getvalue(), phash(img)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed for {file_path}, sending original: {e}")
+        return None
+
+
+class CaptionCache:
+    """
+    Perceptual-hash -> caption cache. Lookups are in memory (a Hamming scan
+    over a NumPy array of hashes); persist() is called from the DB writer.
+    """
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._hashes: Optional[np.ndarray] = None  # uint64
+        self._captions: List[str] = []
+
+    def _ensure_loaded(self) -> None:
+        if self._hashes is not None:
+            return
+        session = SessionLocal()
+        try:
+            rows = session.query(ImageCaption.phash, ImageCaption.caption).all()
+        finally:
+            session.close()
+        self._hashes = np.array([int(h, 16) for h, _ in rows], dtype=np.uint64)
+        self._captions = [c for _, c in rows]
+
+    def lookup(self, value: int) -> Optional[str]:
+        with self._lock:
+            self._ensure_loaded()
+            if not len(self._hashes):
+                return None
+            diff = np.bitwise_xor(self._hashes, np.uint64(value))
+            dist = np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+            best = int(dist.argmin())
+            if dist[best] <= self.max_distance:
+                return self._captions[best]
+            return None
+
+    def remember(self, value: int, caption: str) -> None:
+        """Make a fresh caption visible to lookups immediately (before it is persisted)."""
+        if not caption:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._hashes = np.append(self._hashes, np.uint64(value))
+            self._captions.append(caption)
+
+    def persist(self, session, entries: List[Tuple[str, str]]) -> None:
+        """Insert (phash_hex, caption) rows; caller commits."""
+        rows = [{"phash": h, "caption": c, "created_at": datetime.utcnow()} for h, c in entries if h and c]
+        if rows:
+            session.execute(sqlite_insert(ImageCaption).values(rows).on_conflict_do_nothing())
+
+
+# Singleton shared by parse threads and the writer
+caption_cache = CaptionCache()
@@ -0,0 +1,203 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import INGEST_JOB_MAX_ATTEMPTS, INGEST_JOB_RETRY_BACKOFF_S
+from backend.database import SessionLocal, IngestJob
+from backend.ingest.fingerprints import normalize_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pipeline outcomes that finish a job
+_DONE_OUTCOMES = {"stored", "duplicates", "skipped"}
+
+
+class JobQueue:
+    """
+    SQLite-backed ingest queue (table ingest_jobs), so queued and in-flight
+    files survive a crash or restart.
+
+        enqueue -> pending --claim--> running --complete--> done
+                                         |  failure: pending again after a
+                                         |  backoff, "failed" after
+                                         +  INGEST_JOB_MAX_ATTEMPTS
+
+    Claims take a whole batch in one UPDATE ... RETURNING, and completions
+    are applied in one statement per outcome by the pipeline's DB writer.
+    """
+
+    def __init__(self):
+        self.wakeup = threading.Event()  # set on enqueue so the feeder does not poll
+
+    def enqueue(self, path: str, source_type: str, priority: int = 0) -> str:
+        return self.enqueue_many([(path, source_type)], priority=priority)[0]
+
+    def enqueue_many(self, items: Iterable[Tuple[str, str]], priority: int = 0) -> List[str]:
+        """
+        Upsert pending jobs; returns the normalized paths. A file already
+        pending keeps its place (with the higher priority); a running one is
+        left alone, since the fingerprint check will see the new bytes.
+        """
+        now = datetime.utcnow()
+        rows: Dict[str, Dict] = {}
+        for path, source_type in items:
+            norm = normalize_path(path)
+            rows[norm] = {
+                "path": norm, "source_type": source_type, "state": "pending", "priority": priority,
+                "attempts": 0, "last_error": None, "available_at": now, "created_at": now, "updated_at": now,
+            }
+        if not rows:
+            return []
+
+        session = SessionLocal()
+        try:
+            stmt = sqlite_insert(IngestJob).values(list(rows.values()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[IngestJob.path],
+                set_={
+                    "source_type": stmt.excluded.source_type,
+                    "state": "pending",
+                    "priority": func.max(IngestJob.priority, stmt.excluded.priority),
+                    "attempts": 0,
+                    "last_error": None,
+                    "available_at": stmt.excluded.available_at,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+                where=IngestJob.state != "running",
+            )
+            session.execute(stmt)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self.wakeup.set()
+        return list(rows)
+
+    def claim(self, limit: int, source_types: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """
+        Move up to `limit` due jobs to running, highest priority first,
+        optionally only for some source types. Returns [(path, source_type)].
+        """
+        if limit <= 0 or source_types == []:
+            return []
+        now = datetime.utcnow()
+        session = SessionLocal()
+        try:
+            due = session.query(IngestJob.path).filter(IngestJob.state == "pending", IngestJob.available_at <= now)
+            if source_types is not None:
+                due = due.filter(IngestJob.source_type.in_(source_types))
+            due = (
+                due.order_by(IngestJob.priority.desc(), IngestJob.created_at)
+                .limit(limit)
+                .scalar_subquery()
+            )
+            stmt = (
+                update(IngestJob)
+                .where(IngestJob.path.in_(due), IngestJob.state == "pending")
+                .values(state="running", attempts=IngestJob.attempts + 1, updated_at=now)
+                .returning(IngestJob.path, IngestJob.source_type, IngestJob.priority)
+            )
+            rows = session.execute(stmt).all()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        rows.sort(key=lambda r: -r[2])  # RETURNING order is unspecified
+        return [(path, source_type) for path, source_type, _ in rows]
+
+    def complete(self, session, results: List[Tuple[str, str, Optional[str]]]) -> None:
+        """Apply pipeline outcomes [(path, outcome, error)]; the caller commits."""
+        now = datetime.utcnow()
+        done = sorted({normalize_path(p) for p, outcome, _ in results if outcome in _DONE_OUTCOMES})
+        if done:
+            session.execute(
+                update(IngestJob)
+                .where(IngestJob.path.in_(done), IngestJob.state == "running")
+                .values(state="done", last_error=None, updated_at=now)
+            )
+
+        for path, outcome, error in results:
+            if outcome in _DONE_OUTCOMES:
+                continue
+            job = session.get(IngestJob, normalize_path(path))
+            if job is None or job.state != "running":
+                continue
+            job.last_error = (error or outcome)[:2000]
+            job.updated_at = now
+            if job.attempts >= INGEST_JOB_MAX_ATTEMPTS:
+                job.state = "failed"
+                logger.warning(f"Ingest job failed after {job.attempts} attempts: {job.path}")
+            else:
+                job.state = "pending"
+                job.available_at = now + timedelta(seconds=INGEST_JOB_RETRY_BACKOFF_S * 2 ** (job.attempts - 1))
+
+    def report(self, results: List[Tuple[str, str, Optional[str]]]) -> None:
+        """complete() in its own session, for callers outside the DB writer."""
+        session = SessionLocal()
+        try:
+            self.complete(session, results)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def release(self, paths: List[str], delay_s: float = 0.0) -> None:
+        """Give claimed jobs back (not a failure: the attempt is not counted)."""
+        if not paths:
+            return
+        now = datetime.utcnow()
+        session = SessionLocal()
+        try:
+            session.execute(
+                update(IngestJob)
+                .where(IngestJob.path.in_([normalize_path(p) for p in paths]), IngestJob.state == "running")
+                .values(
+                    state="pending",
+                    attempts=IngestJob.attempts - 1,
+                    available_at=now + timedelta(seconds=delay_s),
+                    updated_at=now,
+                )
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def recover(self) -> int:
+        """Jobs left running by a crash go back to pending. Call once, before any claim."""
+        session = SessionLocal()
+        try:
+            n = session.execute(
+                update(IngestJob).where(IngestJob.state == "running").values(state="pending", updated_at=datetime.utcnow())
+            ).rowcount
+            session.commit()
+        finally:
+            session.close()
+        if n:
+            logger.info(f"Recovered {n} interrupted ingest jobs.")
+        return n
+
+    def stats(self) -> Dict[str, int]:
+        session = SessionLocal()
+        try:
+            counts = dict(session.query(IngestJob.state, func.count()).group_by(IngestJob.state).all())
+        finally:
+            session.close()
+        return {state: counts.get(state, 0) for state in ("pending", "running", "done", "failed")}
+
+
+# Singleton shared by the watcher and the pipeline writer
+job_queue = JobQueue()
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Used for a source_type missing from the lane config
+_DEFAULT_LANE = {"weight": 1, "concurrency": 1, "max_queue": 64}
+
+
+class Lane:
+    def __init__(self, name: str, weight: float, concurrency: Optional[int], max_queue: int):
+        self.name = name
+        self.stride = 1.0 / max(weight, 1e-6)
+        self.concurrency = concurrency  # None = unlimited
+        self.max_queue = max_queue
+        self.items: Deque[Any] = deque()
+        self.active = 0
+        self.pass_ = 0.0  # virtual finish time (stride scheduling)
+        self.served = 0
+
+    def ready(self) -> bool:
+        return bool(self.items) and (self.concurrency is None or self.active < self.concurrency)
+
+
+class LaneScheduler:
+    """
+    One bounded queue per source_type, dequeued by weighted fair (stride)
+    scheduling: over time each busy lane gets service in proportion to its
+    weight, so a text note is picked within a few turns even when audio has
+    a long backlog. Lanes with a concurrency cap are skipped while that many
+    of their items are active (taken but not yet done()).
+
+    put() blocks or fails when a lane is at max_queue, which is the
+    backpressure signal for whoever is enqueueing.
+    """
+
+    def __init__(self, config: Dict[str, Dict[str, Any]], concurrency: bool = True, max_queue: Optional[int] = None):
+        self._config = config
+        self._use_concurrency = concurrency
+        self._max_queue = max_queue
+        self._lanes: Dict[str, Lane] = {}
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        for name in config:
+            self._lane(name)
+
+    def _lane(self, name: str) -> Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            cfg = {**_DEFAULT_LANE, **self._config.get(name, {})}
+            lane = Lane(
+                name,
+                weight=cfg["weight"],
+                concurrency=cfg["concurrency"] if self._use_concurrency else None,
+                max_queue=self._max_queue or cfg["max_queue"],
+            )
+            self._lanes[name] = lane
+        return lane
+
+    def put(self, name: str, item: Any, block: bool = True, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            lane = self._lane(name)
+            while len(lane.items) >= lane.max_queue:
+                if not block:
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if not lane.items and lane.active == 0:
+                # An idle lane rejoins at the current virtual time: no banked credit
+                lane.pass_ = max(lane.pass_, self._vtime)
+            lane.items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, limit: int = 1, timeout: Optional[float] = None) -> Optional[Tuple[str, List[Any]]]:
+        """
+        Up to `limit` items from the lane with the smallest virtual time among
+        ready lanes. Each item counts as active until done(lane).
+        Returns None on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                ready = [lane for lane in self._lanes.values() if lane.ready()]
+                if ready:
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            lane = min(ready, key=lambda l: l.pass_)
+            n = min(limit, len(lane.items))
+            if lane.concurrency is not None:
+                n = min(n, lane.concurrency - lane.active)
+            items = [lane.items.popleft() for _ in range(n)]
+            lane.active += n
+            lane.served += n
+            self._vtime = lane.pass_
+            lane.pass_ += lane.stride * n
+            self._cond.notify_all()  # queue space freed
+            return lane.name, items
+
+    def done(self, name: str, n: int = 1) -> None:
+        with self._cond:
+            lane = self._lane(name)
+            lane.active = max(0, lane.active - n)
+            self._cond.notify_all()
+
+    def room(self, name: str) -> int:
+        with self._cond:
+            lane = self._lane(name)
+            return max(0, lane.max_queue - len(lane.items))
+
+    def names(self) -> List[str]:
+        with self._cond:
+            return list(self._lanes)
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(len(lane.items) for lane in self._lanes.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                lane.name: {"queued": len(lane.items), "active": lane.active, "served": lane.served}
+                for lane in self._lanes.values()
+            }
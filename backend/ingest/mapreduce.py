@@ -0,0 +1,131 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.config import MODEL_MAIN, METADATA_CHUNK_CHARS, METADATA_MAP_CONCURRENCY
+from backend.utils.llm_client import call_llm_json
+from backend.utils.schemas import SummarySchema
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_ENTITIES = 50
+MAX_TOPICS = 20
+
+
+def chunk_text(text: str, size: int = METADATA_CHUNK_CHARS) -> List[str]:
+    """Split on paragraph, then line, then hard boundaries. Every character lands in a chunk."""
+    chunks: List[str] = []
+    buf = ""
+    for para in text.split("\n\n"):
+        pieces = [para] if len(para) <= size else para.split("\n")
+        for piece in pieces:
+            while len(piece) > size:
+                if buf:
+                    chunks.append(buf)
+                    buf = ""
+                chunks.append(piece[:size])
+                piece = piece[size:]
+            candidate = f"{buf}\n\n{piece}" if buf else piece
+            if len(candidate) > size:
+                chunks.append(buf)
+                buf = piece
+            else:
+                buf = candidate
+    if buf.strip():
+        chunks.append(buf)
+    return [c for c in chunks if c.strip()]
+
+
+def _dedupe(values: List[str], limit: int) -> List[str]:
+    """Case/whitespace-insensitive dedupe, most frequent first, first spelling kept."""
+    counts: Counter = Counter()
+    spelling: Dict[str, str] = {}
+    for v in values:
+        if not isinstance(v, str) or not v.strip():
+            continue
+        key = " ".join(v.lower().split())
+        counts[key] += 1
+        spelling.setdefault(key, v.strip())
+    return [spelling[k] for k, _ in counts.most_common(limit)]
+
+
+def merge_partials(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reduce step for list fields: union + dedupe entities, topics and action items."""
+    actions, seen_tasks = [], set()
+    for p in partials:
+        for action in p.get("action_items", []):
+            key = " ".join(str(action.get("task", "")).lower().split())
+            if key and key not in seen_tasks:
+                seen_tasks.add(key)
+                actions.append(action)
+
+    intents = Counter(p.get("intent", "general") for p in partials)
+    return {
+        "entities": _dedupe([e for p in partials for e in p.get("entities", [])], MAX_ENTITIES),
+        "topics": _dedupe([t for p in partials for t in p.get("topics", [])], MAX_TOPICS),
+        "action_items": actions,
+        "intent": "task" if actions and intents.get("task") else intents.most_common(1)[0][0],
+    }
+
+
+def _summarize(text: str) -> Optional[Dict[str, Any]]:
+    prompt = f"""
+Combine these partial summaries of one document into a single summary in strict JSON.
+Partial summaries:
+{text}
+
+Return ONLY a valid JSON object with these keys:
+- "summary_1line": string
+- "summary_bullets": [string]
+"""
+    return call_llm_json(MODEL_MAIN, prompt, SummarySchema, task="summary_reduce")
+
+
+def reduce_summaries(parts: List[str], pool: ThreadPoolExecutor) -> Optional[Dict[str, Any]]:
+    """
+    Hierarchical reduce: while the partial summaries do not fit in one
+    prompt, summarize groups of them in parallel, then do one final pass.
+    """
+    while len(parts) > 1 and sum(len(p) for p in parts) > METADATA_CHUNK_CHARS:
+        groups = chunk_text("\n\n".join(parts))
+        if len(groups) >= len(parts):
+            break  # no progress possible; final pass sees a truncated view
+        reduced = list(pool.map(_summarize, groups))
+        parts = [
+            "\n".join([r["summary_1line"], *r.get("summary_bullets", [])]) if r else g[:500]
+            for r, g in zip(reduced, groups)
+        ]
+    return _summarize("\n\n".join(parts)[: METADATA_CHUNK_CHARS * 2])
+
+
+def map_reduce_metadata(
+    text: str, extract_chunk: Callable[[str], Optional[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Map: extract metadata per chunk (bounded concurrency). Reduce: merge and
+    dedupe list fields, then summarize the partial summaries. Chunks whose
+    extraction failed are counted in `failed_chunks` rather than dropped silently.
+    """
+    chunks = chunk_text(text)
+    with ThreadPoolExecutor(max_workers=max(1, METADATA_MAP_CONCURRENCY), thread_name_prefix="metadata-map") as pool:
+        partials = list(pool.map(extract_chunk, chunks))
+        ok = [p for p in partials if p]
+        if not ok:
+            return None
+
+        merged = merge_partials(ok)
+        parts = ["\n".join([p.get("summary_1line", ""), *p.get("summary_bullets", [])]) for p in ok]
+        summary = reduce_summaries(parts, pool) if len(ok) > 1 else None
+
+    if summary:
+        merged.update(summary)
+    else:
+        merged["summary_1line"] = ok[0].get("summary_1line", "No summary available.")
+        merged["summary_bullets"] = [p.get("summary_1line", "") for p in ok][:10]
+
+    merged["chunks"] = len(chunks)
+    merged["failed_chunks"] = len(chunks) - len(ok)
+    logger.info(f"Map-reduce metadata: chunks={len(chunks)} failed={merged['failed_chunks']}")
+    return merged
@@ -1,8 +1,12 @@
 import os
-from typing import Dict, Any
-from PyPDF2 import PdfReader
+import hashlib
+import time
+from concurrent.futures import Executor
+from typing import Dict, Any, Iterator, List, Optional
+from backend.ingest.pdf_engine import iter_pdf_pages, iter_pdf_batches, pdf_page_count
+from backend.ingest.audio_engine import audio_duration_s, iter_transcript_segments, transcribe_segmented
+from backend.config import PDF_INCREMENTAL_MIN_PAGES, AUDIO_INCREMENTAL_MIN_S, AUDIO_PART_S
 from backend.utils.llm_client import call_vlm
-from backend.utils.whisper_client import transcribe_audio
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -16,21 +20,29 @@ def parse_text(file_path: str) -> str:
         logger.error(f"Error reading text {file_path}: {e}")
         return ""
 
-def parse_pdf(file_path: str) -> str:
+def parse_pdf(file_path: str, executor: Optional[Executor] = None) -> str:
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            ctx = page.extract_text()
-            if ctx:
-                text += ctx + "\n"
-        return text
+        return "".join(text + "\n" for _, text in iter_pdf_pages(file_path, executor) if text)
     except Exception as e:
         logger.error(f"Error reading PDF {file_path}: {e}")
         return ""
 
 def parse_image(file_path: str) -> Dict[str, Any]:
-    """Returns {vision_caption: str, raw_text: str (OCR optional)}"""
+    """Returns {vision_caption: str, raw_text: str (OCR optional), image_phash: str | None, caption_reused: bool}"""
+    # Imported here: the caption cache reads the DB, and images are parsed in threads of the
+    # main process, never in the parse worker processes that import this module
+    from backend.ingest.image_pipeline import prepare_image, caption_cache
+
+    prepared = prepare_image(file_path)
+    phash_hex = None
+    if prepared is not None:
+        image_bytes, value = prepared
+        phash_hex = f"{value:016x}"
+        cached = caption_cache.lookup(value)
+        if cached:
+            logger.info(f"Near-duplicate image, reusing caption: {file_path}")
+            return {"vision_caption": cached, "raw_text": cached, "image_phash": phash_hex, "caption_reused": True}
+
     prompt = (
         "Analyze this image in detail. "
         "1. Describe the scene or content. "
@@ -38,8 +50,206 @@ def parse_image(file_path: str) -> Dict[str, Any]:
         "3. List key objects or people. "
         "4. Identify any actionable information (dates, tasks)."
     )
-    caption = call_vlm(file_path, prompt)
-    return {"vision_caption": caption, "raw_text": caption} # Treat caption as text for now
+    caption = call_vlm(file_path, prompt, image_bytes=prepared[0] if prepared else None)
+    if prepared is not None:
+        caption_cache.remember(prepared[1], caption)
+    return {"vision_caption": caption, "raw_text": caption, "image_phash": phash_hex, "caption_reused": False} # Treat caption as text for now
 
 def parse_audio(file_path: str) -> str:
-    return transcribe_audio(file_path)
+    return transcribe_segmented(file_path)
+
+def parse_source(file_path: str, source_type: str) -> Dict[str, Any]:
+    """
+    Dispatch to the right parser. Module-level and free of DB/vector imports at
+    import time so it can run inside a worker process (parse_image imports the
+    DB-backed caption cache lazily; images are parsed in threads).
+    Returns {"content": str, "vision_caption": str | None, "new_caption": (phash, caption) | None,
+    "caption_reused": bool}.
+    """
+    content = ""
+    vision_caption = None
+    new_caption = None
+    caption_reused = False
+
+    if source_type in ["text", "docs"]:
+        if file_path.lower().endswith(".pdf"):
+            content = parse_pdf(file_path)
+        else:
+            content = parse_text(file_path)
+
+    elif source_type == "images":
+        result = parse_image(file_path)
+        content = result.get("raw_text", "") or ""
+        vision_caption = result.get("vision_caption", "") or ""
+        caption_reused = bool(result.get("caption_reused"))
+        if result.get("image_phash") and not caption_reused:
+            new_caption = (result["image_phash"], vision_caption)
+
+    elif source_type == "audio":
+        content = parse_audio(file_path)
+
+    return {"content": content, "vision_caption": vision_caption, "new_caption": new_caption, "caption_reused": caption_reused}
+
+
+def parse_job(
+    file_path: str, source_type: str, fingerprint: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    STAGE 1: PARSE. Returns a plain, picklable job dict (no ORM objects) that
+    the later stages enrich, or None if the file is gone or unreadable.
+    `fingerprint` (from the pre-parse check) rides along to be recorded on commit.
+    """
+    t0 = time.time()
+    try:
+        logger.info(f"Processing ({source_type}): {file_path}")
+
+        if not os.path.exists(file_path):
+            logger.warning(f"File vanished before processing: {file_path}")
+            return None
+
+        logger.info("[STAGE] parse_start")
+        parsed = parse_source(file_path, source_type)
+        content = parsed["content"] or ""
+        vision_caption = parsed["vision_caption"]
+
+        logger.info(
+            f"[STAGE] parse_done chars={len(content)} cap_chars={len(vision_caption or '')} dt={time.time()-t0:.2f}s"
+        )
+
+        # If PDF has no extractable text, still store the event (demo-safe)
+        if not content and not vision_caption:
+            logger.warning(f"No content extracted from {file_path}. Storing minimal event anyway.")
+
+        # A reused caption is the earlier image's text: hash the file itself too, or the
+        # new image would be dropped as a duplicate of that one
+        identity = ((fingerprint or {}).get("raw_hash") or file_path) if parsed.get("caption_reused") else None
+        job = _make_job(file_path, source_type, content, vision_caption, fingerprint, t0, identity=identity)
+        job["new_caption"] = parsed.get("new_caption")
+        job["parse_s"] = time.time() - t0  # observed by the writer (parsing may run in a worker process)
+        return job
+
+    except Exception as e:
+        logger.exception(f"Error processing {file_path}: {e}")
+        return None
+
+
+def _make_job(
+    file_path: str,
+    source_type: str,
+    content: str,
+    vision_caption: Optional[str],
+    fingerprint: Optional[Dict[str, Any]],
+    t0: float,
+    extra_metadata: Optional[Dict[str, Any]] = None,
+    identity: Optional[str] = None,
+) -> Dict[str, Any]:
+    """`identity` is mixed into content_hash when the text alone does not identify the event."""
+    raw_data = content + (vision_caption or "")
+    if identity:
+        raw_data = f"{identity}\0{raw_data}"
+    return {
+        "path": file_path,
+        "source_type": source_type,
+        "content": content,
+        "vision_caption": vision_caption,
+        "content_hash": hashlib.sha256(raw_data.encode("utf-8", "ignore")).hexdigest(),
+        "fingerprint": fingerprint,
+        "extra_metadata": extra_metadata or {},
+        "t0": t0,
+    }
+
+
+def is_incremental_pdf(file_path: str) -> bool:
+    return file_path.lower().endswith(".pdf") and pdf_page_count(file_path) >= PDF_INCREMENTAL_MIN_PAGES
+
+
+def iter_pdf_jobs(
+    file_path: str,
+    source_type: str,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Incremental ingest for large PDFs: one job per page batch, yielded as
+    soon as its pages are extracted, so the first pages become searchable
+    while the rest of the document is still being read. The file fingerprint
+    rides on the last part only and is recorded once every part is stored,
+    so an interrupted document is parsed again (its leftover placeholders
+    are replaced, parts already stored are duplicates).
+    Parts are hashed with the path and page range: boilerplate pages shared
+    between documents are not duplicates. Batches without text are skipped.
+    """
+    t0 = time.time()
+    total = pdf_page_count(file_path)
+    prev = None
+    for first, last, text in iter_pdf_batches(file_path, executor):
+        logger.info(f"[STAGE] pdf_batch pages={first}-{last}/{total} chars={len(text)} dt={time.time()-t0:.2f}s")
+        if not text.strip():
+            continue  # no text layer (scans): nothing to remember
+        if prev is not None:
+            yield prev
+        extra = {"document": file_path, "page_start": first, "page_end": last, "page_count": total}
+        prev = _make_job(file_path, source_type, text, None, None, t0, extra, identity=f"{file_path}#pages={first}-{last}")
+    if prev is None:
+        # No text at all: one minimal event for the document, as parse_job would store
+        extra = {"document": file_path, "page_start": 1, "page_end": total, "page_count": total}
+        prev = _make_job(file_path, source_type, "", None, None, t0, extra, identity=file_path)
+    prev["fingerprint"] = fingerprint
+    yield prev
+
+
+def is_incremental_audio(file_path: str) -> bool:
+    duration = audio_duration_s(file_path)
+    return duration is not None and duration >= AUDIO_INCREMENTAL_MIN_S
+
+
+def iter_audio_jobs(
+    file_path: str,
+    source_type: str,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Incremental ingest for long recordings: partial transcripts are grouped
+    into ~AUDIO_PART_S parts and yielded as soon as their segments are
+    transcribed. Like PDFs, the fingerprint rides on the last part only, parts
+    are hashed with the path and time span, and parts without speech are skipped.
+    (`executor` is unused: whisper runs on the audio engine's own pool.)
+    """
+    t0 = time.time()
+    duration = audio_duration_s(file_path)
+    buf: List[str] = []
+    part_start = None
+    prev = None
+
+    def part(start_s: float, end_s: float) -> Optional[Dict[str, Any]]:
+        text = "\n".join(buf)
+        if not text.strip():
+            return None  # silence: nothing to remember
+        extra = {"document": file_path, "start_s": start_s, "end_s": end_s, "duration_s": duration}
+        return _make_job(file_path, source_type, text, None, None, t0, extra, identity=f"{file_path}#t={start_s}-{end_s}")
+
+    for seg in iter_transcript_segments(file_path):
+        if part_start is None:
+            part_start = seg.start_s
+        if seg.text:
+            buf.append(seg.text)
+        if seg.end_s - part_start >= AUDIO_PART_S:
+            job = part(round(part_start, 1), round(seg.end_s, 1))
+            if job is not None:
+                if prev is not None:
+                    yield prev
+                prev = job
+            buf, part_start = [], None
+    if part_start is not None:
+        job = part(round(part_start, 1), duration)
+        if job is not None:
+            if prev is not None:
+                yield prev
+            prev = job
+    if prev is None:
+        # No speech at all: one minimal event for the recording, as parse_job would store
+        extra = {"document": file_path, "start_s": 0.0, "end_s": duration, "duration_s": duration}
+        prev = _make_job(file_path, source_type, "", None, None, t0, extra, identity=file_path)
+    prev["fingerprint"] = fingerprint
+    yield prev
@@ -0,0 +1,93 @@
+import logging
+from collections import deque
+from concurrent.futures import Executor
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from backend.config import PDF_PAGE_RANGE, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_BATCH
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _reader(file_path: str):
+    # PyPDF2 is imported on the first PDF, not when the ingest modules are imported
+    from PyPDF2 import PdfReader
+
+    return PdfReader(file_path)
+
+
+def pdf_page_count(file_path: str) -> int:
+    try:
+        return len(_reader(file_path).pages)
+    except Exception as e:
+        logger.error(f"Error reading PDF {file_path}: {e}")
+        return 0
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract pages [start, end). Module-level so it can run in a worker process."""
+    reader = _reader(file_path)
+    pages = []
+    for i in range(start, min(end, len(reader.pages))):
+        try:
+            pages.append((i, reader.pages[i].extract_text() or ""))
+        except Exception as e:
+            logger.warning(f"Page {i + 1} of {file_path} failed to extract: {e}")
+            pages.append((i, ""))
+    return pages
+
+
+def iter_pdf_pages(
+    file_path: str,
+    executor: Optional[Executor] = None,
+    range_size: int = PDF_PAGE_RANGE,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_index, text) in page order without holding the document's
+    text in memory. Large files fan page ranges out to `executor` (a process
+    pool) with a bounded look-ahead window; small files stay serial.
+    """
+    total = pdf_page_count(file_path)
+    if total == 0:
+        return
+
+    if executor is None or total < PDF_PARALLEL_MIN_PAGES:
+        reader = _reader(file_path)
+        for i, page in enumerate(reader.pages):
+            try:
+                yield i, page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Page {i + 1} of {file_path} failed to extract: {e}")
+                yield i, ""
+        return
+
+    window = max(2, getattr(executor, "_max_workers", 2) * 2)
+    ranges = deque((s, min(s + range_size, total)) for s in range(0, total, range_size))
+    pending: Deque = deque()
+    while ranges or pending:
+        while ranges and len(pending) < window:
+            start, end = ranges.popleft()
+            pending.append(executor.submit(extract_page_range, file_path, start, end))
+        yield from pending.popleft().result()
+
+
+def iter_pdf_batches(
+    file_path: str,
+    executor: Optional[Executor] = None,
+    pages_per_batch: int = PDF_PAGES_PER_BATCH,
+) -> Iterator[Tuple[int, int, str]]:
+    """Yield (first_page, last_page, text) per batch of pages (1-based, inclusive)."""
+    buf: List[str] = []
+    first = None
+    last = 0
+    for i, text in iter_pdf_pages(file_path, executor):
+        if first is None:
+            first = i
+        last = i
+        if text:
+            buf.append(text)
+        if last - first + 1 >= pages_per_batch:
+            yield first + 1, last + 1, "\n".join(buf)
+            buf, first = [], None
+    if first is not None:
+        yield first + 1, last + 1, "\n".join(buf)
@@ -0,0 +1,410 @@
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Queue, Empty
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.config import (
+    INGEST_PARSE_PROCESSES,
+    INGEST_IO_WORKERS,
+    INGEST_MODEL_WORKERS,
+    INGEST_QUEUE_MAXSIZE,
+    INGEST_BATCH_SIZE,
+    WRITER_BATCH_SIZE,
+    WRITER_FLUSH_S,
+    INGEST_LANES,
+)
+from backend.database import SessionLocal
+from backend.ingest.parsers import parse_job, is_incremental_pdf, iter_pdf_jobs, is_incremental_audio, iter_audio_jobs
+from backend.ingest.fingerprints import fingerprints
+from backend.ingest.processor import IngestionProcessor
+from backend.ingest.lanes import LaneScheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sources whose parse step waits on a model/subprocess rather than the CPU
+_IO_BOUND_SOURCES = {"images", "audio"}
+
+
+def _drain(q: Queue, first: Any, limit: int, wait_s: float = 0.0) -> List[Any]:
+    """Collect up to `limit` items starting with `first`, waiting at most wait_s for more."""
+    items = [first]
+    deadline = time.time() + wait_s
+    while len(items) < limit:
+        remaining = deadline - time.time()
+        try:
+            items.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+        except Empty:
+            break
+    return items
+
+
+class IngestPipeline:
+    """
+    Staged ingestion with bounded queues between stages:
+
+        submit -> [parse_lanes] -> parse (process pool / IO threads)
+               -> [write_queue] -> writer: insert placeholder events (batched commit)
+               -> [model_lanes] -> model workers: metadata + embeddings (batched, no DB)
+               -> [write_queue] -> writer: final fields + vectors (batched commit)
+
+    Parse and model queues are split into per-source_type lanes
+    (INGEST_LANES) served by weighted fair scheduling, with a per-lane cap
+    on concurrent parses, so a text note does not wait behind a backlog of
+    VLM captions or whisper jobs. A full lane makes submit() block or fail.
+
+    Before parsing, the fingerprint index drops files that are unchanged or
+    byte-identical to already ingested ones.
+
+    The writer thread is the only code that touches SQLite and the vector
+    store, which keeps the "no database is locked" guarantee of the old
+    single worker while parsing and model calls run in parallel.
+    """
+
+    def __init__(
+        self,
+        processor: IngestionProcessor,
+        parse_processes: int = INGEST_PARSE_PROCESSES,
+        io_workers: int = INGEST_IO_WORKERS,
+        model_workers: int = INGEST_MODEL_WORKERS,
+        queue_maxsize: int = INGEST_QUEUE_MAXSIZE,
+    ):
+        self.processor = processor
+        self.parse_processes = parse_processes
+        # Enough IO threads for every IO-bound lane to run at its cap at once
+        io_lanes = sum(INGEST_LANES.get(st, {}).get("concurrency", 1) for st in _IO_BOUND_SOURCES)
+        self.io_workers = max(1, io_workers, io_lanes)
+        self.model_workers = max(1, model_workers)
+
+        # Lane concurrency caps bound the tasks handed to the pools
+        self.parse_lanes = LaneScheduler(INGEST_LANES)
+        self.model_lanes = LaneScheduler(INGEST_LANES, concurrency=False, max_queue=queue_maxsize)
+        # Unbounded on purpose: the writer feeds model_lanes, so bounding its
+        # own input too could deadlock the two stages against each other
+        self.write_queue: "Queue[Tuple[str, Dict[str, Any]]]" = Queue()
+
+        self._cpu_pool: Optional[Executor] = None
+        self._io_pool: Optional[Executor] = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.counters = {"submitted": 0, "parsed": 0, "duplicates": 0, "skipped": 0, "stored": 0, "failed": 0}
+        # Streamed documents by path: parts settled so far, and the part count once the stream ended
+        # (writer thread only)
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        # Optional (session, [(path, outcome, error)]) hook run by the writer, e.g. JobQueue.complete
+        self.on_complete: Optional[Callable[[Any, List[Tuple[str, str, Optional[str]]]], None]] = None
+
+    # --------------------
+    # Lifecycle
+    # --------------------
+    def start(self) -> "IngestPipeline":
+        if self.parse_processes > 0:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.parse_processes)
+        else:
+            self._cpu_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest-parse")
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="ingest-io")
+
+        self._spawn(self._parse_dispatcher, "ingest-parse-dispatch")
+        for i in range(self.model_workers):
+            self._spawn(self._model_worker, f"ingest-model-{i}")
+        self._spawn(self._writer, "ingest-writer")
+
+        logger.info(
+            f"Ingestion pipeline started (parse_processes={self.parse_processes}, io_workers={self.io_workers}, "
+            f"model_workers={self.model_workers}, single DB writer)."
+        )
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        for pool in (self._cpu_pool, self._io_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Ingestion pipeline stopped.")
+
+    def submit(self, path: str, source_type: str, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """Enqueue a file. Blocks, or returns False, when its lane is full (backpressure)."""
+        if not self.parse_lanes.put(source_type, (path, source_type), block=block, timeout=timeout):
+            return False
+        with self._lock:
+            self.counters["submitted"] += 1
+            self._in_flight += 1
+        return True
+
+    def room(self, source_type: str) -> int:
+        """Free queue slots in a lane: how much the feeder may submit without blocking."""
+        return self.parse_lanes.room(source_type)
+
+    def lanes(self) -> List[str]:
+        return self.parse_lanes.names()
+
+    def pending(self) -> int:
+        """Files submitted but not yet stored, skipped or failed."""
+        with self._lock:
+            return self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "parse_queue": self.parse_lanes.qsize(),
+                "model_queue": self.model_lanes.qsize(),
+                "lanes": {
+                    name: {**parse, "model_queued": self.model_lanes.stats().get(name, {}).get("queued", 0)}
+                    for name, parse in self.parse_lanes.stats().items()
+                },
+                "write_queue": self.write_queue.qsize(),
+                **self.counters,
+            }
+
+    def _spawn(self, target, name: str) -> None:
+        t = threading.Thread(target=target, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def _finish(self, n: int, outcome: str) -> None:
+        with self._lock:
+            self._in_flight -= n
+            self.counters[outcome] += n
+
+    # --------------------
+    # Stage 1: parse
+    # --------------------
+    def _parse_dispatcher(self) -> None:
+        while not self._stop.is_set():
+            got = self.parse_lanes.get(timeout=0.5)
+            if got is None:
+                continue
+            _, [(path, source_type)] = got
+
+            # Pre-parse fingerprint check: unchanged or byte-identical files never reach a parser
+            try:
+                skip, fp = fingerprints.check(path)
+            except Exception as e:
+                logger.warning(f"Fingerprint check failed for {path}: {e}")
+                skip, fp = False, None
+            if skip:
+                logger.info(f"Unchanged or identical file, skipping: {path}")
+                if fp:
+                    self.write_queue.put(("fingerprint", fp))
+                self.write_queue.put(("complete", (path, "skipped", None)))
+                self.parse_lanes.done(source_type)
+                self._finish(1, "skipped")
+                continue
+
+            if source_type == "docs" and is_incremental_pdf(path):
+                # Large PDF: stream page batches into the writer as they are extracted
+                self._io_pool.submit(self._stream_parts, iter_pdf_jobs, path, source_type, fp)
+                continue
+            if source_type == "audio" and is_incremental_audio(path):
+                # Long recording: stream partial transcripts as segments finish
+                self._io_pool.submit(self._stream_parts, iter_audio_jobs, path, source_type, fp)
+                continue
+
+            pool = self._io_pool if source_type in _IO_BOUND_SOURCES else self._cpu_pool
+            try:
+                future = pool.submit(parse_job, path, source_type, fp)
+            except BrokenProcessPool:
+                logger.error("Parse process pool broke; falling back to threads.")
+                self._cpu_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest-parse")
+                future = self._cpu_pool.submit(parse_job, path, source_type, fp)
+            future.add_done_callback(lambda f, p=path, st=source_type: self._on_parsed(f, p, st))
+
+    def _on_parsed(self, future, path: str, source_type: str) -> None:
+        self.parse_lanes.done(source_type)
+        error = "no parser output"
+        try:
+            job = future.result()
+        except Exception as e:
+            logger.exception(f"Parse failed for {path}: {e}")
+            job, error = None, str(e)
+
+        if job is None:
+            self.write_queue.put(("complete", (path, "failed", error)))
+            self._finish(1, "failed")
+            return
+        with self._lock:
+            self.counters["parsed"] += 1
+        self.write_queue.put(("insert", job))
+
+    def _stream_parts(self, iter_jobs, path: str, source_type: str, fp: Optional[Dict[str, Any]]) -> None:
+        """
+        Each part (PDF page batch, transcript span) becomes its own job as soon as it is ready.
+        Parts may finish in any order, so the writer records the file's fingerprint and
+        outcome only once every part is settled (see _settle_part).
+        """
+        parts, error = 0, None
+        try:
+            for job in iter_jobs(path, source_type, fp, self._cpu_pool):
+                with self._lock:
+                    self._in_flight += 1  # each part is tracked on its own
+                    self.counters["parsed"] += 1
+                parts += 1
+                job["fingerprint"], job["part_of"] = None, path
+                self.write_queue.put(("insert", job))
+        except Exception as e:
+            logger.exception(f"Incremental parse failed for {path}: {e}")
+            error = str(e)
+        finally:
+            self.parse_lanes.done(source_type)
+            if parts:
+                # A stream that broke off after some parts still fails the file (and its fingerprint)
+                self.write_queue.put(("parts", (path, parts, fp, error)))
+                with self._lock:
+                    self._in_flight -= 1  # the file's own slot from submit()
+            else:
+                self.write_queue.put(("complete", (path, "failed", error or "no parts extracted")))
+                self._finish(1, "failed")
+
+    # --------------------
+    # Stage 2: model calls (no DB access)
+    # --------------------
+    def _model_worker(self) -> None:
+        while not self._stop.is_set():
+            # One lane per batch: batches stay homogeneous, and lanes take turns by weight
+            got = self.model_lanes.get(limit=INGEST_BATCH_SIZE, timeout=0.5)
+            if got is None:
+                continue
+            lane, jobs = got
+
+            try:
+                self.processor.enrich_batch(jobs)
+            except Exception as e:
+                logger.exception(f"Model stage error: {e}")
+                for job in jobs:
+                    job.setdefault("error", str(e))
+            finally:
+                self.model_lanes.done(lane, len(jobs))
+            for job in jobs:
+                self.write_queue.put(("finalize", job))
+
+    # --------------------
+    # Stage 3: single DB / vector-store writer
+    # --------------------
+    def _writer(self) -> None:
+        logger.info("Ingestion writer started (single-threaded DB writes).")
+        while not self._stop.is_set():
+            try:
+                first = self.write_queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+            ops = _drain(self.write_queue, first, WRITER_BATCH_SIZE, WRITER_FLUSH_S)
+            inserts = [job for kind, job in ops if kind == "insert"]
+            finals = [job for kind, job in ops if kind == "finalize"]
+            aliases = [fp for kind, fp in ops if kind == "fingerprint"]
+            results = [result for kind, result in ops if kind == "complete"]
+            streamed = [parts for kind, parts in ops if kind == "parts"]
+
+            session = SessionLocal()
+            try:
+                # Each stage commits or rolls back on its own, so one failing stage
+                # cannot take the others' jobs (and their outcomes) down with it
+                if aliases:
+                    try:
+                        fingerprints.record(session, aliases)
+                        session.commit()
+                    except Exception as e:
+                        logger.exception(f"Could not record fingerprint aliases: {e}")
+                        session.rollback()
+
+                if finals:
+                    try:
+                        self.processor.store_enriched_batch(session, finals)
+                    except Exception as e:
+                        logger.exception(f"Final commit error: {e}")
+                        session.rollback()
+                        for job in finals:
+                            job.setdefault("error", str(e))
+                    failed = sum(1 for job in finals if job.get("error"))
+                    self._finish(len(finals) - failed, "stored")
+                    self._finish(failed, "failed")
+                    for job in finals:
+                        self._settle_part(results, job, "failed" if job.get("error") else "stored", job.get("error"))
+                for path, parts, fp, error in streamed:
+                    doc = self._documents.setdefault(path, self._new_document())
+                    doc.update(parts=parts, fingerprint=fp, error=doc["error"] or error)
+                self._settle_documents(session, results)
+                # Report before the inserts run, which may block on a saturated model lane
+                self._report(session, results)
+
+                if inserts:
+                    try:
+                        accepted = self.processor.insert_minimal_batch(session, inserts)
+                    except Exception as e:
+                        logger.exception(f"Placeholder insert error: {e}")
+                        session.rollback()
+                        self._finish(len(inserts), "failed")
+                        results = []
+                        for job in inserts:
+                            self._settle_part(results, job, "failed", str(e))
+                        self._settle_documents(session, results)
+                        self._report(session, results)
+                        continue
+                    self._finish(len(inserts) - len(accepted), "duplicates")
+                    kept = {id(job) for job in accepted}
+                    results = []
+                    for job in inserts:
+                        if id(job) not in kept:
+                            self._settle_part(results, job, "duplicates")
+                    self._settle_documents(session, results)
+                    self._report(session, results)
+                    for job in accepted:
+                        self.model_lanes.put(job["source_type"], job)  # blocks if that lane is saturated
+            finally:
+                session.close()
+
+        logger.info("Ingestion writer stopped.")
+
+    @staticmethod
+    def _new_document() -> Dict[str, Any]:
+        return {"parts": None, "settled": 0, "error": None, "event_id": None, "fingerprint": None}
+
+    def _settle_part(self, results: List[Tuple[str, str, Optional[str]]], job: Dict[str, Any], outcome: str,
+                     error: Optional[str] = None) -> None:
+        """Queue a job's outcome; a streamed part counts toward its document instead."""
+        path = job.get("part_of")
+        if path is None:
+            results.append((job["path"], outcome, error))
+            return
+        doc = self._documents.setdefault(path, self._new_document())
+        doc["settled"] += 1
+        if outcome == "failed":
+            doc["error"] = doc["error"] or error or "part failed"
+        elif outcome == "stored":
+            doc["event_id"] = doc["event_id"] or job.get("event_id")
+
+    def _settle_documents(self, session, results: List[Tuple[str, str, Optional[str]]]) -> None:
+        """Record the fingerprint and outcome of every streamed document whose parts are all settled."""
+        for path, doc in list(self._documents.items()):
+            if doc["parts"] is None or doc["settled"] < doc["parts"]:
+                continue
+            del self._documents[path]
+            fp, error = doc["fingerprint"], doc["error"]
+            if fp:
+                fp["event_id"] = doc["event_id"]
+                try:
+                    fingerprints.record(session, [fp], status="failed" if error else "done")
+                    session.commit()
+                except Exception as e:
+                    logger.warning(f"Could not record the fingerprint of {path}: {e}")
+                    session.rollback()
+            outcome = "failed" if error else ("stored" if doc["event_id"] else "duplicates")
+            results.append((path, outcome, error))
+
+    def _report(self, session, results: List[Tuple[str, str, Optional[str]]]) -> None:
+        if not results or self.on_complete is None:
+            return
+        try:
+            self.on_complete(session, results)
+            session.commit()
+        except Exception as e:
+            logger.exception(f"Could not report ingest outcomes: {e}")
+            session.rollback()
@@ -1,111 +1,373 @@
 import logging
-import hashlib
 import os
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 
-from backend.ingest.parsers import parse_text, parse_pdf, parse_image, parse_audio
-from backend.utils.llm_client import call_llm, call_embed, clean_json_response
-from backend.database import SessionLocal, MemoryEvent, ActionItem
+from backend.ingest.parsers import parse_job, is_incremental_pdf, iter_pdf_jobs, is_incremental_audio, iter_audio_jobs
+from backend.ingest.fingerprints import fingerprints
+from backend.ingest.image_pipeline import caption_cache
+from backend.utils.llm_client import call_llm_json, call_embed_batch
+from backend.utils.schemas import MetadataSchema
+from backend.database import SessionLocal, MemoryEvent, ActionItem, GraphEdge
 from backend.memory.vector_store import store
-from backend.config import MODEL_MAIN
+from backend.memory.tag_index import index_events, unindex_events
+from backend.memory.content_store import content_store
+from backend.memory.graph import graph_builder
+from backend.memory import feeds
+from backend.ingest.mapreduce import map_reduce_metadata
+from backend.utils.metrics import REGISTRY
+from backend.config import MODEL_MAIN, METADATA_CHUNK_CHARS, INGEST_BATCH_SIZE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+_FAILED_SUMMARY = "(failed processing)"
+_PROCESSING_SUMMARY = "(processing...)"
+
+# Content hashes inserted as placeholders by this process and not finalized yet.
+# A placeholder outside this set was left by an interrupted run.
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ingest_stage_seconds", "Ingestion stage latency (parse and metadata per file, the others per batch)", ["stage"]
+)
+INGESTED = REGISTRY.counter("ingest_events_total", "Ingested files/parts by outcome", ["source_type", "status"])
+
+# Parse order inside a batch: keep VLM captions back-to-back, then whisper, then plain text
+_PARSE_ORDER = {"images": 0, "audio": 1, "docs": 2, "text": 3}
+
+
 class IngestionProcessor:
+    """
+    Ingestion stages, usable inline (process_file / process_batch) or driven
+    by the staged pipeline in backend.ingest.pipeline:
+
+        parse_job -> insert_minimal_batch -> enrich_batch -> store_enriched_batch
+        (CPU/IO)     (DB writer)             (model calls)   (DB writer)
+    """
+
     def __init__(self):
         pass  # stateless
 
     def process_file(self, file_path: str, source_type: str):
+        self.process_batch([(file_path, source_type)])
+
+    def process_batch(self, items: List[Tuple[str, str]]):
+        """
+        Phase-ordered ingestion: all parses (captions), then all metadata,
+        then all embeddings. Grouping work by stage keeps one Ollama model
+        busy at a time instead of swapping models for every file.
+        """
+        ordered = sorted(items, key=lambda it: _PARSE_ORDER.get(it[1], 99))
+
         session = SessionLocal()
-        t0 = time.time()
+        try:
+            # STAGE 0: skip unchanged / byte-identical files before any parser runs
+            jobs, aliases = [], []
+            for path, source_type in ordered:
+                skip, fp = fingerprints.check(path)
+                if skip:
+                    logger.info(f"Unchanged or identical file, skipping: {path}")
+                    aliases.append(fp)
+                    continue
+                if source_type == "docs" and is_incremental_pdf(path):
+                    jobs.extend(iter_pdf_jobs(path, source_type, fp))
+                    continue
+                if source_type == "audio" and is_incremental_audio(path):
+                    jobs.extend(iter_audio_jobs(path, source_type, fp))
+                    continue
+                job = parse_job(path, source_type, fp)
+                if job is not None:
+                    jobs.append(job)
+            if any(aliases):
+                fingerprints.record(session, aliases)
+                session.commit()
 
+            jobs = self.insert_minimal_batch(session, jobs)
+            self.enrich_batch(jobs)
+            self.store_enriched_batch(session, jobs)
+        finally:
+            session.close()
+
+    # --------------------
+    # STAGE 2 + 3: DEDUPE HASH, COMMIT MINIMAL EVENT FIRST (prevents “nothing happens”)
+    # --------------------
+    def insert_minimal_batch(self, session, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert placeholder events in one commit. Returns the non-duplicate jobs."""
+        if not jobs:
+            return []
+        t_stage = time.time()
+        for job in jobs:
+            if "parse_s" in job:
+                STAGE_SECONDS.observe(job.pop("parse_s"), stage="parse")
+
+        # Persist fresh VLM captions (by perceptual hash), even for jobs that turn out duplicate
+        new_captions = [job["new_caption"] for job in jobs if job.get("new_caption")]
+        if new_captions:
+            caption_cache.persist(session, new_captions)
+            session.commit()
+
+        hashes = [job["content_hash"] for job in jobs]
+        existing, failed_ids = set(), []
+        for h, event_id, summary in session.query(
+            MemoryEvent.content_hash, MemoryEvent.id, MemoryEvent.summary_1line
+        ).filter(MemoryEvent.content_hash.in_(hashes)):
+            if summary == _FAILED_SUMMARY or (summary == _PROCESSING_SUMMARY and not self._is_in_progress(h)):
+                failed_ids.append(event_id)  # a retry: replace the failed or abandoned event
+            else:
+                existing.add(h)
+        if failed_ids:
+            self._delete_events(session, failed_ids)
+            session.commit()
+
+        accepted, duplicates = [], []
+        for job in jobs:
+            if job["content_hash"] in existing:
+                logger.info(f"Duplicate content found for {os.path.basename(job['path'])}, skipping.")
+                duplicates.append(job["fingerprint"])
+                INGESTED.inc(source_type=job["source_type"], status="duplicate")
+                continue
+            existing.add(job["content_hash"])
+            job["event_id"] = str(uuid.uuid4())
+            job["packed_content"] = content_store.pack(job["content"])  # None when it fits inline
+            accepted.append(job)
+
+        logger.info(f"[STAGE] db_insert_minimal_start n={len(accepted)}")
         try:
-            logger.info(f"Processing ({source_type}): {file_path}")
-
-            if not os.path.exists(file_path):
-                logger.warning(f"File vanished before processing: {file_path}")
-                return
-
-            # --------------------
-            # STAGE 1: PARSE
-            # --------------------
-            logger.info("[STAGE] parse_start")
-            content = ""
-            vision_caption = None
-
-            if source_type in ["text", "docs"]:
-                if file_path.lower().endswith(".pdf"):
-                    content = parse_pdf(file_path)
+            for job in accepted:
+                self._store_content(session, job)
+            seq = feeds.bump(session, feeds.TIMELINE)
+            session.add_all([self._minimal_event(job, seq) for job in accepted])
+            session.commit()  # ✅ events now appear in Timeline immediately
+        except IntegrityError:
+            # A concurrent writer won a race on content_hash: fall back to one commit per job
+            session.rollback()
+            retried, accepted = accepted, []
+            for job in retried:
+                if self._insert_minimal_one(session, job):
+                    accepted.append(job)
                 else:
-                    content = parse_text(file_path)
-
-            elif source_type == "images":
-                result = parse_image(file_path)
-                content = result.get("raw_text", "") or ""
-                vision_caption = result.get("vision_caption", "") or ""
-
-            elif source_type == "audio":
-                content = parse_audio(file_path)
-
-            logger.info(
-                f"[STAGE] parse_done chars={len(content)} cap_chars={len(vision_caption or '')} dt={time.time()-t0:.2f}s"
-            )
-
-            # If PDF has no extractable text, still store the event (demo-safe)
-            if not content and not vision_caption:
-                logger.warning(f"No content extracted from {file_path}. Storing minimal event anyway.")
-                content = ""
-
-            # --------------------
-            # STAGE 2: DEDUPE HASH
-            # --------------------
-            raw_data = (content or "") + (vision_caption or "")
-            content_hash = hashlib.sha256(raw_data.encode("utf-8", "ignore")).hexdigest()
-
-            existing = session.query(MemoryEvent).filter_by(content_hash=content_hash).first()
-            if existing:
-                logger.info(f"Duplicate content found for {os.path.basename(file_path)}, skipping.")
-                return
-
-            # --------------------
-            # STAGE 3: COMMIT MINIMAL EVENT FIRST (prevents “nothing happens”)
-            # --------------------
-            logger.info("[STAGE] db_insert_minimal_start")
-            event = MemoryEvent(
-                source_type=source_type,
-                source_path=file_path,
-                content_hash=content_hash,
-                raw_text=content,
-                vision_caption=vision_caption,
-                summary_1line="(processing...)",
-                summary_short="",
-                entities=[],
-                topics=[],
-                intent_label="general",
-                metadata_json={"status": "processing"},
-            )
-            session.add(event)
-            session.commit()  # ✅ event now appears in Timeline immediately
-            session.refresh(event)
-            logger.info(f"[STAGE] db_insert_minimal_done event_id={event.id} dt={time.time()-t0:.2f}s")
-
-            # --------------------
-            # STAGE 4: METADATA EXTRACTION
-            # --------------------
-            logger.info("[STAGE] metadata_start")
-            metadata = self._extract_metadata(content if content else (vision_caption or ""))
-            logger.info(f"[STAGE] metadata_done dt={time.time()-t0:.2f}s")
+                    duplicates.append(job["fingerprint"])
+                    INGESTED.inc(source_type=job["source_type"], status="duplicate")
+
+        if any(duplicates):
+            # Parsed to nothing new: remember the raw file so it is never parsed again
+            fingerprints.record(session, duplicates)
+            session.commit()
+
+        for job in jobs:
+            job.pop("packed_content", None)
+        with _in_progress_lock:
+            _in_progress.update(job["content_hash"] for job in accepted)
+        STAGE_SECONDS.observe(time.time() - t_stage, stage="insert_minimal")
+        for job in accepted:
+            logger.info(f"[STAGE] db_insert_minimal_done event_id={job['event_id']} dt={time.time()-job['t0']:.2f}s")
+        return accepted
+
+    @staticmethod
+    def _is_in_progress(content_hash: str) -> bool:
+        with _in_progress_lock:
+            return content_hash in _in_progress
+
+    @staticmethod
+    def _delete_events(session, event_ids: List[str]) -> None:
+        """
+        Delete events with their dependent rows. Bulk deletes skip the ORM cascade and
+        SQLite does not enforce foreign keys, so edges, actions and tags go explicitly.
+        """
+        session.query(GraphEdge).filter(
+            or_(GraphEdge.from_event_id.in_(event_ids), GraphEdge.to_event_id.in_(event_ids))
+        ).delete(synchronize_session=False)
+        action_ids = [a for (a,) in session.query(ActionItem.id).filter(ActionItem.evidence_event_id.in_(event_ids))]
+        if action_ids:
+            session.query(ActionItem).filter(ActionItem.id.in_(action_ids)).delete(synchronize_session=False)
+            feeds.record_deleted(session, feeds.ACTIONS, action_ids, feeds.bump(session, feeds.ACTIONS))
+        unindex_events(session, event_ids)
+        session.query(MemoryEvent).filter(MemoryEvent.id.in_(event_ids)).delete(synchronize_session=False)
+        feeds.record_deleted(session, feeds.TIMELINE, event_ids, feeds.bump(session, feeds.TIMELINE))
+
+    def _insert_minimal_one(self, session, job: Dict[str, Any]) -> bool:
+        try:
+            self._store_content(session, job)
+            session.add(self._minimal_event(job, feeds.bump(session, feeds.TIMELINE)))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            logger.info(f"Duplicate content found for {os.path.basename(job['path'])}, skipping.")
+            return False
+
+    @staticmethod
+    def _store_content(session, job: Dict[str, Any]) -> None:
+        """Long bodies go to the compressed content store; raw_text keeps the inline prefix."""
+        if job.get("packed_content"):
+            content_store.put(session, job["packed_content"])
+
+    def _minimal_event(self, job: Dict[str, Any], seq: int) -> MemoryEvent:
+        packed = job.get("packed_content")
+        return MemoryEvent(
+            id=job["event_id"],
+            source_type=job["source_type"],
+            source_path=job["path"],
+            content_hash=job["content_hash"],
+            raw_text=content_store.inline_text(job["content"]),
+            content_ref=packed["key"] if packed else None,
+            vision_caption=job["vision_caption"],
+            summary_1line=_PROCESSING_SUMMARY,
+            summary_short="",
+            entities=[],
+            topics=[],
+            intent_label="general",
+            metadata_json={"status": "processing", **job.get("extra_metadata", {})},
+            change_seq=seq,
+        )
+
+    # --------------------
+    # STAGE 4 + 5: METADATA EXTRACTION, EMBEDDINGS (model calls only, no DB)
+    # --------------------
+    def enrich_batch(self, jobs: List[Dict[str, Any]]) -> None:
+        """All metadata first, then all embeddings. Failures are recorded on the job."""
+        self.extract_metadata_batch(jobs)
+        self.embed_batch(jobs)
+
+    def extract_metadata_batch(self, jobs: List[Dict[str, Any]], workers: int = 1) -> None:
+        def run(job: Dict[str, Any]) -> None:
+            try:
+                logger.info("[STAGE] metadata_start")
+                with STAGE_SECONDS.time(stage="metadata"):
+                    job["metadata"] = self._extract_metadata(job["content"] if job["content"] else (job["vision_caption"] or ""))
+                logger.info(f"[STAGE] metadata_done dt={time.time()-job['t0']:.2f}s")
+            except Exception as e:
+                logger.exception(f"Error processing {job['path']}: {e}")
+                job["error"] = str(e)
+
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                run(job)
+            return
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metadata") as pool:
+            list(pool.map(run, jobs))
+
+    def embed_batch(self, jobs: List[Dict[str, Any]], batch_size: int = INGEST_BATCH_SIZE) -> None:
+        """Embeddings for many jobs, batch_size texts per /api/embed request."""
+        todo = [job for job in jobs if not job.get("error")]
+        for i in range(0, len(todo), batch_size):
+            chunk = todo[i : i + batch_size]
+            logger.info(f"[STAGE] embed_start n={len(chunk)}")
+            try:
+                with STAGE_SECONDS.time(stage="embed"):
+                    vectors = call_embed_batch([self.embedding_text(job) for job in chunk], timeout_s=20 + 5 * len(chunk))
+            except Exception as e:
+                logger.exception(f"Batch embedding failed for {len(chunk)} jobs: {e}")
+                for job in chunk:
+                    job["error"] = str(e)
+                continue
+            for job, vector in zip(chunk, vectors):
+                job["vector"] = vector
+                logger.info(f"[STAGE] embed_done ok={vector is not None} dt={time.time()-job['t0']:.2f}s")
+
+    @staticmethod
+    def embedding_text(job: Dict[str, Any]) -> str:
+        metadata = job["metadata"]
+        summary_short = "\n".join(metadata.get("summary_bullets", [])) or "- processed"
+        return f"{metadata.get('summary_1line', 'No summary available.')}\n{summary_short}\n{(job['content'] or '')[:800]}"
+
+    # --------------------
+    # STAGE 6: FINAL COMMIT
+    # --------------------
+    def store_enriched_batch(self, session, jobs: List[Dict[str, Any]]) -> None:
+        """Apply metadata + vectors for many jobs with one vector-store save and one commit."""
+        if not jobs:
+            return
+
+        logger.info(f"[STAGE] commit_final_start n={len(jobs)}")
+        t_stage = time.time()
+        try:
+            try:
+                self._apply_enriched(session, jobs)
+                session.commit()
+            except Exception as e:
+                logger.exception(f"Batch commit failed, retrying per event: {e}")
+                session.rollback()
+                for job in jobs:
+                    try:
+                        self._apply_enriched(session, [job])
+                        session.commit()
+                    except Exception as e:
+                        logger.exception(f"Error processing {job['path']}: {e}")
+                        session.rollback()
+                        job["error"] = str(e)
+                        self._mark_failed(session, job)
+        finally:
+            with _in_progress_lock:
+                _in_progress.difference_update(job["content_hash"] for job in jobs)
+
+        self._record_fingerprints(session, jobs)
+        STAGE_SECONDS.observe(time.time() - t_stage, stage="commit_final")
+
+        for job in jobs:
+            INGESTED.inc(source_type=job["source_type"], status="failed" if job.get("error") else "ok")
+            if not job.get("error"):
+                logger.info(
+                    f"Successfully ingrained event {job['event_id']} with {job.get('actions_added', 0)} actions. "
+                    f"total={time.time()-job['t0']:.2f}s"
+                )
+
+    def _record_fingerprints(self, session, jobs: List[Dict[str, Any]]) -> None:
+        # A document's parts share its path: any failed part keeps the whole file retryable
+        failed_paths = {job["path"] for job in jobs if job.get("error")}
+        done, failed = [], []
+        for job in jobs:
+            fp = job.get("fingerprint")
+            if not fp:
+                continue
+            fp["event_id"] = job["event_id"]
+            (failed if job["path"] in failed_paths else done).append(fp)
+        try:
+            fingerprints.record(session, done)
+            fingerprints.record(session, failed, status="failed")
+            session.commit()
+        except Exception as e:
+            logger.warning(f"Could not record file fingerprints: {e}")
+            session.rollback()
+
+    def _apply_enriched(self, session, jobs: List[Dict[str, Any]]) -> None:
+        events = {
+            e.id: e
+            for e in session.query(MemoryEvent).filter(MemoryEvent.id.in_([job["event_id"] for job in jobs]))
+        }
+
+        if not events:
+            return
+        seq, action_seq = feeds.bump(session, feeds.TIMELINE), None
+
+        to_index, tagged = [], []
+        for job in jobs:
+            event = events.get(job["event_id"])
+            if event is None:
+                continue
+            if job.get("error"):
+                self._mark_failed(session, job, event, commit=False)
+                continue
+
+            metadata = job["metadata"]
 
             # Update event fields
             event.summary_1line = metadata.get("summary_1line", "No summary available.")
             event.summary_short = "\n".join(metadata.get("summary_bullets", []))
             event.entities = metadata.get("entities", [])
             event.topics = metadata.get("topics", [])
+            tagged.append((event.id, event.entities, event.topics))
             event.intent_label = metadata.get("intent", "general")
-            event.metadata_json = metadata
+            event.metadata_json = {**metadata, **job.get("extra_metadata", {})}
+            event.change_seq = seq
 
             # Replace placeholder with real content
             if not event.summary_short:
@@ -115,55 +377,51 @@ class IngestionProcessor:
             actions_added = 0
             for action in metadata.get("action_items", []):
                 if isinstance(action, dict) and action.get("task"):
-                    item = ActionItem(
+                    if action_seq is None:
+                        action_seq = feeds.bump(session, feeds.ACTIONS)
+                    session.add(ActionItem(
                         task=action.get("task", "Unknown Task"),
                         owner=action.get("owner", "user"),
                         priority=action.get("priority", "medium"),
                         status="open",
                         evidence_event_id=event.id,
-                    )
-                    session.add(item)
+                        change_seq=action_seq,
+                    ))
                     actions_added += 1
+            job["actions_added"] = actions_added
 
-            # --------------------
-            # STAGE 5: EMBEDDINGS
-            # --------------------
-            logger.info("[STAGE] embed_start")
-            text_to_embed = f"{event.summary_1line}\n{event.summary_short}\n{(content or '')[:800]}"
-            vector = call_embed(text_to_embed, timeout_s=20)
-            logger.info(f"[STAGE] embed_done ok={vector is not None} dt={time.time()-t0:.2f}s")
-
-            if vector:
-                internal_id = store.add_event(event.id, vector)
-                if internal_id is not None:
-                    event.embedding_ref = str(internal_id)
+            if job.get("vector_id") is not None:
+                # Appended by an attempt whose commit failed (per-event retry): reuse, do not append twice
+                event.embedding_ref = str(job["vector_id"])
+            elif job.get("vector"):
+                to_index.append((event, job))
             else:
                 logger.warning("Embedding generation failed; continuing without embedding_ref.")
 
-            # --------------------
-            # STAGE 6: FINAL COMMIT
-            # --------------------
-            logger.info("[STAGE] commit_final_start")
-            session.commit()
-            logger.info(
-                f"Successfully ingrained event {event.id} with {actions_added} actions. total={time.time()-t0:.2f}s"
-            )
+        if tagged:
+            index_events(session, tagged)
 
-        except Exception as e:
-            logger.exception(f"Error processing {file_path}: {e}")
-            session.rollback()
+        if to_index:
+            session.flush()  # surface DB errors before vectors are appended
+            internal_ids = store.add_events([(event.id, job["vector"]) for event, job in to_index])
+            for (event, job), internal_id in zip(to_index, internal_ids):
+                if internal_id is not None:
+                    event.embedding_ref = str(internal_id)
+                    job["vector_id"] = internal_id
+            graph_builder.notify()
 
-            # If event exists and we crashed after minimal commit, mark it
-            try:
-                if "event" in locals() and event and event.id:
-                    event.metadata_json = {"status": "failed", "error": str(e)}
-                    event.summary_1line = "(failed processing)"
+    def _mark_failed(self, session, job: Dict[str, Any], event: Optional[MemoryEvent] = None, commit: bool = True) -> None:
+        # We crashed after the minimal commit: mark the event instead of leaving it "processing"
+        try:
+            event = event or session.get(MemoryEvent, job["event_id"])
+            if event is not None:
+                event.metadata_json = {"status": "failed", "error": job.get("error", "")}
+                event.summary_1line = _FAILED_SUMMARY
+                event.change_seq = feeds.bump(session, feeds.TIMELINE)
+                if commit:
                     session.commit()
-            except Exception:
-                session.rollback()
-
-        finally:
-            session.close()
+        except Exception:
+            session.rollback()
 
     def _extract_metadata(self, text: str) -> dict:
         if not text:
@@ -176,10 +434,28 @@ class IngestionProcessor:
                 "intent": "general",
             }
 
+        if len(text) <= METADATA_CHUNK_CHARS:
+            data = self._extract_chunk_metadata(text)
+        else:
+            # Long content: map over every chunk, reduce to one record (nothing truncated)
+            data = map_reduce_metadata(text, self._extract_chunk_metadata)
+        if data:
+            return data
+
+        return {
+            "summary_1line": "Automatic processing result",
+            "summary_bullets": ["Content processed but metadata extraction unclear."],
+            "entities": [],
+            "topics": [],
+            "action_items": [],
+            "intent": "general",
+        }
+
+    def _extract_chunk_metadata(self, text: str) -> Optional[dict]:
         prompt = f"""
 Analyze this content and extract structured data in strict JSON.
 Content:
-{text[:3000]}
+{text}
 
 Return ONLY a valid JSON object with these keys:
 - "summary_1line": string
@@ -189,25 +465,4 @@ Return ONLY a valid JSON object with these keys:
 - "action_items": [ {{"task": string, "owner": string, "priority": "high|medium|low"}} ]
 - "intent": string (informational|task|reminder)
 """
-
-        for attempt in range(2):
-            resp = call_llm(MODEL_MAIN, prompt, json_mode=True, timeout_s=60)
-            data = clean_json_response(resp)
-            if data and isinstance(data, dict) and "summary_1line" in data:
-                # Normalize missing keys
-                data.setdefault("summary_bullets", [])
-                data.setdefault("entities", [])
-                data.setdefault("topics", [])
-                data.setdefault("action_items", [])
-                data.setdefault("intent", "general")
-                return data
-            logger.warning(f"Invalid JSON from LLM, retrying... attempt={attempt+1}")
-
-        return {
-            "summary_1line": "Automatic processing result",
-            "summary_bullets": ["Content processed but metadata extraction unclear."],
-            "entities": [],
-            "topics": [],
-            "action_items": [],
-            "intent": "general",
-        }
+        return call_llm_json(MODEL_MAIN, prompt, MetadataSchema, task="metadata", timeout_s=60)
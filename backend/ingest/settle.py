@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.config import (
+    SETTLE_QUIET_S,
+    SETTLE_TICK_S,
+    SETTLE_GIVE_UP_S,
+    SETTLE_MAX_PENDING,
+    SETTLE_DEBOUNCE_S,
+    SETTLE_DEBOUNCE_MAX,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("source_type", "size", "mtime_ns", "changed_at", "first_seen")
+
+    def __init__(self, source_type: str, now: float):
+        self.source_type = source_type
+        self.size = -1
+        self.mtime_ns = -1
+        self.changed_at = now
+        self.first_seen = now
+
+
+class SettleTracker:
+    """
+    Watches every path that is still being written from one timer loop and
+    hands a file on only once its size and mtime have not changed for
+    SETTLE_QUIET_S. Nothing sleeps per file, so a burst of hundreds of files
+    settles in roughly SETTLE_QUIET_S, not hundreds of sequential waits.
+
+    Memory is bounded: at most SETTLE_MAX_PENDING tracked paths (overflow is
+    handed on directly) and a SETTLE_DEBOUNCE_MAX-entry, SETTLE_DEBOUNCE_S
+    expiring record of recent hand-offs that absorbs the duplicate
+    created/modified events watchdog emits for one copy.
+    """
+
+    def __init__(self, on_settled: Callable[[List[Tuple[str, str]]], None]):
+        self.on_settled = on_settled
+        self._pending: Dict[str, _Pending] = {}
+        self._recent: "OrderedDict[str, Tuple[float, int, int]]" = OrderedDict()  # path -> (at, size, mtime_ns)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"events": 0, "debounced": 0, "settled": 0, "overflow": 0, "gave_up": 0, "vanished": 0}
+
+    def start(self) -> "SettleTracker":
+        self._thread = threading.Thread(target=self._run, name="settle-tracker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def touch(self, path: str, source_type: str) -> None:
+        """Record a file event. Cheap and non-blocking (called from watchdog's thread)."""
+        now = time.time()
+        with self._lock:
+            self.counters["events"] += 1
+            entry = self._pending.get(path)
+            if entry is not None:
+                entry.changed_at = now  # still being written: restart its quiet period
+                return
+            if self._is_debounced(path, now):
+                self.counters["debounced"] += 1
+                return
+            overflow = len(self._pending) >= SETTLE_MAX_PENDING
+            if not overflow:
+                self._pending[path] = _Pending(source_type, now)
+                self._wakeup.set()
+        if overflow:
+            self.counters["overflow"] += 1
+            self._hand_off([(path, source_type)])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._pending), "recent": len(self._recent), **self.counters}
+
+    def _is_debounced(self, path: str, now: float) -> bool:
+        recent = self._recent.get(path)
+        if recent is None or now - recent[0] > SETTLE_DEBOUNCE_S:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == recent[1:]
+
+    # --------------------
+    # Timer loop
+    # --------------------
+    def _run(self) -> None:
+        logger.info("Settle tracker started.")
+        while not self._stop.is_set():
+            with self._lock:
+                idle = not self._pending
+            if idle:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+            else:
+                self._stop.wait(SETTLE_TICK_S)
+            try:
+                self._tick()
+            except Exception as e:
+                logger.exception(f"Settle tracker error: {e}")
+        logger.info("Settle tracker stopped.")
+
+    def _tick(self) -> None:
+        now = time.time()
+        with self._lock:
+            snapshot = list(self._pending.items())
+
+        settled, dropped = [], []
+        for path, entry in snapshot:
+            try:
+                st = os.stat(path)
+            except OSError:
+                dropped.append(path)  # deleted or renamed away before it settled
+                self.counters["vanished"] += 1
+                continue
+            if st.st_size != entry.size or st.st_mtime_ns != entry.mtime_ns:
+                entry.size, entry.mtime_ns, entry.changed_at = st.st_size, st.st_mtime_ns, now
+            elif st.st_size > 0 and now - entry.changed_at >= SETTLE_QUIET_S:
+                settled.append((path, entry))
+                continue
+            if now - entry.first_seen > SETTLE_GIVE_UP_S:
+                logger.warning(f"File did not settle within {SETTLE_GIVE_UP_S}s, dropping until its next event: {path}")
+                dropped.append(path)
+                self.counters["gave_up"] += 1
+
+        ready = []
+        with self._lock:
+            for path in dropped:
+                self._pending.pop(path, None)
+            for path, entry in settled:
+                # touch() may have seen a newer write since the snapshot
+                if self._pending.get(path) is entry and entry.changed_at <= now:
+                    del self._pending[path]
+                    self._recent[path] = (now, entry.size, entry.mtime_ns)
+                    self._recent.move_to_end(path)
+                    ready.append((path, entry.source_type))
+            self._expire_recent(now)
+            self.counters["settled"] += len(ready)
+
+        if ready:
+            self._hand_off(ready)
+
+    def _expire_recent(self, now: float) -> None:
+        while self._recent:
+            path, (at, _, _) = next(iter(self._recent.items()))
+            if now - at <= SETTLE_DEBOUNCE_S and len(self._recent) <= SETTLE_DEBOUNCE_MAX:
+                break
+            self._recent.popitem(last=False)
+
+    def _hand_off(self, items: List[Tuple[str, str]]) -> None:
+        try:
+            self.on_settled(items)
+        except Exception as e:
+            logger.exception(f"Could not hand off {len(items)} settled files: {e}")
@@ -0,0 +1,121 @@
+"""
+Files pushed through POST /ingest instead of the watched inbox folders.
+
+An upload is streamed to UPLOAD_DIR/<source_type>/<job_id>__<name>.part in
+chunks, renamed into place once complete, and enqueued straight into the
+durable job queue (UPLOAD_DIR is not watched, so it is queued exactly once).
+The job id is the stored file's name prefix; progress is read back from
+ingest_jobs and the events created for the file.
+"""
+import glob
+import os
+import re
+import uuid
+from typing import Any, Dict, Optional
+
+from backend.config import UPLOAD_DIR, UPLOAD_MAX_BYTES, INGEST_UPLOAD_PRIORITY
+from backend.database import SessionLocal, MemoryEvent, IngestJob
+from backend.ingest.fingerprints import normalize_path
+from backend.ingest.job_queue import job_queue
+
+SOURCE_TYPES_BY_EXT = {
+    ".txt": "text", ".md": "text", ".csv": "text", ".json": "text", ".log": "text",
+    ".pdf": "docs",
+    ".png": "images", ".jpg": "images", ".jpeg": "images", ".webp": "images", ".gif": "images", ".bmp": "images",
+    ".wav": "audio", ".mp3": "audio", ".m4a": "audio", ".ogg": "audio", ".flac": "audio",
+}
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+_PROCESSING, _FAILED = "(processing...)", "(failed processing)"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def guess_source_type(filename: str) -> Optional[str]:
+    return SOURCE_TYPES_BY_EXT.get(os.path.splitext(filename)[1].lower())
+
+
+def _safe_name(filename: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.basename(filename)).lstrip(".")
+    return name[-120:] or "upload"
+
+
+class Upload:
+    """One file being received: write() chunks, then commit() (or abort())."""
+
+    def __init__(self, filename: str, source_type: str, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.job_id = uuid.uuid4().hex
+        self.source_type = source_type
+        self.max_bytes = max_bytes
+        folder = UPLOAD_DIR / source_type
+        folder.mkdir(parents=True, exist_ok=True)
+        self.path = str(folder / f"{self.job_id}__{_safe_name(filename)}")
+        self.bytes = 0
+        self._file = open(f"{self.path}.part", "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.bytes += len(chunk)
+        if self.bytes > self.max_bytes:
+            raise UploadTooLarge(f"upload exceeds {self.max_bytes} bytes")
+        self._file.write(chunk)
+
+    def commit(self) -> Dict[str, Any]:
+        self._file.close()
+        os.replace(f"{self.path}.part", self.path)
+        job_queue.enqueue(self.path, self.source_type, priority=INGEST_UPLOAD_PRIORITY)
+        return upload_status(self.job_id)
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.remove(f"{self.path}.part")
+        except OSError:
+            pass
+
+
+def upload_status(job_id: str) -> Optional[Dict[str, Any]]:
+    """Queue state plus the events created so far; None for an unknown job id."""
+    if not _JOB_ID.fullmatch(job_id):
+        return None
+    matches = [p for p in glob.glob(str(UPLOAD_DIR / "*" / f"{job_id}__*")) if not p.endswith(".part")]
+    if not matches:
+        return None
+    path = normalize_path(matches[0])
+
+    session = SessionLocal()
+    try:
+        job = session.get(IngestJob, path)
+        events = session.query(MemoryEvent.summary_1line, MemoryEvent.metadata_json).filter(
+            MemoryEvent.source_path == path
+        ).all()
+    finally:
+        session.close()
+
+    state = job.state if job else "unknown"
+    processing = sum(1 for summary, _ in events if summary == _PROCESSING)
+    failed = sum(1 for summary, _ in events if summary == _FAILED)
+    if state == "done":
+        progress = 1.0
+    else:
+        # Large PDFs / recordings are stored part by part: pages or seconds done so far
+        done = [m for summary, m in events if summary not in (_PROCESSING, _FAILED) and m]
+        pages = max((m.get("page_end") or 0 for m in done), default=0)
+        total_pages = max((m.get("page_count") or 0 for m in done), default=0)
+        seconds = max((m.get("end_s") or 0 for m in done), default=0)
+        total_s = max((m.get("duration_s") or 0 for m in done), default=0)
+        progress = pages / total_pages if total_pages else (seconds / total_s if total_s else 0.0)
+
+    return {
+        "job_id": job_id,
+        "filename": os.path.basename(matches[0]).split("__", 1)[1],
+        "source_type": job.source_type if job else os.path.basename(os.path.dirname(matches[0])),
+        "bytes": os.path.getsize(matches[0]),
+        "state": state,
+        "attempts": job.attempts if job else 0,
+        "last_error": job.last_error if job else None,
+        "events": len(events),
+        "events_processing": processing,
+        "events_failed": failed,
+        "progress": round(min(progress, 1.0), 3),
+    }
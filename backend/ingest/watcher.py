@@ -3,20 +3,25 @@ import logging
 import os
 import threading
 from pathlib import Path
-from queue import Queue, Empty
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from backend.config import WATCH_DIRS
+from backend.config import WATCH_DIRS, INGEST_CLAIM_BATCH, INGEST_RECONCILE_PRIORITY, SETTLE_QUIET_S
+from backend.database import init_db
 from backend.ingest.processor import IngestionProcessor
+from backend.ingest.pipeline import IngestPipeline
+from backend.ingest.fingerprints import fingerprints
+from backend.ingest.job_queue import job_queue
+from backend.ingest.settle import SettleTracker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Single ingestion queue + single worker = no SQLite "database is locked"
-INGEST_QUEUE: "Queue[tuple[str, str]]" = Queue()
+# Watchdog events -> SETTLE (waits for copies to finish) -> durable job_queue (SQLite) -> pipeline
 STOP_EVENT = threading.Event()
+PIPELINE: IngestPipeline | None = None
+SETTLE = SettleTracker(on_settled=lambda items: job_queue.enqueue_many(items))
 
 
 def _detect_source_type(file_path: str) -> str | None:
@@ -37,82 +42,111 @@ def _detect_source_type(file_path: str) -> str | None:
     return None
 
 
-def _wait_for_file_stability(path: str, timeout: float = 6.0, interval: float = 0.4) -> bool:
-    """
-    Wait until file size is stable (copy completed).
-    Returns True if stable, False if timeout or missing.
-    """
-    start_time = time.time()
-    last_size = -1
+def _is_temp_file(filename: str) -> bool:
+    # Ignore temp/hidden/partial files
+    filename = filename.lower()
+    return filename.startswith("~$") or filename.endswith(".tmp") or filename.startswith(".")
 
-    while time.time() - start_time < timeout:
-        try:
-            if not os.path.exists(path):
-                return False
-            size = os.path.getsize(path)
-            if size == last_size and size > 0:
-                return True
-            last_size = size
-            time.sleep(interval)
-        except OSError:
-            time.sleep(interval)
 
-    return False
+def _reconcile_watch_dirs(batch: int = 500) -> int:
+    """
+    Startup scan: enqueue files that landed (or changed) while the service was
+    down, i.e. whose size/mtime do not match a completed fingerprint.
+    """
+    t0 = time.time()
+    found, pending = 0, []
+    for type_name, folder in WATCH_DIRS.items():
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if _is_temp_file(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                if fingerprints.is_current(path):
+                    continue
+                pending.append((path, type_name))
+                if len(pending) >= batch:
+                    found += len(job_queue.enqueue_many(pending, priority=INGEST_RECONCILE_PRIORITY))
+                    pending = []
+    if pending:
+        found += len(job_queue.enqueue_many(pending, priority=INGEST_RECONCILE_PRIORITY))
+    logger.info(f"Reconciliation scan: {found} new or changed files queued in {time.time()-t0:.2f}s")
+    return found
 
 
-def start_worker(processor: IngestionProcessor) -> None:
+def start_worker(processor: IngestionProcessor) -> IngestPipeline:
     """
-    Start ONE background worker thread that processes queued ingestions sequentially.
-    This eliminates SQLite database locks from concurrent writes.
+    Start the staged ingestion pipeline plus a feeder thread that claims jobs
+    from the durable job_queue in batches and submits them. Files reach the
+    queue only once SETTLE has seen them stop changing, so the feeder never
+    waits on a copy. Parsing and model calls run in parallel; all DB/vector
+    writes stay on the pipeline's single writer, which also marks jobs done/failed.
     """
-    def worker():
-        logger.info("Ingestion worker started (single-threaded DB writes).")
+    global PIPELINE
+    init_db()
+    job_queue.recover()
+    SETTLE.start()
+    PIPELINE = IngestPipeline(processor)
+    PIPELINE.on_complete = job_queue.complete
+    PIPELINE.start()
+
+    def feeder():
+        logger.info("Ingestion feeder started.")
+        _reconcile_watch_dirs()
         while not STOP_EVENT.is_set():
+            job_queue.wakeup.clear()
+            # Only claim for lanes with room, so a saturated audio lane never holds up text
+            rooms = {st: PIPELINE.room(st) for st in PIPELINE.lanes()}
+            open_lanes = [st for st, room in rooms.items() if room > 0]
             try:
-                path, source_type = INGEST_QUEUE.get(timeout=0.5)
-            except Empty:
-                continue
-
-            try:
-                # Ensure file is fully copied before processing
-                if not _wait_for_file_stability(path):
-                    logger.warning(f"File unstable or deleted, skipping: {path}")
-                    continue
-
-                logger.info(f"Worker processing ({source_type}): {path}")
-                processor.process_file(path, source_type)
-
+                claimed = job_queue.claim(min(INGEST_CLAIM_BATCH, sum(rooms.values())), source_types=open_lanes)
             except Exception as e:
-                logger.exception(f"Worker error for {path}: {e}")
-            finally:
-                INGEST_QUEUE.task_done()
-
-        logger.info("Ingestion worker stopped.")
+                logger.exception(f"Could not claim ingest jobs: {e}")
+                claimed = []
+            if not claimed:
+                # New jobs set wakeup; the timeout picks up retries whose backoff expired
+                job_queue.wakeup.wait(timeout=1.0)
+                continue
 
-    threading.Thread(target=worker, daemon=True).start()
+            busy, rejected = [], []
+            for path, source_type in claimed:
+                try:
+                    # Non-blocking recheck (jobs from the startup scan never went through SETTLE)
+                    try:
+                        mtime = os.path.getmtime(path)
+                    except OSError:
+                        logger.warning(f"File deleted before ingestion, dropping: {path}")
+                        job_queue.report([(path, "skipped", None)])
+                        continue
+                    if time.time() - mtime < SETTLE_QUIET_S:
+                        busy.append(path)
+                        continue
+
+                    if not PIPELINE.submit(path, source_type, block=False):
+                        rejected.append(path)  # lane filled up since the claim: backpressure
+                        continue
+                    logger.info(f"Queued for pipeline ({source_type}): {path}")
+
+                except Exception as e:
+                    logger.exception(f"Feeder error for {path}: {e}")
+            if busy:
+                job_queue.release(busy, delay_s=SETTLE_QUIET_S)
+            if rejected:
+                job_queue.release(rejected)
+
+        SETTLE.stop()
+        PIPELINE.stop()
+        logger.info("Ingestion feeder stopped.")
+
+    threading.Thread(target=feeder, daemon=True).start()
+    return PIPELINE
 
 
 class IngestHandler(FileSystemEventHandler):
-    def __init__(self):
-        self.last_processed = {}  # path -> timestamp
-        self.debounce_seconds = 2.0
-        self.lock = threading.Lock()
-
-    def _should_process(self, path: str) -> bool:
-        filename = os.path.basename(path).lower()
+    """Forwards file events to the settle tracker (which also debounces them)."""
 
-        # Ignore temp/hidden/partial files
-        if filename.startswith("~$") or filename.endswith(".tmp") or filename.startswith("."):
-            return False
-
-        now = time.time()
-        with self.lock:
-            last_time = self.last_processed.get(path, 0)
-            if now - last_time < self.debounce_seconds:
-                return False
-            self.last_processed[path] = now
-
-        return True
+    def __init__(self, tracker: SettleTracker = SETTLE):
+        self.tracker = tracker
 
     def on_created(self, event):
         if event.is_directory:
@@ -124,18 +158,24 @@ class IngestHandler(FileSystemEventHandler):
             return
         self._handle_event(event.src_path, "modified")
 
+    def on_moved(self, event):
+        # Downloads/editors often write a temp file and rename it into place
+        if event.is_directory:
+            return
+        self._handle_event(event.dest_path, "moved")
+
     def _handle_event(self, path: str, event_type: str) -> None:
-        if not self._should_process(path):
+        if _is_temp_file(os.path.basename(path)):
             return
 
         source_type = _detect_source_type(path)
         if not source_type:
             return
 
-        logger.info(f"File event ({event_type}): {path} -> queued as {source_type}")
+        logger.debug(f"File event ({event_type}): {path} -> settling as {source_type}")
 
-        # IMPORTANT: enqueue only. Do NOT process in multiple threads.
-        INGEST_QUEUE.put((path, source_type))
+        # IMPORTANT: track only. Settled files go to the durable queue; the pipeline owns all processing.
+        self.tracker.touch(path, source_type)
 
 
 def start_watching():
@@ -153,11 +193,11 @@ def start_watching():
 
     observer.start()
     try:
-        while True:
-            time.sleep(1)
+        while not STOP_EVENT.wait(1):
+            pass
     except KeyboardInterrupt:
         STOP_EVENT.set()
-        observer.stop()
+    observer.stop()
     observer.join()
 
 
@@ -0,0 +1,385 @@
+"""
+Incremental clustering of event vectors, with cached cluster summaries.
+
+A full re-cluster (mini-batch k-means, vectorized with NumPy and FAISS)
+runs when there is no clustering yet, after the vector index was rebuilt
+(reindex, compaction), or once the index has grown by
+CLUSTER_RECLUSTER_GROWTH. In between, each maintenance cycle only assigns
+the vectors added since the last one to their nearest centroid. Centroids and the watermark live in
+{VECTOR_STORE_PATH}.clusters.npz; assignments in MemoryEvent.cluster_id.
+
+A cluster's summary is regenerated only when its membership changed by
+CLUSTER_RESUMMARIZE_FRACTION since it was written (a re-cluster carries
+summaries over to clusters that are mostly the same events). Broad
+questions read these summaries instead of hundreds of events.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+from sqlalchemy import bindparam, func, update
+
+from backend.config import (
+    VECTOR_STORE_PATH,
+    MODEL_MAIN,
+    CLUSTER_MIN_EVENTS,
+    CLUSTER_MAX_K,
+    CLUSTER_BATCH_SIZE,
+    CLUSTER_ITERATIONS,
+    CLUSTER_RECLUSTER_GROWTH,
+    CLUSTER_RESUMMARIZE_FRACTION,
+    CLUSTER_SUMMARY_SAMPLE,
+    CLUSTER_SUMMARIES_PER_RUN,
+    CLUSTER_ROUTE_TOP,
+    CLUSTER_ROUTE_RECENT_DAYS,
+)
+from backend.database import SessionLocal, MemoryEvent, MemoryCluster
+from backend.memory.vector_store import store
+from backend.utils.llm_client import call_llm_json
+from backend.utils.schemas import ClusterSummarySchema
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_ASSIGN_CHUNK = 4096  # vectors assigned per FAISS search
+_RESUMMARIZE_MIN = 3  # never re-summarize for fewer changed members than this
+_SUMMARY_POOL = 2000  # most recent members considered when picking the summary sample
+
+
+def choose_k(n: int) -> int:
+    return int(min(CLUSTER_MAX_K, max(2, round((n / 2) ** 0.5))))
+
+
+def _nearest(centroids: np.ndarray, vectors: np.ndarray):
+    index = faiss.IndexFlatL2(centroids.shape[1])
+    index.add(centroids)
+    distances, labels = index.search(vectors, 1)
+    return distances[:, 0], labels[:, 0]
+
+
+def minibatch_kmeans(sample, n: int, k: int, iterations: int, batch_size: int, seed: int = 0) -> np.ndarray:
+    """
+    Mini-batch k-means (Sculley 2010) over n vectors fetched by sample(ids).
+    k-means++ seeding on a sample; each step moves a centroid towards the
+    mean of its batch members with a 1/count learning rate.
+    """
+    rng = np.random.default_rng(seed)
+    pool = sample(np.sort(rng.choice(n, size=min(n, max(50 * k, batch_size)), replace=False)))
+
+    centroids = np.empty((k, pool.shape[1]), dtype=np.float32)
+    centroids[0] = pool[rng.integers(len(pool))]
+    d2 = ((pool - centroids[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = d2.sum()
+        pick = rng.integers(len(pool)) if total <= 0 else rng.choice(len(pool), p=d2 / total)
+        centroids[c] = pool[pick]
+        d2 = np.minimum(d2, ((pool - centroids[c]) ** 2).sum(axis=1))
+
+    counts = np.zeros(k, dtype=np.float64)
+    for _ in range(iterations):
+        batch = sample(np.sort(rng.choice(n, size=min(n, batch_size), replace=False)))
+        _, labels = _nearest(centroids, batch)
+        m = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        hit = m > 0
+        counts[hit] += m[hit]
+        eta = (m[hit] / counts[hit]).astype(np.float32)[:, None]
+        centroids[hit] = (1 - eta) * centroids[hit] + eta * (sums[hit] / m[hit][:, None])
+    return centroids
+
+
+class MemoryClusterer:
+    def __init__(self):
+        self.state_path = f"{VECTOR_STORE_PATH}.clusters.npz"
+        self._lock = threading.Lock()
+
+    # --------------------
+    # State
+    # --------------------
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with np.load(self.state_path) as data:
+                return {
+                    "centroids": data["centroids"],
+                    "assigned_upto": int(data["assigned_upto"]),
+                    "n_at_recluster": int(data["n_at_recluster"]),
+                    "generation": str(data["generation"]),
+                }
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        tmp = f"{self.state_path}.tmp.npz"
+        np.savez(
+            tmp,
+            centroids=state["centroids"],
+            assigned_upto=state["assigned_upto"],
+            n_at_recluster=state["n_at_recluster"],
+            generation=state["generation"],
+        )
+        os.replace(tmp, self.state_path)
+
+    # --------------------
+    # Maintenance cycle
+    # --------------------
+    def run(self, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Re-cluster or assign new vectors, then refresh a few stale summaries until the deadline."""
+        with self._lock:
+            with store.lock:
+                generation, ntotal = store.generation, store.index.ntotal
+            if ntotal < CLUSTER_MIN_EVENTS:
+                return {"state": "too_few_vectors", "vectors": ntotal}
+
+            state = self._load_state()
+            if (
+                state is None
+                or state["generation"] != generation
+                or state["assigned_upto"] > ntotal
+                or ntotal >= state["n_at_recluster"] * CLUSTER_RECLUSTER_GROWTH
+            ):
+                result = self.recluster(ntotal, generation)
+            else:
+                result = self.assign_new(state, ntotal)
+            result["summarized"] = self.summarize(CLUSTER_SUMMARIES_PER_RUN, deadline)
+            return result
+
+    def recluster(self, ntotal: int, generation: str) -> Dict[str, Any]:
+        k = choose_k(ntotal)
+        centroids = minibatch_kmeans(_sample_vectors, ntotal, k, CLUSTER_ITERATIONS, CLUSTER_BATCH_SIZE)
+        labels = np.empty(ntotal, dtype=np.int64)
+        for start in range(0, ntotal, _ASSIGN_CHUNK):
+            n = min(_ASSIGN_CHUNK, ntotal - start)
+            _, labels[start : start + n] = _nearest(centroids, _range_vectors(start, n))
+
+        # Drop empty clusters and renumber densely
+        used = np.unique(labels)
+        centroids = centroids[used]
+        labels = np.searchsorted(used, labels)
+
+        with store.lock:
+            id_map = dict(store.id_map)
+        assignment = {id_map[i]: int(labels[i]) for i in range(ntotal) if i in id_map}
+        self._write_clusters(assignment, len(used))
+        self._save_state({
+            "centroids": centroids, "assigned_upto": ntotal, "n_at_recluster": ntotal, "generation": generation,
+        })
+        logger.info(f"Clustering: {ntotal} vectors into {len(used)} clusters (k={k})")
+        return {"state": "reclustered", "vectors": ntotal, "clusters": len(used)}
+
+    def assign_new(self, state: Dict[str, Any], ntotal: int) -> Dict[str, Any]:
+        start = state["assigned_upto"]
+        if start >= ntotal:
+            return {"state": "up_to_date", "vectors": ntotal, "clusters": len(state["centroids"])}
+        with store.lock:
+            id_map = dict(store.id_map)
+        assignment = {}
+        for chunk in range(start, ntotal, _ASSIGN_CHUNK):
+            n = min(_ASSIGN_CHUNK, ntotal - chunk)
+            _, labels = _nearest(state["centroids"], _range_vectors(chunk, n))
+            for offset, label in enumerate(labels):
+                event_id = id_map.get(chunk + offset)
+                if event_id is not None:
+                    assignment[event_id] = int(label)
+
+        session = SessionLocal()
+        try:
+            _set_cluster_ids(session, assignment)
+            for cluster_id, n in Counter(assignment.values()).items():
+                session.execute(
+                    update(MemoryCluster)
+                    .where(MemoryCluster.id == cluster_id)
+                    .values(size=MemoryCluster.size + n, changed=MemoryCluster.changed + n, last_event_at=datetime.utcnow())
+                )
+            session.commit()
+        finally:
+            session.close()
+        state["assigned_upto"] = ntotal
+        self._save_state(state)
+        return {"state": "assigned", "vectors": ntotal, "assigned": len(assignment), "clusters": len(state["centroids"])}
+
+    def _write_clusters(self, assignment: Dict[str, int], k: int) -> None:
+        """Replace cluster rows and assignments, carrying summaries over to near-identical clusters."""
+        session = SessionLocal()
+        try:
+            old_assignment = dict(
+                session.query(MemoryEvent.id, MemoryEvent.cluster_id).filter(MemoryEvent.cluster_id.isnot(None))
+            )
+            old_clusters = {c.id: c for c in session.query(MemoryCluster)}
+            old_sizes = Counter(old_assignment.values())
+            new_sizes = Counter(assignment.values())
+            overlap = Counter(
+                (label, old_assignment[event_id]) for event_id, label in assignment.items() if event_id in old_assignment
+            )
+
+            carried, taken = {}, set()
+            for (label, old_id), common in overlap.most_common():
+                if label in carried or old_id in taken or old_id not in old_clusters:
+                    continue
+                union = new_sizes[label] + old_sizes[old_id] - common
+                if common / union >= 1 - CLUSTER_RESUMMARIZE_FRACTION:
+                    carried[label] = (old_clusters[old_id], union - common)
+                    taken.add(old_id)
+
+            rows = []
+            for label in range(k):
+                row = {"id": label, "size": new_sizes.get(label, 0), "label": None, "summary": None,
+                       "summary_size": 0, "changed": new_sizes.get(label, 0), "summarized_at": None, "last_event_at": None}
+                if label in carried:
+                    old, churn = carried[label]
+                    row.update(label=old.label, summary=old.summary, summary_size=old.summary_size,
+                               changed=old.changed + churn, summarized_at=old.summarized_at)
+                rows.append(row)
+
+            session.query(MemoryCluster).delete(synchronize_session=False)
+            if rows:
+                session.execute(MemoryCluster.__table__.insert(), rows)
+            changed = {event_id: label for event_id, label in assignment.items() if old_assignment.get(event_id) != label}
+            stale = [event_id for event_id in old_assignment if event_id not in assignment]
+            _set_cluster_ids(session, changed)
+            for i in range(0, len(stale), 500):
+                session.query(MemoryEvent).filter(MemoryEvent.id.in_(stale[i : i + 500])).update(
+                    {MemoryEvent.cluster_id: None}, synchronize_session=False
+                )
+            session.flush()
+            last_at = dict(
+                session.query(MemoryEvent.cluster_id, func.max(MemoryEvent.created_at))
+                .filter(MemoryEvent.cluster_id.isnot(None))
+                .group_by(MemoryEvent.cluster_id)
+            )
+            if last_at:
+                table = MemoryCluster.__table__
+                session.execute(
+                    table.update().where(table.c.id == bindparam("cid")).values(last_event_at=bindparam("at")),
+                    [{"cid": cid, "at": at} for cid, at in last_at.items()],
+                )
+            session.commit()
+            logger.info(f"Clustering: {len(changed)} assignments changed, {len(carried)}/{k} summaries carried over")
+        finally:
+            session.close()
+
+    # --------------------
+    # Summaries
+    # --------------------
+    def summarize(self, limit: int, deadline: Optional[float] = None) -> int:
+        """
+        Regenerate up to `limit` missing or materially stale summaries, largest clusters
+        first. Each one is an LLM call, so none is started once `deadline` has passed.
+        """
+        session = SessionLocal()
+        try:
+            threshold = func.max(_RESUMMARIZE_MIN, MemoryCluster.summary_size * CLUSTER_RESUMMARIZE_FRACTION)
+            stale = (
+                session.query(MemoryCluster)
+                .filter(MemoryCluster.size > 0)
+                .filter((MemoryCluster.summary.is_(None)) | (MemoryCluster.changed >= threshold))
+                .order_by(MemoryCluster.size.desc())
+                .limit(limit)
+                .all()
+            )
+            state = self._load_state()
+            done = 0
+            for cluster in stale:
+                if state is None or cluster.id >= len(state["centroids"]):
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    break
+                sample = self._summary_sample(session, cluster.id, state["centroids"][cluster.id])
+                if not sample:
+                    continue
+                bullets = "\n".join(f"- {line}" for line in sample)
+                data = call_llm_json(
+                    MODEL_MAIN,
+                    "These notes belong to one theme of the user's memories:\n"
+                    f"{bullets}\n\n"
+                    "Return a short label (max 6 words) for the theme and a 2-4 sentence summary "
+                    "of what it covers.",
+                    ClusterSummarySchema,
+                    task="cluster_summary",
+                )
+                if data is None:
+                    continue
+                cluster.label = data["label"][:200]
+                cluster.summary = data["summary"]
+                cluster.summary_size = cluster.size
+                cluster.changed = 0
+                cluster.summarized_at = datetime.utcnow()
+                session.commit()
+                done += 1
+            return done
+        finally:
+            session.close()
+
+    def _summary_sample(self, session, cluster_id: int, centroid: np.ndarray) -> List[str]:
+        """One-line summaries of the members nearest the centroid (among the most recent ones)."""
+        members = (
+            session.query(MemoryEvent.embedding_ref, MemoryEvent.summary_1line)
+            .filter(MemoryEvent.cluster_id == cluster_id, MemoryEvent.embedding_ref.isnot(None))
+            .order_by(MemoryEvent.created_at.desc())
+            .limit(_SUMMARY_POOL)
+            .all()
+        )
+        members = [(int(ref), line) for ref, line in members if ref.isdigit() and line]
+        if not members:
+            return []
+        vectors = _sample_vectors(np.array([ref for ref, _ in members], dtype=np.int64))
+        order = np.argsort(((vectors - centroid) ** 2).sum(axis=1))[:CLUSTER_SUMMARY_SAMPLE]
+        return [members[i][1] for i in order]
+
+
+def _sample_vectors(ids: np.ndarray) -> np.ndarray:
+    with store.lock:  # add_events appends to the same index
+        return store.index.reconstruct_batch(ids)
+
+
+def _range_vectors(start: int, n: int) -> np.ndarray:
+    with store.lock:
+        return store.index.reconstruct_n(start, n)
+
+
+def _set_cluster_ids(session, assignment: Dict[str, int]) -> None:
+    if not assignment:
+        return
+    table = MemoryEvent.__table__
+    session.execute(
+        table.update().where(table.c.id == bindparam("eid")).values(cluster_id=bindparam("cid")),
+        [{"eid": event_id, "cid": cluster_id} for event_id, cluster_id in assignment.items()],
+    )
+
+
+def cluster_summaries(session, limit: int = CLUSTER_ROUTE_TOP, recent_days: int = CLUSTER_ROUTE_RECENT_DAYS) -> List[Dict[str, Any]]:
+    """
+    Summarized clusters as retrieval documents, the most active recently
+    first (then by size), for broad questions.
+    """
+    since = datetime.utcnow() - timedelta(days=recent_days)
+    recent = dict(
+        session.query(MemoryEvent.cluster_id, func.count())
+        .filter(MemoryEvent.created_at >= since, MemoryEvent.cluster_id.isnot(None))
+        .group_by(MemoryEvent.cluster_id)
+    )
+    clusters = session.query(MemoryCluster).filter(MemoryCluster.summary.isnot(None)).all()
+    clusters.sort(key=lambda c: (recent.get(c.id, 0), c.size or 0), reverse=True)
+    return [
+        {
+            "id": f"cluster:{c.id}",
+            "score": 1.0,
+            "distance": None,
+            "summary": c.label,
+            "text": f"{c.label}: {c.summary} ({c.size} memories, {recent.get(c.id, 0)} in the last {recent_days} days)",
+            "created_at": c.last_event_at.isoformat() if c.last_event_at else None,
+            "source_type": "cluster",
+            "entities": [],
+        }
+        for c in clusters[:limit]
+    ]
+
+
+# Singleton run by the maintenance scheduler (backend.maintenance.jobs)
+clusterer = MemoryClusterer()
@@ -0,0 +1,167 @@
+"""
+Built-in SQLite and FAISS housekeeping jobs for the maintenance scheduler.
+
+Each job takes a deadline (time.time() value) and returns a detail dict
+for the run history. Long jobs work in steps and stop at the deadline.
+"""
+import logging
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+from sqlalchemy import bindparam
+
+from backend.config import (
+    ANALYZE_LIMIT_ROWS,
+    VACUUM_PAGES_PER_STEP,
+    VACUUM_FULL_MIN_FREE_FRACTION,
+    VECTOR_COMPACT_MIN_ORPHAN_FRACTION,
+)
+from backend.database import engine, SessionLocal, MemoryEvent
+from backend.memory.vector_store import store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_RECONSTRUCT_CHUNK = 4096
+_INFLIGHT_WINDOW = 1024  # newest vectors whose missing embedding_ref may still be committing
+
+
+def _autocommit():
+    # Checkpoints and VACUUM cannot run inside a transaction
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def wal_checkpoint(deadline: float) -> Dict[str, Any]:
+    """Fold the WAL back into the database and truncate it (PASSIVE if readers are in the way)."""
+    with _autocommit() as conn:
+        busy, log_pages, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+        mode = "truncate"
+        if busy:
+            busy, log_pages, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").one()
+            mode = "passive"
+    return {"mode": mode, "busy": bool(busy), "wal_pages": log_pages, "checkpointed": checkpointed}
+
+
+def analyze(deadline: float) -> Dict[str, Any]:
+    """Refresh planner statistics, sampled (analysis_limit) so the cost stays bounded on large tables."""
+    with _autocommit() as conn:
+        conn.exec_driver_sql(f"PRAGMA analysis_limit={int(ANALYZE_LIMIT_ROWS)}")
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql("PRAGMA optimize")
+    return {"analysis_limit": ANALYZE_LIMIT_ROWS}
+
+
+def incremental_vacuum(deadline: float) -> Dict[str, Any]:
+    """
+    Return free pages to the filesystem, VACUUM_PAGES_PER_STEP at a time until
+    the deadline. Databases created before auto_vacuum=INCREMENTAL get one full
+    VACUUM (which also switches the mode) once enough of the file is free.
+    """
+    with _autocommit() as conn:
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if mode != 2:  # 0 = none, 1 = full, 2 = incremental
+            if page_count and free / page_count >= VACUUM_FULL_MIN_FREE_FRACTION:
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+                after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+                return {"mode": "full", "pages_before": page_count, "pages_after": after}
+            return {"mode": "skipped", "free_pages": free, "page_count": page_count}
+
+        freed = 0
+        while free > 0 and time.time() < deadline:
+            conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(VACUUM_PAGES_PER_STEP)})")
+            remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            freed += free - remaining
+            if remaining >= free:
+                break
+            free = remaining
+    return {"mode": "incremental", "freed_pages": freed, "free_pages": free}
+
+
+def compact_vectors(deadline: float) -> Dict[str, Any]:
+    """
+    Rebuild the vector index without orphaned vectors (events deleted or
+    re-embedded elsewhere), once they reach VECTOR_COMPACT_MIN_ORPHAN_FRACTION.
+    Renumbers internal ids, so embedding_ref is rewritten first and only the
+    in-memory swap happens under the store lock (see VectorStore.rebuild_lock).
+    """
+    with store.lock:
+        ntotal = store.index.ntotal
+        id_map = dict(store.id_map)
+    if not ntotal:
+        return {"vectors": 0, "orphans": 0}
+
+    refs = _live_refs()
+    orphans = [i for i in range(ntotal) if refs.get(id_map.get(i), "missing") not in (str(i), None)]
+    if len(orphans) < ntotal * VECTOR_COMPACT_MIN_ORPHAN_FRACTION:
+        return {"vectors": ntotal, "orphans": len(orphans), "compacted": False}
+    if time.time() >= deadline:
+        return {"vectors": ntotal, "orphans": len(orphans), "compacted": False, "reason": "budget"}
+
+    with store.rebuild_lock:
+        # Re-check against the current state; vectors appended after this snapshot are moved over at the swap
+        with store.lock:
+            ntotal, id_map = store.index.ntotal, dict(store.id_map)
+        refs = _live_refs()
+        keep: List[int] = []
+        for i in range(ntotal):
+            ref = refs.get(id_map.get(i), "missing")
+            if ref is None and i >= ntotal - _INFLIGHT_WINDOW:
+                # A recent vector whose embedding_ref is not committed yet (ingest in flight)
+                return {"vectors": ntotal, "orphans": len(orphans), "compacted": False, "reason": "ingest in flight"}
+            if ref is None or ref == str(i):
+                keep.append(i)  # an old vector without a ref gets its ref repaired below
+
+        index = faiss.IndexFlatL2(store.dimension)
+        for start in range(0, len(keep), _RECONSTRUCT_CHUNK):
+            ids = np.array(keep[start : start + _RECONSTRUCT_CHUNK], dtype=np.int64)
+            with store.lock:  # add_events appends to the same index
+                index.add(store.index.reconstruct_batch(ids))
+        new_map = {new: id_map[old] for new, old in enumerate(keep)}
+        _write_refs(new_map)
+
+        with store.lock:
+            # Appended by ingestion since the snapshot: keep them, after the compacted vectors
+            tail = {}
+            if store.index.ntotal > ntotal:
+                index.add(store.index.reconstruct_n(ntotal, store.index.ntotal - ntotal))
+                for offset, old in enumerate(range(ntotal, store.index.ntotal)):
+                    tail[len(keep) + offset] = store.id_map.get(old)
+            new_map.update(tail)
+            store.replace(index, new_map, len(new_map), store.embedding_version)
+        # Their writer commits its embedding_ref before this UPDATE gets the SQLite write lock
+        _write_refs({new: event_id for new, event_id in tail.items() if event_id is not None})
+
+    logger.info(f"Vector store compacted: {ntotal} -> {len(keep)} vectors")
+    return {"vectors": ntotal, "orphans": ntotal - len(keep), "compacted": True, "kept": len(keep), "appended": len(tail)}
+
+
+def _write_refs(new_map: Dict[int, str]) -> None:
+    if not new_map:
+        return
+    session = SessionLocal()
+    try:
+        table = MemoryEvent.__table__
+        session.execute(
+            table.update().where(table.c.id == bindparam("eid")).values(embedding_ref=bindparam("ref")),
+            [{"eid": event_id, "ref": str(new)} for new, event_id in new_map.items()],
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _live_refs() -> Dict[str, Any]:
+    """event_id -> embedding_ref for every event (None when not indexed yet)."""
+    session = SessionLocal()
+    try:
+        return dict(session.query(MemoryEvent.id, MemoryEvent.embedding_ref))
+    finally:
+        session.close()
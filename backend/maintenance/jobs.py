@@ -1,47 +1,247 @@
 import time
 import logging
 import threading
-from backend.database import SessionLocal, MemoryEvent
-from backend.utils.llm_client import call_llm
-from backend.config import MODEL_MAIN
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from sqlalchemy import func
+
+from backend.config import (
+    MAINT_TICK_S,
+    MAINT_IDLE_MAX_INGEST_JOBS,
+    MAINT_IDLE_MAX_QUERIES_PER_MIN,
+    MAINT_HISTORY_PER_JOB,
+    CLUSTER_EVERY_S,
+    WAL_CHECKPOINT_EVERY_S,
+    ANALYZE_EVERY_S,
+    VACUUM_EVERY_S,
+    VECTOR_COMPACT_EVERY_S,
+)
+from backend.database import SessionLocal, MaintenanceRun
+from backend.ingest.job_queue import job_queue
+from backend.maintenance.clustering import clusterer
+from backend.maintenance import housekeeping
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class MaintenanceJob:
-    def __init__(self, interval_minutes=60):
-        self.interval = interval_minutes * 60
+
+class ScheduledJob:
+    def __init__(self, name: str, func: Callable[[float], Dict[str, Any]], every_s: float, budget_s: float,
+                 idle_only: bool = True):
+        self.name = name
+        self.func = func  # func(deadline) -> detail dict; should stop working at the deadline
+        self.every_s = every_s
+        self.budget_s = budget_s
+        self.idle_only = idle_only
+        self.next_run = 0.0
+        self.last: Optional[Dict[str, Any]] = None
+        self.deferred = 0  # ticks skipped because the system was busy
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "every_s": self.every_s,
+            "budget_s": self.budget_s,
+            "idle_only": self.idle_only,
+            "next_run_in_s": max(0, round(self.next_run - time.time())),
+            "deferred": self.deferred,
+            "last": self.last,
+        }
+
+
+class MaintenanceScheduler:
+    """
+    Runs registered jobs on their own cadence from one background thread.
+    An idle_only job is held back while ingestion has queued work or the
+    /query rate is above MAINT_IDLE_MAX_QUERIES_PER_MIN, and runs at the
+    first idle tick once due. Each run gets a time budget (passed to the job
+    as a deadline) and is recorded in maintenance_runs with wall and CPU time.
+    """
+
+    def __init__(self, tick_s: float = MAINT_TICK_S):
+        self.tick_s = tick_s
+        self.jobs: Dict[str, ScheduledJob] = {}
         self.running = False
-        
+        self._lock = threading.Lock()  # one job at a time (thread or run_now)
+        self._queries: Deque[float] = deque()  # /query timestamps, last minute
+        self._queries_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def register(self, name: str, func: Callable[[float], Dict[str, Any]], every_s: float, budget_s: float,
+                 idle_only: bool = True) -> None:
+        self.jobs[name] = ScheduledJob(name, func, every_s, budget_s, idle_only)
+
     def start(self):
+        self._restore_schedule()
         self.running = True
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread = threading.Thread(target=self._run_loop, name="maintenance", daemon=True)
         self.thread.start()
-        
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
+
+    # --------------------
+    # Load signals
+    # --------------------
+    def note_query(self) -> None:
+        """Called per user query; feeds the idle rule."""
+        with self._queries_lock:
+            self._queries.append(time.time())
+
+    def queries_per_min(self) -> int:
+        cutoff = time.time() - 60
+        with self._queries_lock:
+            while self._queries and self._queries[0] < cutoff:
+                self._queries.popleft()
+            return len(self._queries)
+
+    def busy_reason(self) -> Optional[str]:
+        """Why idle_only jobs must wait, or None when the system is idle."""
+        queue = job_queue.stats()
+        backlog = queue["pending"] + queue["running"]
+        if backlog > MAINT_IDLE_MAX_INGEST_JOBS:
+            return f"ingest backlog {backlog}"
+        qpm = self.queries_per_min()
+        if qpm > MAINT_IDLE_MAX_QUERIES_PER_MIN:
+            return f"{qpm} queries/min"
+        return None
+
+    # --------------------
+    # Loop
+    # --------------------
     def _run_loop(self):
-        logger.info("Starting maintenance job cycle...")
+        logger.info(f"Maintenance scheduler started: {', '.join(self.jobs)}")
         while self.running:
             try:
-                self._cluster_and_summarize()
+                self._tick()
             except Exception as e:
-                logger.error(f"Maintenance job error: {e}")
-            time.sleep(self.interval)
-            
-    def _cluster_and_summarize(self):
-        # 1. Fetch recent un-summarized events (placeholder logic)
+                logger.error(f"Maintenance scheduler error: {e}")
+            self._wakeup.wait(self.tick_s)
+
+    def _tick(self):
+        now = time.time()
+        due = sorted((job for job in self.jobs.values() if job.next_run <= now), key=lambda j: j.next_run)
+        if not due:
+            return
+        busy = None
+        for job in due:
+            if not self.running:
+                return
+            if job.idle_only:
+                busy = busy or self.busy_reason()
+                if busy:
+                    job.deferred += 1
+                    continue
+            self._execute(job)
+
+    def run_now(self, name: str) -> Dict[str, Any]:
+        """Run a job immediately, ignoring its cadence and the idle rule."""
+        job = self.jobs.get(name)
+        if job is None:
+            raise KeyError(name)
+        return self._execute(job)
+
+    def _execute(self, job: ScheduledJob) -> Dict[str, Any]:
+        with self._lock:
+            started = datetime.utcnow()
+            t0, cpu0 = time.time(), time.thread_time()
+            try:
+                detail = job.func(t0 + job.budget_s) or {}
+                status = "ok"
+            except Exception as e:
+                logger.exception(f"Maintenance job {job.name} failed: {e}")
+                detail, status = {"error": str(e)}, "error"
+            duration, cpu = time.time() - t0, time.thread_time() - cpu0
+            job.next_run = time.time() + job.every_s
+            if duration > job.budget_s:
+                logger.warning(f"Maintenance job {job.name} overran its budget: {duration:.1f}s > {job.budget_s}s")
+            job.last = {
+                "started_at": started.isoformat(), "duration_s": round(duration, 3), "cpu_s": round(cpu, 3),
+                "status": status, "detail": detail,
+            }
+            logger.info(f"Maintenance job {job.name} {status} in {duration:.2f}s: {detail}")
+            self._record(job.name, started, duration, cpu, status, detail)
+            return job.last
+
+    # --------------------
+    # History
+    # --------------------
+    def _record(self, name: str, started: datetime, duration: float, cpu: float, status: str,
+                detail: Dict[str, Any]) -> None:
         session = SessionLocal()
         try:
-            # Simple heuristic: find events from last hour
-            # For hackathon demo, maybe just log that we are 'consolidating'
-            logger.info("Running consolidation job: clustering recent memories...")
-            
-            # Real implementation would cluster vectors here
-            # For now, just a dummy operation to show activity
-            count = session.query(MemoryEvent).count()
-            logger.info(f"Total memories available for clustering: {count}")
-            
+            session.add(MaintenanceRun(
+                job=name, started_at=started, duration_s=duration, cpu_s=cpu, status=status, detail=detail,
+            ))
+            session.flush()
+            cutoff = (
+                session.query(MaintenanceRun.id)
+                .filter(MaintenanceRun.job == name)
+                .order_by(MaintenanceRun.started_at.desc())
+                .offset(MAINT_HISTORY_PER_JOB)
+                .limit(1)
+                .scalar()
+            )
+            if cutoff is not None:
+                session.query(MaintenanceRun).filter(
+                    MaintenanceRun.job == name, MaintenanceRun.id <= cutoff
+                ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Could not record maintenance run {name}: {e}")
         finally:
             session.close()
 
-# Singleton
-job_runner = MaintenanceJob(interval_minutes=5) # Run every 5 mins for demo visibility
+    def _restore_schedule(self) -> None:
+        """Cadence survives restarts: next run = last successful run + interval."""
+        session = SessionLocal()
+        try:
+            last = dict(
+                session.query(MaintenanceRun.job, func.max(MaintenanceRun.started_at))
+                .filter(MaintenanceRun.status == "ok")
+                .group_by(MaintenanceRun.job)
+            )
+        finally:
+            session.close()
+        for name, job in self.jobs.items():
+            if name in last:
+                job.next_run = (last[name] + timedelta(seconds=job.every_s) - datetime.utcnow()).total_seconds() + time.time()
+
+    def history(self, name: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        session = SessionLocal()
+        try:
+            query = session.query(MaintenanceRun)
+            if name:
+                query = query.filter(MaintenanceRun.job == name)
+            rows = query.order_by(MaintenanceRun.started_at.desc()).limit(limit).all()
+            return [{
+                "job": r.job,
+                "started_at": r.started_at.isoformat() if r.started_at else None,
+                "duration_s": r.duration_s,
+                "cpu_s": r.cpu_s,
+                "status": r.status,
+                "detail": r.detail,
+            } for r in rows]
+        finally:
+            session.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {"busy": self.busy_reason(), "jobs": [job.status() for job in self.jobs.values()]}
+
+
+def _cluster_and_summarize(deadline: float) -> Dict[str, Any]:
+    """Assign new vectors to clusters (or re-cluster) and refresh stale cluster summaries."""
+    return clusterer.run(deadline)
+
+
+# Singleton with the built-in jobs
+job_runner = MaintenanceScheduler()
+job_runner.register("cluster_and_summarize", _cluster_and_summarize, every_s=CLUSTER_EVERY_S, budget_s=120)
+job_runner.register("wal_checkpoint", housekeeping.wal_checkpoint, every_s=WAL_CHECKPOINT_EVERY_S, budget_s=10)
+job_runner.register("analyze", housekeeping.analyze, every_s=ANALYZE_EVERY_S, budget_s=60)
+job_runner.register("incremental_vacuum", housekeeping.incremental_vacuum, every_s=VACUUM_EVERY_S, budget_s=30)
+job_runner.register("compact_vectors", housekeeping.compact_vectors, every_s=VECTOR_COMPACT_EVERY_S, budget_s=120)
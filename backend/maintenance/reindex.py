@@ -0,0 +1,336 @@
+"""
+Online re-embedding: rebuild the vector index after EMBEDDING_VERSION
+changes (new MODEL_EMBEDDING, new embedded-text recipe, new endpoint).
+
+Events are streamed from SQLite in keyset pages and re-embedded
+concurrently into a new index written next to the live one, while queries
+keep using the live index. At the end, events ingested meanwhile are caught
+up, embedding_ref is rewritten and the new index is swapped in atomically.
+The partial index and a cursor are checkpointed, so a crash resumes.
+
+    python -m backend.maintenance.reindex [--rate 50] [--restart]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+import pickle
+from sqlalchemy import func
+
+from backend.config import (
+    VECTOR_STORE_PATH,
+    EMBEDDING_VERSION,
+    REINDEX_BATCH_SIZE,
+    REINDEX_CONCURRENCY,
+    REINDEX_MAX_EVENTS_PER_S,
+    REINDEX_CHECKPOINT_BATCHES,
+)
+from backend.database import SessionLocal, MemoryEvent
+from backend.ingest.processor import IngestionProcessor
+from backend.memory.vector_store import store, write_index_files, claim_store, StoreInUse
+from backend.utils.llm_client import call_embed_batch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_SUMMARIES = ("(processing...)", "(failed processing)")
+_EMBED_PREFIX_CHARS = 800  # the embedded text only uses the start of raw_text
+_CATCH_UP_PASSES = 5
+
+
+def _embedding_text(summary_1line: Optional[str], summary_short: Optional[str], raw_prefix: Optional[str]) -> str:
+    """Same recipe as ingestion (IngestionProcessor.embedding_text), from stored columns."""
+    bullets = [b for b in (summary_short or "").split("\n") if b]
+    return IngestionProcessor.embedding_text(
+        {"metadata": {"summary_1line": summary_1line or "No summary available.", "summary_bullets": bullets},
+         "content": raw_prefix or ""}
+    )
+
+
+class ReindexJob:
+    def __init__(
+        self,
+        batch_size: int = REINDEX_BATCH_SIZE,
+        concurrency: int = REINDEX_CONCURRENCY,
+        max_rate: float = REINDEX_MAX_EVENTS_PER_S,
+        checkpoint_every: int = REINDEX_CHECKPOINT_BATCHES,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_rate = max_rate
+        self.checkpoint_every = max(1, checkpoint_every)
+
+        self.index_path = f"{VECTOR_STORE_PATH}.next.index"
+        self.mapping_path = f"{VECTOR_STORE_PATH}.next.pkl"
+        self.state_path = f"{VECTOR_STORE_PATH}.reindex.json"
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.progress: Dict[str, Any] = {"state": "idle"}
+
+    # --------------------
+    # Control
+    # --------------------
+    def start(self, restart: bool = False) -> bool:
+        """Run in a background thread. Returns False if a reindex is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self.run, kwargs={"restart": restart}, name="reindex", daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.progress)
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self.progress.update(fields)
+
+    # --------------------
+    # Job
+    # --------------------
+    def run(self, restart: bool = False) -> Dict[str, Any]:
+        t0 = time.time()
+        try:
+            index, id_map, cursor, done = self._resume(restart)
+            session = SessionLocal()
+            try:
+                total = self._eligible(session.query(func.count(MemoryEvent.id))).scalar()
+            finally:
+                session.close()
+            self._update(state="running", version=EMBEDDING_VERSION, done=done, total=total, started_at=t0, error=None)
+            logger.info(f"[REINDEX] start version={EMBEDDING_VERSION} total={total} resumed_at={done}")
+
+            pages = 0
+            started_done, t_rate = done, time.time()
+            while True:
+                rows = self._page(cursor)
+                if not rows:
+                    break
+                index = self._add(index, id_map, rows)
+                cursor, done = rows[-1][0], done + len(rows)
+                pages += 1
+
+                elapsed = time.time() - t_rate
+                rate = (done - started_done) / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate and total > done else 0.0
+                self._update(done=done, rate=round(rate, 1), eta_s=round(eta))
+                logger.info(f"[REINDEX] {done}/{total} rate={rate:.1f}/s eta={eta:.0f}s")
+
+                if pages % self.checkpoint_every == 0:
+                    self._checkpoint(index, id_map, cursor, done)
+                self._throttle(done - started_done, t_rate)
+
+            self._update(state="swapping")
+            self._swap(index, id_map)
+            self._clear_checkpoint()
+            result = {"state": "done", "done": len(id_map), "seconds": round(time.time() - t0, 1)}
+            self._update(**result)
+            logger.info(f"[REINDEX] done events={len(id_map)} dt={time.time()-t0:.1f}s")
+            return result
+        except Exception as e:
+            logger.exception(f"Reindex failed (resumable from the last checkpoint): {e}")
+            self._update(state="failed", error=str(e))
+            return self.status()
+
+    def _eligible(self, query):
+        return query.filter(MemoryEvent.summary_1line.notin_(_PLACEHOLDER_SUMMARIES))
+
+    def _page(self, cursor: str) -> List[Tuple[str, str, str, str]]:
+        """Next keyset page, reading only the raw_text prefix the recipe needs."""
+        session = SessionLocal()
+        try:
+            q = session.query(
+                MemoryEvent.id,
+                MemoryEvent.summary_1line,
+                MemoryEvent.summary_short,
+                func.substr(MemoryEvent.raw_text, 1, _EMBED_PREFIX_CHARS),
+            )
+            return self._eligible(q).filter(MemoryEvent.id > cursor).order_by(MemoryEvent.id).limit(self.batch_size).all()
+        finally:
+            session.close()
+
+    def _rows_for(self, event_ids: List[str]) -> List[Tuple[str, str, str, str]]:
+        session = SessionLocal()
+        try:
+            rows = []
+            for i in range(0, len(event_ids), self.batch_size):
+                rows.extend(
+                    session.query(
+                        MemoryEvent.id,
+                        MemoryEvent.summary_1line,
+                        MemoryEvent.summary_short,
+                        func.substr(MemoryEvent.raw_text, 1, _EMBED_PREFIX_CHARS),
+                    ).filter(MemoryEvent.id.in_(event_ids[i : i + self.batch_size]))
+                )
+            return rows
+        finally:
+            session.close()
+
+    def _add(self, index, id_map: Dict[int, str], rows) -> Any:
+        """Embed rows concurrently (sub-batches per worker) and append them to the new index."""
+        texts = [_embedding_text(summary, short, prefix) for _, summary, short, prefix in rows]
+        size = max(1, -(-len(texts) // self.concurrency))
+        chunks = [texts[i : i + size] for i in range(0, len(texts), size)]
+        with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="reindex-embed") as pool:
+            vectors = [v for part in pool.map(call_embed_batch, chunks) for v in part]
+
+        valid = [(row[0], v) for row, v in zip(rows, vectors) if v]
+        if not valid:
+            return index
+        if index is None:
+            index = faiss.IndexFlatL2(len(valid[0][1]))
+        valid = [(event_id, v) for event_id, v in valid if len(v) == index.d]
+        index.add(np.array([v for _, v in valid], dtype=np.float32))
+        next_id = len(id_map)
+        for offset, (event_id, _) in enumerate(valid):
+            id_map[next_id + offset] = event_id
+        return index
+
+    def _throttle(self, processed: int, t_start: float) -> None:
+        if self.max_rate <= 0:
+            return
+        ahead = processed / self.max_rate - (time.time() - t_start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def _swap(self, index, id_map: Dict[int, str]) -> None:
+        # Embedding and the embedding_ref writes happen outside store.lock (see
+        # VectorStore.rebuild_lock); under it we only swap the in-memory index.
+        with store.rebuild_lock:
+            # Catch up on events the live path indexed after our cursor passed them
+            index = self._catch_up(index, id_map)
+            if index is None:
+                index = faiss.IndexFlatL2(store.dimension)
+            self._write_refs({event_id: str(i) for i, event_id in id_map.items()}, reset=True)
+
+            with store.lock:
+                late = self._missing(id_map)
+                store.replace(index, dict(id_map), len(id_map), EMBEDDING_VERSION)
+            late = sorted(set(late) | set(self._unindexed(id_map)))
+            if late:
+                # Indexed live between the last catch-up and the swap: embed them into the new index now
+                logger.info(f"[REINDEX] adding {len(late)} events ingested during the swap")
+                self._add_late(late)
+
+    def _missing(self, id_map: Dict[int, str]) -> List[str]:
+        indexed = set(id_map.values())
+        with store.lock:
+            return [event_id for event_id in set(store.id_map.values()) if event_id not in indexed]
+
+    def _unindexed(self, id_map: Dict[int, str]) -> List[str]:
+        """Eligible events without a vector, e.g. held back while the live index was stale."""
+        indexed = set(id_map.values())
+        session = SessionLocal()
+        try:
+            q = self._eligible(session.query(MemoryEvent.id)).filter(MemoryEvent.embedding_ref.is_(None))
+            return [event_id for (event_id,) in q if event_id not in indexed]
+        finally:
+            session.close()
+
+    def _catch_up(self, index, id_map: Dict[int, str]):
+        # Repeat while ingestion keeps adding; whatever is left is handled after the swap
+        for _ in range(_CATCH_UP_PASSES):
+            missing = self._missing(id_map)
+            if not missing:
+                break
+            logger.info(f"[REINDEX] catching up {len(missing)} events ingested during the rebuild")
+            rows = self._rows_for(missing)
+            for i in range(0, len(rows), self.batch_size):
+                index = self._add(index, id_map, rows[i : i + self.batch_size])
+        return index
+
+    def _add_late(self, event_ids: List[str]) -> None:
+        rows = self._rows_for(event_ids)
+        texts = [_embedding_text(summary, short, prefix) for _, summary, short, prefix in rows]
+        vectors = [v for i in range(0, len(texts), self.batch_size) for v in call_embed_batch(texts[i : i + self.batch_size])]
+        internal_ids = store.add_events([(row[0], v) for row, v in zip(rows, vectors)])
+        refs = {event_id: None for event_id in event_ids}  # their refs still point into the old index
+        refs.update({row[0]: str(i) for row, i in zip(rows, internal_ids) if i is not None})
+        self._write_refs(refs)
+
+    def _write_refs(self, refs: Dict[str, Optional[str]], reset: bool = False) -> None:
+        session = SessionLocal()
+        try:
+            if reset:
+                session.query(MemoryEvent).filter(MemoryEvent.embedding_ref.isnot(None)).update(
+                    {MemoryEvent.embedding_ref: None}, synchronize_session=False
+                )
+            session.bulk_update_mappings(
+                MemoryEvent, [{"id": event_id, "embedding_ref": ref} for event_id, ref in refs.items()]
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    # --------------------
+    # Checkpoint / resume
+    # --------------------
+    def _checkpoint(self, index, id_map: Dict[int, str], cursor: str, done: int) -> None:
+        if index is None:
+            return
+        write_index_files(index, id_map, len(id_map), EMBEDDING_VERSION, self.index_path, self.mapping_path)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": EMBEDDING_VERSION, "cursor": cursor, "done": done, "saved_at": time.time()}, f)
+        os.replace(tmp, self.state_path)
+
+    def _resume(self, restart: bool):
+        """(index, id_map, cursor, done) from the last checkpoint, or a fresh start."""
+        if not restart and all(os.path.exists(p) for p in (self.state_path, self.index_path, self.mapping_path)):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("version") == EMBEDDING_VERSION:
+                    index = faiss.read_index(self.index_path)
+                    with open(self.mapping_path, "rb") as f:
+                        id_map = pickle.load(f)["id_map"]
+                    logger.info(f"[REINDEX] resuming after {state['cursor']} ({state['done']} events done)")
+                    return index, id_map, state["cursor"], state["done"]
+            except Exception as e:
+                logger.warning(f"Discarding unreadable reindex checkpoint: {e}")
+        self._clear_checkpoint()
+        return None, {}, "", 0
+
+    def _clear_checkpoint(self) -> None:
+        for path in (self.state_path, self.index_path, self.mapping_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Singleton
+reindexer = ReindexJob()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-embed every event into a new vector index and swap it in.")
+    parser.add_argument("--rate", type=float, default=REINDEX_MAX_EVENTS_PER_S, help="max events/s (0 = unlimited)")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+    try:
+        claim_store()
+    except StoreInUse as e:
+        print(f"{e}. Stop the API first, or start the reindex there with POST /reindex.", file=sys.stderr)
+        return 2
+
+    result = ReindexJob(batch_size=args.batch_size, max_rate=args.rate).run(restart=args.restart)
+    print(json.dumps(result))
+    return 0 if result.get("state") == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Out-of-row storage for large text bodies (PDF text, transcripts).
+
+MemoryEvent.raw_text keeps at most CONTENT_INLINE_CHARS (the prefix that
+previews, metadata and embeddings use); anything longer is stored once per
+distinct body in content_blobs/content_chunks, content-addressed by sha256
+and compressed in CONTENT_CHUNK_CHARS chunks, so a passage read decompresses
+only the chunks it overlaps.
+
+    python -m backend.memory.content_store   # move existing long raw_text out of row
+"""
+import hashlib
+import logging
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import CONTENT_INLINE_CHARS, CONTENT_CHUNK_CHARS, CONTENT_ZSTD_LEVEL, CONTENT_ZLIB_LEVEL
+from backend.database import SessionLocal, MemoryEvent, ContentBlob, ContentChunk, init_db
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_CACHE_CHUNKS = 64  # decompressed chunks kept for repeated passage reads
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=CONTENT_ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, CONTENT_ZLIB_LEVEL)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Content was stored with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ContentStore:
+    """Compressed, chunked, content-addressed text bodies. Writes go through the caller's session."""
+
+    def __init__(self):
+        self.codec = "zstd" if zstandard is not None else "zlib"
+        self._cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --------------------
+    # Write path
+    # --------------------
+    def pack(self, text: str) -> Optional[Dict[str, Any]]:
+        """Compress a body that is too long to keep inline (CPU only, no DB). None if it fits inline."""
+        if not text or len(text) <= CONTENT_INLINE_CHARS:
+            return None
+        chunks = [
+            _compress(text[i : i + CONTENT_CHUNK_CHARS].encode("utf-8", "surrogatepass"), self.codec)
+            for i in range(0, len(text), CONTENT_CHUNK_CHARS)
+        ]
+        return {
+            "key": hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest(),
+            "codec": self.codec,
+            "length": len(text),
+            "chunk_chars": CONTENT_CHUNK_CHARS,
+            "chunks": chunks,
+        }
+
+    def put(self, session, packed: Dict[str, Any]) -> str:
+        """Store a packed body (no-op if the same body is already stored); the caller commits."""
+        blob = {k: packed[k] for k in ("key", "codec", "length", "chunk_chars")}
+        blob["stored_bytes"] = sum(len(c) for c in packed["chunks"])
+        inserted = session.execute(
+            sqlite_insert(ContentBlob).values(blob).on_conflict_do_nothing(index_elements=["key"])
+        ).rowcount
+        if inserted:
+            session.execute(
+                sqlite_insert(ContentChunk).on_conflict_do_nothing(),
+                [{"key": packed["key"], "seq": i, "data": data} for i, data in enumerate(packed["chunks"])],
+            )
+        return packed["key"]
+
+    @staticmethod
+    def inline_text(text: str) -> str:
+        """What MemoryEvent.raw_text holds for a body: all of it, or the inline prefix."""
+        return (text or "")[:CONTENT_INLINE_CHARS]
+
+    # --------------------
+    # Read path
+    # --------------------
+    def read(self, session, key: str, start: int = 0, length: Optional[int] = None) -> str:
+        """Characters [start, start+length) of a stored body; only the overlapping chunks are read."""
+        blob = session.get(ContentBlob, key)
+        if blob is None:
+            raise KeyError(f"No stored content {key}")
+        start = max(0, start)
+        end = blob.length if length is None else min(blob.length, start + max(0, length))
+        if start >= end:
+            return ""
+
+        size = blob.chunk_chars
+        first, last = start // size, (end - 1) // size
+        parts = {}
+        with self._lock:
+            for seq in range(first, last + 1):
+                cached = self._cache.get((key, seq))
+                if cached is not None:
+                    self._cache.move_to_end((key, seq))
+                    parts[seq] = cached
+        missing = [seq for seq in range(first, last + 1) if seq not in parts]
+        if missing:
+            rows = session.query(ContentChunk.seq, ContentChunk.data).filter(
+                ContentChunk.key == key, ContentChunk.seq.between(missing[0], missing[-1])
+            )
+            for seq, data in rows:
+                if seq in parts:
+                    continue
+                parts[seq] = _decompress(data, blob.codec).decode("utf-8", "surrogatepass")
+                with self._lock:
+                    self._cache[(key, seq)] = parts[seq]
+                    while len(self._cache) > _CACHE_CHUNKS:
+                        self._cache.popitem(last=False)
+
+        text = "".join(parts[seq] for seq in range(first, last + 1))
+        offset = first * size
+        return text[start - offset : end - offset]
+
+    def event_text(self, session, event_id: str, start: int = 0, length: Optional[int] = None) -> Optional[str]:
+        """Full text (or a passage) of an event, whether inline or out of row. None if no such event."""
+        row = session.query(MemoryEvent.content_ref, MemoryEvent.raw_text).filter(MemoryEvent.id == event_id).first()
+        if row is None:
+            return None
+        if row.content_ref:
+            return self.read(session, row.content_ref, start, length)
+        text = row.raw_text or ""
+        return text[start:] if length is None else text[start : start + length]
+
+    def stats(self, session) -> Dict[str, int]:
+        blobs, chars, stored = session.query(
+            func.count(ContentBlob.key), func.coalesce(func.sum(ContentBlob.length), 0),
+            func.coalesce(func.sum(ContentBlob.stored_bytes), 0),
+        ).one()
+        return {"blobs": blobs, "chars": chars, "stored_bytes": stored}
+
+
+# Singleton shared by the ingestion writer and the API
+content_store = ContentStore()
+
+
+# --------------------
+# Migration of existing rows
+# --------------------
+def externalize(batch_size: int = 200) -> int:
+    """Move raw_text longer than CONTENT_INLINE_CHARS out of row, in keyset batches. Idempotent."""
+    init_db()
+    session = SessionLocal()
+    cursor, moved = "", 0
+    try:
+        while True:
+            ids: List[str] = [
+                event_id for (event_id,) in session.query(MemoryEvent.id)
+                .filter(
+                    MemoryEvent.id > cursor,
+                    MemoryEvent.content_ref.is_(None),
+                    func.length(MemoryEvent.raw_text) > CONTENT_INLINE_CHARS,
+                )
+                .order_by(MemoryEvent.id)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            for event_id, text in session.query(MemoryEvent.id, MemoryEvent.raw_text).filter(MemoryEvent.id.in_(ids)):
+                packed = content_store.pack(text)
+                session.query(MemoryEvent).filter(MemoryEvent.id == event_id).update(
+                    {"content_ref": content_store.put(session, packed), "raw_text": content_store.inline_text(text)},
+                    synchronize_session=False,
+                )
+            session.commit()
+            cursor, moved = ids[-1], moved + len(ids)
+            logger.info(f"Content store: {moved} bodies moved out of row")
+        return moved
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    n = externalize()
+    print(f"Moved {n} bodies out of row. Run VACUUM to return the freed pages to the filesystem.")
+    sys.exit(0)
@@ -0,0 +1,106 @@
+"""
+Change counters behind the UI feeds (/timeline, /actions).
+
+Every write transaction of the ingestion writer that changes a feed calls
+bump() once and stamps the rows it writes with the new version
+(change_seq); deleted rows leave a tombstone. The API then answers
+
+    If-None-Match: <etag>   with 304 after one primary-key read, and
+    ?since=<cursor>         with only the rows (and tombstones) written since,
+
+so an idle dashboard never scans the tables (a since= cursor at the current
+version is answered without a query). bump() is an UPDATE of one row
+in the caller's transaction: SQLite serializes writers, so versions become
+visible in commit order and a client that has seen version N has seen every
+row stamped <= N.
+"""
+import zlib
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+
+from backend.database import FeedVersion, FeedTombstone
+
+TIMELINE = "timeline"
+ACTIONS = "actions"
+
+
+def bump(session, feed: str) -> int:
+    """Increment the feed's version inside the caller's transaction and return it."""
+    table = FeedVersion.__table__
+    updated = session.execute(
+        table.update().where(table.c.name == feed).values(version=table.c.version + 1)
+    ).rowcount
+    if not updated:
+        session.execute(table.insert().values(name=feed, version=1))
+        return 1
+    return session.execute(select(table.c.version).where(table.c.name == feed)).scalar_one()
+
+
+def version(session, feed: str) -> int:
+    return session.execute(
+        select(FeedVersion.version).where(FeedVersion.name == feed)
+    ).scalar_one_or_none() or 0
+
+
+def record_deleted(session, feed: str, item_ids: Sequence[str], seq: int) -> None:
+    if item_ids:
+        session.execute(
+            FeedTombstone.__table__.insert(),
+            [{"feed": feed, "item_id": item_id, "change_seq": seq} for item_id in item_ids],
+        )
+
+
+def _after(seq_col, id_col, after: Tuple[int, Optional[str]]):
+    seq, item_id = after
+    if item_id is None:
+        return seq_col > seq  # everything up to and including seq was seen
+    return tuple_(seq_col, id_col) > tuple_(seq, item_id)
+
+
+def changes(session, feed: str, query, model, after: Tuple[int, Optional[str]], upto: int,
+            limit: int) -> Tuple[List[Tuple[int, str, Any]], bool]:
+    """
+    Rows of `query` (which must select model.change_seq and model.id) and
+    tombstones of `feed` written after the (change_seq, id) key `after`, up
+    to version `upto`, in key order: ([(seq, id, row or None if deleted)], more).
+    """
+    rows = (
+        query.filter(_after(model.change_seq, model.id, after), model.change_seq <= upto)
+        .order_by(model.change_seq.asc(), model.id.asc())
+        .limit(limit + 1)
+        .all()
+    )
+    gone = (
+        session.query(FeedTombstone.change_seq, FeedTombstone.item_id)
+        .filter(
+            FeedTombstone.feed == feed,
+            _after(FeedTombstone.change_seq, FeedTombstone.item_id, after),
+            FeedTombstone.change_seq <= upto,
+        )
+        .order_by(FeedTombstone.change_seq.asc(), FeedTombstone.item_id.asc())
+        .limit(limit + 1)
+        .all()
+    )
+    merged = sorted(
+        [(r.change_seq, r.id, r) for r in rows] + [(seq, item_id, None) for seq, item_id in gone],
+        key=lambda c: (c[0], c[1]),
+    )
+    return merged[:limit], len(merged) > limit
+
+
+def etag(feed: str, version: int, *filters: Any) -> str:
+    """
+    Names the first page of a feed: its version, filters and page size. Only
+    that page is validated with it; cursor pages and since= deltas depend on
+    their cursor and are never answered with 304.
+    """
+    digest = zlib.crc32(repr(filters).encode("utf-8"))
+    return f'W/"{feed}-{version}-{digest:08x}"'
+
+
+def not_modified(if_none_match: Optional[str], current: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or current in tags or current[2:] in tags  # weak comparison
@@ -0,0 +1,242 @@
+"""
+Precomputed memory graph (graph_edges), built in the background:
+
+- related:  each vector's kNN within GRAPH_MAX_DISTANCE, from batched FAISS
+            searches over the whole index (stored once per pair, weight =
+            similarity)
+- temporal: consecutive events in (created_at, id) order, at most
+            GRAPH_TEMPORAL_MAX_GAP_S apart
+
+Both passes are incremental: a watermark over vector ids and a keyset
+cursor over events are persisted next to the vector store, so only new
+vectors/events are processed. Retrieval expands hits by one hop over these
+edges (neighbors()) without any embedding call or FAISS search.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import (
+    VECTOR_STORE_PATH,
+    GRAPH_NEIGHBORS,
+    GRAPH_MAX_DISTANCE,
+    GRAPH_BATCH_SIZE,
+    GRAPH_TEMPORAL_MAX_GAP_S,
+    GRAPH_INTERVAL_S,
+    GRAPH_TEMPORAL_WEIGHT,
+)
+from backend.database import SessionLocal, MemoryEvent, GraphEdge, init_db
+from backend.memory.vector_store import store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TEMPORAL_LAG_S = 5  # leave the newest events to the next pass (a writer may still be committing)
+_CHUNK = 400
+
+
+def _insert_edges(session, edges: List[Tuple[str, str, str, float]]) -> int:
+    """Insert (from, to, relation, weight) edges, skipping existing ones; the caller commits."""
+    inserted = 0
+    now = datetime.utcnow()
+    for i in range(0, len(edges), _CHUNK):
+        rows = [
+            {"id": str(uuid.uuid4()), "from_event_id": a, "to_event_id": b, "relation_type": rel, "weight": w, "created_at": now}
+            for a, b, rel, w in edges[i : i + _CHUNK]
+        ]
+        inserted += session.execute(sqlite_insert(GraphEdge).values(rows).on_conflict_do_nothing()).rowcount
+    return inserted
+
+
+class GraphBuilder:
+    def __init__(self, interval_s: float = GRAPH_INTERVAL_S):
+        self.interval_s = interval_s
+        self.state_path = f"{VECTOR_STORE_PATH}.graph.json"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()  # one pass at a time (thread or CLI)
+        self.counters = {"passes": 0, "related_added": 0, "temporal_added": 0, "last_pass_s": 0.0}
+
+    # --------------------
+    # Control
+    # --------------------
+    def start(self) -> "GraphBuilder":
+        self._thread = threading.Thread(target=self._run, name="graph-builder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self) -> None:
+        """New vectors were added: build their edges soon (cheap, non-blocking)."""
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._load_state()
+        return {"vectors_done": state["vectors_upto"], "vectors_total": store.index.ntotal, **self.counters}
+
+    def _run(self) -> None:
+        logger.info("Graph builder started.")
+        while not self._stop.is_set():
+            try:
+                self.build()
+            except Exception as e:
+                logger.exception(f"Graph builder error: {e}")
+            self._wakeup.wait(timeout=self.interval_s)
+            self._wakeup.clear()
+
+    # --------------------
+    # State
+    # --------------------
+    def _load_state(self) -> Dict[str, Any]:
+        state = {"vectors_upto": 0, "generation": None, "temporal_cursor": None}
+        try:
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        with open(f"{self.state_path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    # --------------------
+    # Passes
+    # --------------------
+    def build(self) -> Dict[str, int]:
+        """One incremental pass over new vectors and new events."""
+        with self._lock:
+            t0 = time.time()
+            state = self._load_state()
+            session = SessionLocal()
+            try:
+                related = self._related_pass(session, state)
+                temporal = self._temporal_pass(session, state)
+            finally:
+                session.close()
+            self.counters["passes"] += 1
+            self.counters["related_added"] += related
+            self.counters["temporal_added"] += temporal
+            self.counters["last_pass_s"] = round(time.time() - t0, 2)
+            if related or temporal:
+                logger.info(f"Graph: +{related} related, +{temporal} temporal edges in {time.time()-t0:.1f}s")
+            return {"related": related, "temporal": temporal}
+
+    def _related_pass(self, session, state: Dict[str, Any]) -> int:
+        with store.lock:
+            generation, ntotal = store.generation, store.index.ntotal
+        if state["generation"] != generation or state["vectors_upto"] > ntotal:
+            # A reindex or compaction renumbered the vectors: related edges are rebuilt from scratch
+            if state["vectors_upto"]:
+                session.query(GraphEdge).filter(GraphEdge.relation_type == "related").delete(synchronize_session=False)
+                session.commit()
+                logger.info("Graph: vector index was rebuilt, rebuilding related edges")
+            state.update(vectors_upto=0, generation=generation)
+            self._save_state(state)
+
+        added = 0
+        while state["vectors_upto"] < ntotal and not self._stop.is_set():
+            start = state["vectors_upto"]
+            n = min(GRAPH_BATCH_SIZE, ntotal - start)
+            # Under the store lock: add_events appends to this same flat index
+            with store.lock:
+                if store.generation != generation:
+                    break  # swapped mid-pass; the next pass starts over
+                index, id_map = store.index, store.id_map
+                vectors = index.reconstruct_n(start, n)
+                distances, neighbors = index.search(vectors, GRAPH_NEIGHBORS + 1)
+
+            edges = {}
+            for row, (dists, ids) in enumerate(zip(distances, neighbors)):
+                source = id_map.get(start + row)
+                if source is None:
+                    continue
+                for dist, idx in zip(dists, ids):
+                    target = id_map.get(int(idx)) if idx != -1 else None
+                    if target is None or target == source or dist > GRAPH_MAX_DISTANCE:
+                        continue
+                    pair = (source, target) if source < target else (target, source)
+                    edges[pair] = max(edges.get(pair, 0.0), 1.0 / (1.0 + float(dist)))
+
+            added += _insert_edges(session, [(a, b, "related", w) for (a, b), w in edges.items()])
+            session.commit()
+            state["vectors_upto"] = start + n
+            self._save_state(state)
+        return added
+
+    def _temporal_pass(self, session, state: Dict[str, Any], batch_size: int = 500) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=_TEMPORAL_LAG_S)
+        gap = timedelta(seconds=GRAPH_TEMPORAL_MAX_GAP_S)
+        prev = None
+        if state["temporal_cursor"]:
+            created_at, event_id = state["temporal_cursor"]
+            prev = (datetime.fromisoformat(created_at), event_id)
+
+        added = 0
+        while not self._stop.is_set():
+            query = session.query(MemoryEvent.created_at, MemoryEvent.id).filter(
+                MemoryEvent.created_at.isnot(None), MemoryEvent.created_at <= cutoff
+            )
+            if prev:
+                query = query.filter(tuple_(MemoryEvent.created_at, MemoryEvent.id) > tuple_(*prev))
+            rows = query.order_by(MemoryEvent.created_at, MemoryEvent.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            edges = []
+            for created_at, event_id in rows:
+                if prev and created_at - prev[0] <= gap:
+                    edges.append((prev[1], event_id, "temporal", GRAPH_TEMPORAL_WEIGHT))
+                prev = (created_at, event_id)
+            added += _insert_edges(session, edges)
+            session.commit()
+            state["temporal_cursor"] = [prev[0].isoformat(), prev[1]]
+            self._save_state(state)
+        return added
+
+
+def neighbors(
+    session, event_ids: Iterable[str], per_seed: int, relation_types: Optional[List[str]] = None
+) -> Dict[str, List[Tuple[str, str, float]]]:
+    """One hop from each seed over stored edges (either direction): seed -> [(event_id, relation, weight)], best first."""
+    seeds = list(dict.fromkeys(event_ids))
+    found: Dict[str, List[Tuple[str, str, float]]] = {seed: [] for seed in seeds}
+    if not seeds:
+        return found
+    cols = (GraphEdge.from_event_id, GraphEdge.to_event_id, GraphEdge.relation_type, GraphEdge.weight)
+    for seed_col, other in ((GraphEdge.from_event_id, 1), (GraphEdge.to_event_id, 0)):
+        query = session.query(*cols).filter(seed_col.in_(seeds))
+        if relation_types:
+            query = query.filter(GraphEdge.relation_type.in_(relation_types))
+        for row in query:
+            found[row[1 - other]].append((row[other], row[2], row[3] or 0.0))
+    for seed, items in found.items():
+        best = {}
+        for event_id, relation, weight in items:
+            if event_id != seed and weight > best.get(event_id, ("", -1.0))[1]:
+                best[event_id] = (relation, weight)
+        ranked = sorted(best.items(), key=lambda kv: -kv[1][1])[:per_seed]
+        found[seed] = [(event_id, relation, weight) for event_id, (relation, weight) in ranked]
+    return found
+
+
+# Singleton: started by the API, notified by the ingestion writer
+graph_builder = GraphBuilder()
+
+
+if __name__ == "__main__":
+    init_db()
+    print(graph_builder.build())
@@ -0,0 +1,231 @@
+"""
+Entity/topic inverted index over the Entity/Topic tables.
+
+MemoryEvent.entities/.topics stay as the per-event JSON copy; this index
+maps each normalized name to its events (event_entities, event_topics), so
+"everything about X" and facet counts touch only the matching rows instead
+of JSON-decoding the whole corpus.
+
+    python -m backend.memory.tag_index   # (re)build from the JSON columns
+"""
+import logging
+import re
+import sys
+import unicodedata
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.database import SessionLocal, MemoryEvent, Entity, Topic, EventEntity, EventTopic, init_db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# kind -> (tag model, association model, association tag column)
+KINDS = {
+    "entities": (Entity, EventEntity, EventEntity.entity_id),
+    "topics": (Topic, EventTopic, EventTopic.topic_id),
+}
+
+_CHUNK = 400  # keeps IN lists / multi-row inserts under SQLite's variable limit
+_EDGE_PUNCT = " \t\n\"'`.,;:!?()[]{}<>#*-_"
+
+
+def normalize_name(name: Any) -> str:
+    """Lookup key: NFKC, casefolded, inner whitespace collapsed, edge punctuation stripped."""
+    if not isinstance(name, str):
+        return ""
+    key = unicodedata.normalize("NFKC", name).casefold()
+    key = re.sub(r"\s+", " ", key).strip(_EDGE_PUNCT)
+    return key[:200]
+
+
+def _chunks(seq: Sequence, n: int = _CHUNK) -> Iterable[Sequence]:
+    for i in range(0, len(seq), n):
+        yield seq[i : i + n]
+
+
+# --------------------
+# Write path (called by the ingestion writer; caller commits)
+# --------------------
+def index_events(session, items: List[Tuple[str, List[Any], List[Any]]]) -> None:
+    """Index new events: [(event_id, entities, topics)]. Batched upserts, one pass per kind."""
+    for pos, kind in ((1, "entities"), (2, "topics")):
+        pairs: Dict[str, Dict[str, str]] = {}  # event_id -> key -> display name
+        for item in items:
+            for raw in item[pos] or []:
+                key = normalize_name(raw)
+                if key:
+                    pairs.setdefault(item[0], {}).setdefault(key, raw.strip()[:200])
+        if pairs:
+            _index_kind(session, kind, pairs)
+
+
+def _index_kind(session, kind: str, pairs: Dict[str, Dict[str, str]]) -> None:
+    model, assoc, tag_col = KINDS[kind]
+
+    display = {}
+    for names in pairs.values():
+        for key, raw in names.items():
+            display.setdefault(key, raw)
+    keys = list(display)
+
+    for chunk in _chunks(keys):
+        stmt = sqlite_insert(model).values(
+            [{"id": str(uuid.uuid4()), "name": k, "display_name": display[k], "event_count": 0} for k in chunk]
+        )
+        session.execute(stmt.on_conflict_do_nothing(index_elements=["name"]))
+
+    ids = {}
+    for chunk in _chunks(keys):
+        ids.update(session.query(model.name, model.id).filter(model.name.in_(chunk)).all())
+
+    rows = [{tag_col.key: ids[key], "event_id": event_id} for event_id, names in pairs.items() for key in names]
+    for chunk in _chunks(rows):
+        session.execute(sqlite_insert(assoc).values(list(chunk)).on_conflict_do_nothing())
+
+    counts = Counter(ids[key] for names in pairs.values() for key in names)
+    table = model.__table__
+    session.execute(
+        table.update().where(table.c.id == bindparam("tag_id")).values(event_count=table.c.event_count + bindparam("n")),
+        [{"tag_id": tag_id, "n": n} for tag_id, n in counts.items()],
+    )
+
+
+def unindex_events(session, event_ids: Sequence[str]) -> None:
+    """Drop events from the index (before deleting them): association rows and their event counts."""
+    for kind, (model, assoc, tag_col) in KINDS.items():
+        counts: Counter = Counter()
+        for chunk in _chunks(list(event_ids)):
+            counts.update(tag_id for (tag_id,) in session.query(tag_col).filter(assoc.event_id.in_(chunk)))
+            session.query(assoc).filter(assoc.event_id.in_(chunk)).delete(synchronize_session=False)
+        if counts:
+            table = model.__table__
+            session.execute(
+                table.update().where(table.c.id == bindparam("tag_id")).values(event_count=table.c.event_count - bindparam("n")),
+                [{"tag_id": tag_id, "n": n} for tag_id, n in counts.items()],
+            )
+
+
+# --------------------
+# Read path
+# --------------------
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def lookup(
+    session,
+    entities: Any = None,
+    topics: Any = None,
+    match: str = "all",
+) -> Set[str]:
+    """
+    Event ids tagged with the given names (match="all": every name, "any":
+    at least one). Cost is proportional to the matching associations.
+    """
+    sets: List[Set[str]] = []
+    for kind, names in (("entities", _as_list(entities)), ("topics", _as_list(topics))):
+        if not names:
+            continue
+        model, assoc, tag_col = KINDS[kind]
+        keys = {normalize_name(n) for n in names} - {""}
+        tag_ids = dict(session.query(model.name, model.id).filter(model.name.in_(keys)).all()) if keys else {}
+        for key in keys:
+            tag_id = tag_ids.get(key)
+            event_ids = set() if tag_id is None else {
+                e for (e,) in session.query(assoc.event_id).filter(tag_col == tag_id)
+            }
+            sets.append(event_ids)
+
+    if not sets:
+        return set()
+    if match == "any":
+        return set().union(*sets)
+    sets.sort(key=len)
+    result = sets[0]
+    for s in sets[1:]:
+        result = result & s
+    return result
+
+
+def facets(
+    session,
+    kind: str,
+    prefix: Optional[str] = None,
+    limit: int = 20,
+    event_ids: Optional[Iterable[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Top names by event count, globally or within a set of events."""
+    model, assoc, tag_col = KINDS[kind]
+
+    if event_ids is None:
+        query = session.query(model.name, model.display_name, model.event_count).filter(model.event_count > 0)
+        if prefix:
+            key = normalize_name(prefix)
+            query = query.filter(model.name >= key, model.name < key + "\uffff")  # index range, not LIKE
+        rows = query.order_by(model.event_count.desc(), model.name).limit(limit).all()
+        return [{"name": display or name, "key": name, "count": count} for name, display, count in rows]
+
+    counts: Counter = Counter()
+    for chunk in _chunks(list(event_ids)):
+        counts.update(dict(
+            session.query(tag_col, func.count()).filter(assoc.event_id.in_(chunk)).group_by(tag_col).all()
+        ))
+    if not counts:
+        return []
+    tags = {}
+    for chunk in _chunks(list(counts)):
+        tags.update({i: (n, d) for i, n, d in session.query(model.id, model.name, model.display_name).filter(model.id.in_(chunk))})
+    out = []
+    for tag_id, count in counts.most_common():
+        name, display = tags.get(tag_id, ("", ""))
+        if prefix and not name.startswith(normalize_name(prefix)):
+            continue
+        out.append({"name": display or name, "key": name, "count": count})
+        if len(out) >= limit:
+            break
+    return out
+
+
+# --------------------
+# Rebuild (existing databases, or after manual edits)
+# --------------------
+def rebuild(batch_size: int = 500) -> int:
+    """Clear the index and repopulate it from the JSON columns, in keyset batches."""
+    init_db()
+    session = SessionLocal()
+    try:
+        for model, assoc, _ in KINDS.values():
+            session.query(assoc).delete(synchronize_session=False)
+            session.query(model).update({model.event_count: 0}, synchronize_session=False)
+        session.commit()
+
+        cursor, total = "", 0
+        while True:
+            rows = (
+                session.query(MemoryEvent.id, MemoryEvent.entities, MemoryEvent.topics)
+                .filter(MemoryEvent.id > cursor)
+                .order_by(MemoryEvent.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            index_events(session, [(r.id, r.entities or [], r.topics or []) for r in rows])
+            session.commit()
+            cursor, total = rows[-1].id, total + len(rows)
+            logger.info(f"Tag index: {total} events indexed")
+        return total
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    print(f"Indexed {rebuild()} events.")
+    sys.exit(0)
@@ -2,41 +2,147 @@ import faiss
 import numpy as np
 import pickle
 import os
-from threading import Lock
-from typing import List, Tuple, Optional
+import uuid
+from threading import RLock
+from typing import Dict, List, Tuple, Optional
 
-from backend.config import VECTOR_STORE_PATH
+from backend.config import VECTOR_STORE_PATH, EMBEDDING_VERSION
+from backend.utils.metrics import REGISTRY
+
+OP_SECONDS = REGISTRY.histogram("vector_store_seconds", "Vector store operation latency (add includes the save)", ["op"])
+
+# Read from disk on first access (see VectorStore.__getattr__), not at import
+_LAZY_STATE = frozenset({"index", "id_map", "next_id", "embedding_version", "generation", "dimension"})
+
+
+class StoreInUse(RuntimeError):
+    pass
+
+
+_owner_file = None
+
+
+def claim_store() -> None:
+    """
+    Take the inter-process writer lock on the vector store files, held until
+    the process exits. Each process keeps its own in-memory index and next_id,
+    so two writers (API + backfill, API + reindex CLI) would hand out the same
+    internal ids and overwrite each other's saves. Raises StoreInUse.
+    """
+    global _owner_file
+    if _owner_file is not None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(VECTOR_STORE_PATH)), exist_ok=True)
+    f = open(f"{VECTOR_STORE_PATH}.lock", "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise StoreInUse(f"The vector store at {VECTOR_STORE_PATH} is in use by another process (API, backfill or reindex)")
+    _owner_file = f
+
+
+def write_index_files(index, id_map: Dict[int, str], next_id: int, embedding_version: Optional[str],
+                      index_path: str, mapping_path: str, generation: Optional[str] = None) -> None:
+    """Write to temp files, then rename, so a crash never leaves a torn index on disk."""
+    faiss.write_index(index, f"{index_path}.tmp")
+    with open(f"{mapping_path}.tmp", "wb") as f:
+        pickle.dump(
+            {"id_map": id_map, "next_id": next_id, "embedding_version": embedding_version, "generation": generation}, f
+        )
+    os.replace(f"{index_path}.tmp", index_path)
+    os.replace(f"{mapping_path}.tmp", mapping_path)
 
 
 class VectorStore:
     def __init__(self):
         self.index_path = f"{VECTOR_STORE_PATH}.index"
         self.mapping_path = f"{VECTOR_STORE_PATH}.pkl"  # int_id -> event_uuid
-        self.dimension = 768  # nomic-embed-text dim
-        self.lock = Lock()
-
-        self.id_map = {}
-        self.next_id = 0
-
-        if os.path.exists(self.index_path) and os.path.exists(self.mapping_path):
-            self.load()
-        else:
-            self.index = faiss.IndexFlatL2(self.dimension)
+        self.lock = RLock()  # save() re-enters from add_event
+        # Held by whole-index rebuilds (reindex swap, compaction) across their embedding_ref
+        # writes, which must not run under self.lock: the ingestion writer holds the SQLite
+        # write lock while it waits for self.lock in add_events
+        self.rebuild_lock = RLock()
+        self.loaded = False
+
+    def __getattr__(self, name):
+        # Only reached while the lazily loaded state is still missing
+        if name in _LAZY_STATE:
+            self.ensure_loaded()
+            return object.__getattribute__(self, name)
+        raise AttributeError(name)
+
+    def ensure_loaded(self) -> None:
+        """Load the index on first use (or ahead of time, from the API warmup)."""
+        with self.lock:
+            if self.loaded:
+                return
+            self.dimension = 768  # nomic-embed-text dim
+            self.id_map = {}
+            self.next_id = 0
+            self.embedding_version = EMBEDDING_VERSION  # how the stored vectors were produced
+            # Changes whenever internal ids are renumbered (replace()): id-based watermarks
+            # kept elsewhere (graph, clusters) restart when it differs from theirs
+            self.generation = uuid.uuid4().hex
+
+            if os.path.exists(self.index_path) and os.path.exists(self.mapping_path):
+                self.load()
+            else:
+                self.index = faiss.IndexFlatL2(self.dimension)
+            self.loaded = True
 
     def load(self):
         print("Loading vector store...")
         self.index = faiss.read_index(self.index_path)
+        self.dimension = self.index.d
         with open(self.mapping_path, "rb") as f:
             data = pickle.load(f)
             self.id_map = data["id_map"]
             self.next_id = data["next_id"]
-
+            # Indexes saved before versioning hold un-normalized /api/embeddings vectors
+            self.embedding_version = data.get("embedding_version")
+            self.generation = data.get("generation") or "initial"
+        if self.is_stale():
+            print(
+                f"Vector store holds '{self.embedding_version}' embeddings but queries use "
+                f"'{EMBEDDING_VERSION}'; new vectors are held back until it is re-embedded "
+                f"(started by the API when REINDEX_ON_STALE, or POST /reindex)."
+            )
+
+    def is_stale(self) -> bool:
+        """True when stored vectors were embedded differently from current queries."""
+        return self.index.ntotal > 0 and self.embedding_version != EMBEDDING_VERSION
+
+    @OP_SECONDS.time(op="save")
     def save(self):
         with self.lock:
-            faiss.write_index(self.index, self.index_path)
-            with open(self.mapping_path, "wb") as f:
-                pickle.dump({"id_map": self.id_map, "next_id": self.next_id}, f)
+            write_index_files(
+                self.index, self.id_map, self.next_id, self.embedding_version, self.index_path, self.mapping_path,
+                generation=self.generation,
+            )
+
+    def replace(self, index, id_map: Dict[int, str], next_id: int, embedding_version: str) -> None:
+        """
+        Swap in a rebuilt index (reindex, compaction); searches see old or
+        new, never a mix. Internal ids change, so the generation does too.
+        """
+        with self.lock:
+            self.loaded = True  # nothing left to read from disk
+            self.index = index
+            self.generation = uuid.uuid4().hex
+            self.dimension = index.d
+            self.id_map = id_map
+            self.next_id = next_id
+            self.embedding_version = embedding_version
+            self.save()
 
+    @OP_SECONDS.time(op="add")
     def add_event(self, event_uuid: str, vector: List[float]) -> Optional[int]:
         if not vector or len(vector) != self.dimension:
             print(f"Vector dim mismatch or empty: {len(vector) if vector else 0}")
@@ -45,6 +151,8 @@ class VectorStore:
         vector_np = np.array([vector], dtype=np.float32)
 
         with self.lock:
+            if self.is_stale():
+                return None  # see add_events
             internal_id = self.next_id
             self.index.add(vector_np)
             self.id_map[internal_id] = event_uuid
@@ -53,20 +161,80 @@ class VectorStore:
 
         return internal_id
 
+    @OP_SECONDS.time(op="add")
+    def add_events(self, items: List[Tuple[str, List[float]]]) -> List[Optional[int]]:
+        """Batched add_event: one index append and one save for many vectors."""
+        ids: List[Optional[int]] = [None] * len(items)
+        valid = []
+        for pos, (event_uuid, vector) in enumerate(items):
+            if not vector or len(vector) != self.dimension:
+                print(f"Vector dim mismatch or empty: {len(vector) if vector else 0}")
+                continue
+            valid.append((pos, event_uuid, vector))
+
+        if not valid:
+            return ids
+
+        vectors_np = np.array([v for _, _, v in valid], dtype=np.float32)
+
+        with self.lock:
+            if self.is_stale():
+                # Never mix embedding spaces in one index: the reindex picks these events up
+                # (events without embedding_ref) when it swaps in a current index
+                print(f"Vector store is stale; not indexing {len(valid)} vectors until the reindex swaps")
+                return ids
+            self.index.add(vectors_np)
+            for pos, event_uuid, _ in valid:
+                ids[pos] = self.next_id
+                self.id_map[self.next_id] = event_uuid
+                self.next_id += 1
+        self.save()
+
+        return ids
+
     def search(self, query_vector: List[float], top_k: int = 5) -> List[Tuple[str, float]]:
         if not query_vector:
             return []
+        return self.search_many([query_vector], top_k)[0]
 
-        vector_np = np.array([query_vector], dtype=np.float32)
-        distances, indices = self.index.search(vector_np, top_k)
+    @OP_SECONDS.time(op="search")
+    def search_many(self, query_vectors: List[List[float]], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """search() for many queries with one FAISS call over the query matrix."""
+        if not query_vectors:
+            return []
+
+        vectors_np = np.array(query_vectors, dtype=np.float32)
+        with self.lock:
+            index, id_map = self.index, self.id_map
+        if vectors_np.ndim != 2 or vectors_np.shape[1] != index.d:
+            return [[] for _ in query_vectors]
+        distances, indices = index.search(vectors_np, top_k)
+
+        # returns (event_uuid, L2_distance) per query
+        return [
+            [(id_map[idx], float(dist)) for dist, idx in zip(row_d, row_i) if idx != -1 and idx in id_map]
+            for row_d, row_i in zip(distances, indices)
+        ]
+
+    @OP_SECONDS.time(op="search_subset")
+    def search_subset(self, query_vector: List[float], internal_ids: List[int], top_k: int = 5) -> List[Tuple[str, float]]:
+        """Exact L2 ranking restricted to some vectors (e.g. events matching a tag filter): O(len(internal_ids))."""
+        if not query_vector or not internal_ids:
+            return []
 
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx != -1 and idx in self.id_map:
-                # returns (event_uuid, L2_distance)
-                results.append((self.id_map[idx], float(dist)))
+        with self.lock:
+            index, id_map = self.index, self.id_map
+            ids = [i for i in set(internal_ids) if 0 <= i < index.ntotal and i in id_map]
+            if not ids:
+                return []
+            vectors = np.vstack([index.reconstruct(i) for i in ids])
+        query_np = np.array(query_vector, dtype=np.float32)
+        if query_np.shape[0] != vectors.shape[1]:
+            return []
 
-        return results
+        distances = ((vectors - query_np) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:top_k]
+        return [(id_map[ids[i]], float(distances[i])) for i in order]
 
 
 store = VectorStore()
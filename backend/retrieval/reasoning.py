@@ -1,30 +1,143 @@
-from typing import List, Dict, Any
+import re
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Dict, Any, Optional
 from datetime import datetime
 from backend.utils.llm_client import call_llm
-from backend.config import MODEL_MAIN, CONFIDENCE_THRESHOLD
-from backend.retrieval.search import search_memory
+from backend.config import MODEL_MAIN, CONFIDENCE_THRESHOLD, QUERY_BATCH_CONCURRENCY
+from backend.database import SessionLocal
+from backend.retrieval.search import search_memory, search_memory_batch
+from backend.maintenance.clustering import cluster_summaries
 from backend.verification.validator import Validator
+from backend.utils.metrics import REGISTRY
+from backend.utils.tracing import span, annotate
+
+logger = logging.getLogger(__name__)
+
+STEP_SECONDS = REGISTRY.histogram("query_step_seconds", "Query pipeline step latency", ["step"])
+QUERIES = REGISTRY.counter("queries_total", "Processed queries by context source and outcome", ["context", "outcome"])
+
+
+@contextmanager
+def _step(name: str):
+    """Time a pipeline step into the metrics histogram and, when tracing, a span."""
+    with STEP_SECONDS.time(step=name), span(name):
+        yield
+
+
+def _map(pool: ThreadPoolExecutor, fn: Callable, items: Iterable) -> Iterable:
+    """pool.map that carries the caller's context (the active trace span) into the workers."""
+    jobs = [(contextvars.copy_context(), item) for item in items]  # one copy per item: a context runs in one thread at a time
+    return pool.map(lambda job: job[0].run(fn, job[1]), jobs)
+
+
+# Only questions about "everything" go to cluster summaries; anything naming a
+# subject ("what is Bob working on for the launch?") needs the vector search
+_BROAD_QUERY = re.compile(
+    r"^\W*(?:"
+    r"what (?:have i been|am i|was i|did i) (?:doing|working on|up to|busy with)"
+    r"|(?:give me )?(?:an? )?(?:overview|recap|summary) of (?:everything|my (?:week|month|day|work|notes|memories))"
+    r"|summari[sz]e (?:everything|my (?:week|month|day|work|notes|memories))"
+    r"|catch me up|what(?:'s| is) the big picture|what are (?:the|my) main themes?"
+    r")(?: (?:lately|recently|this (?:week|month)|these days))?\W*$",
+    re.IGNORECASE,
+)
 
 class ReasoningEngine:
     def __init__(self):
         self.validator = Validator()
 
-    def process_query(self, query: str) -> Dict[str, Any]:
+    def process_query(self, query: str, filters: Optional[Dict[str, Any]] = None, expand: bool = False) -> Dict[str, Any]:
         """
         End-to-end query processing: intent, retrieval, synthesis, verification.
         """
         # 1. Intent Detection
-        intent = self._detect_intent(query)
+        with _step("intent"):
+            intent = self._detect_intent(query)
         
         # 2. Retrieval
         if intent == "action_list":
              # Need special handler for action items
              pass # For now, treat as general search + summary? Or separate SQL.
         
-        context_docs = search_memory(query)
+        # Broad questions ("what have I been working on?") read cluster summaries first
+        context_docs, source = [], "clusters"
+        if self._is_broad(query, filters):
+            with _step("cluster_context"):
+                context_docs = self._cluster_context()
+        if not context_docs:
+            source = "search"
+            with _step("retrieval"):
+                context_docs = search_memory(query, filters, expand=expand)
+        return self._answer(query, intent, context_docs, source)
+
+    def process_queries(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        expand: bool = False,
+        concurrency: int = QUERY_BATCH_CONCURRENCY,
+    ) -> List[Dict[str, Any]]:
+        """
+        process_query for many questions, results in order. Retrieval for all
+        of them is one search_memory_batch call (one embed request, one FAISS
+        search); intents and answers run `concurrency` at a time. A question
+        that fails gets {"error": ...} instead of failing the batch.
+        """
+        n = len(queries)
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, n)), thread_name_prefix="query") as pool:
+            intents = list(_map(pool, self._safe_intent, queries))
+
+            contexts: List[List[Dict[str, Any]]] = [[] for _ in queries]
+            sources = ["search"] * n
+            broad = [i for i in range(n) if intents[i] is not None and self._is_broad(queries[i], filters)]
+            if broad:
+                with _step("cluster_context"):
+                    summaries = self._cluster_context()
+                if summaries:
+                    for i in broad:
+                        contexts[i], sources[i] = summaries, "clusters"
+
+            todo = [i for i in range(n) if intents[i] is not None and not contexts[i]]
+            if todo:
+                with _step("retrieval"):
+                    found = search_memory_batch([queries[i] for i in todo], filters, expand=expand)
+                for i, docs in zip(todo, found):
+                    contexts[i] = docs
+
+            def answer(i: int) -> Dict[str, Any]:
+                if intents[i] is None:
+                    return {"error": "intent detection failed"}
+                with span("query", index=i):
+                    try:
+                        return self._answer(queries[i], intents[i], contexts[i], sources[i])
+                    except Exception as e:
+                        logger.error(f"Batch query {i} failed: {e}")
+                        return {"error": str(e)}
+
+            return list(_map(pool, answer, range(n)))
+
+    def _safe_intent(self, query: str) -> Optional[str]:
+        try:
+            with _step("intent"):
+                return self._detect_intent(query)
+        except Exception as e:
+            logger.error(f"Intent detection failed: {e}")
+            return None
+
+    @staticmethod
+    def _is_broad(query: str, filters: Optional[Dict[str, Any]]) -> bool:
+        return not filters and bool(_BROAD_QUERY.match(query.strip()))
+
+    def _answer(self, query: str, intent: str, context_docs: List[Dict[str, Any]], source: str) -> Dict[str, Any]:
+        """Steps 3 and 4: draft an answer from the retrieved context and verify it."""
         context_str = self._format_context(context_docs)
+        annotate(intent=intent, context=source, context_docs=len(context_docs), context_chars=len(context_str))
         
         if not context_docs:
+            QUERIES.inc(context=source, outcome="no_evidence")
             return {
                 "answer": "I found no relevant information in my memory regarding your query.",
                 "confidence": 0,
@@ -34,13 +147,18 @@ class ReasoningEngine:
             }
 
         # 3. Generate Draft Answer
-        draft = self._generate_answer(query, context_str)
+        with _step("generate"):
+            draft = self._generate_answer(query, context_str)
         
         # 4. Verification Pass
-        verification = self.validator.verify(query, draft, context_docs)
+        with _step("verify"):
+            verification = self.validator.verify(query, draft, context_docs)
         
         final_answer = draft
-        if verification["confidence"] < CONFIDENCE_THRESHOLD:
+        low_confidence = verification["confidence"] < CONFIDENCE_THRESHOLD
+        annotate(confidence=verification["confidence"])
+        QUERIES.inc(context=source, outcome="low_confidence" if low_confidence else "answered")
+        if low_confidence:
             final_answer += f"\n\n[Warning: Confidence is low ({verification['confidence']}%) due to insufficient evidence or conflicting information.]"
             if "uncertainty_flags" in verification:
                 flags = ", ".join(verification["uncertainty_flags"])
@@ -54,6 +172,13 @@ class ReasoningEngine:
             "uncertainty_flags": verification.get("uncertainty_flags", [])
         }
 
+    def _cluster_context(self) -> List[Dict[str, Any]]:
+        session = SessionLocal()
+        try:
+            return cluster_summaries(session)
+        finally:
+            session.close()
+
     def _detect_intent(self, query: str) -> str:
         prompt = f"""
         Classify the intent of this query into one of: [question, find, summarize, action_list].
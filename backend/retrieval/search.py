@@ -1,49 +1,154 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from backend.database import SessionLocal, MemoryEvent
 from backend.memory.vector_store import store
-from backend.utils.llm_client import call_embed
-from backend.config import MAX_SEARCH_RESULTS
+from backend.memory.tag_index import lookup
+from backend.memory.graph import neighbors
+from backend.utils.llm_client import call_embed_batch
+from backend.utils.tracing import span, annotate
+from backend.config import MAX_SEARCH_RESULTS, GRAPH_EXPAND_SEEDS, GRAPH_EXPAND_PER_SEED
 
 
-def search_memory(query: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+def _tag_filter(filters: Dict[str, Any]) -> Tuple[Any, Any]:
+    return filters.get("entities") or filters.get("entity"), filters.get("topics") or filters.get("topic")
+
+
+def search_memory(query: str, filters: Dict[str, Any] = None, expand: bool = False) -> List[Dict[str, Any]]:
+    """
+    Vector search. Optional filters: entities/entity, topics/topic (names,
+    matched through the tag index; match="all" or "any") and source_type.
+    With a tag filter only the matching events are ranked, so the cost is
+    O(matches) rather than a scan of the whole index.
+
+    expand=True appends the precomputed graph neighbors (backend.memory.graph)
+    of the top hits, one hop, marked with "via" and "relation".
+    """
+    return search_memory_batch([query], filters, expand=expand)[0]
+
+
+def search_memory_batch(queries: List[str], filters: Dict[str, Any] = None, expand: bool = False) -> List[List[Dict[str, Any]]]:
+    """
+    search_memory for many queries sharing the same filters: one /api/embed
+    request for all of them, one FAISS search over the query matrix and one
+    hydration query for the union of hits. Results are in query order.
+    """
+    filters = filters or {}
+    out: List[List[Dict[str, Any]]] = [[] for _ in queries]
     session = SessionLocal()
     try:
-        query_vector = call_embed(query, timeout_s=20)
-        if not query_vector:
-            return []
-
-        # returns (event_uuid, L2_distance)
-        results = store.search(query_vector, top_k=MAX_SEARCH_RESULTS * 2)
-
-        candidates = []
-        seen_ids = set()
-
-        for event_id, distance in results:
-            if event_id in seen_ids:
-                continue
-            seen_ids.add(event_id)
-
-            event = session.query(MemoryEvent).filter(MemoryEvent.id == event_id).first()
-            if not event:
-                continue
-
-            similarity = 1.0 / (1.0 + distance)
-
-            candidates.append(
-                {
-                    "id": event.id,
-                    "score": similarity,
-                    "distance": distance,
-                    "summary": event.summary_1line,
-                    "text": event.raw_text,
-                    "created_at": event.created_at.isoformat() if event.created_at else None,
-                    "source_type": event.source_type,
-                    "entities": event.entities,
-                }
-            )
-
-        candidates.sort(key=lambda x: x["score"], reverse=True)
-        return candidates[:MAX_SEARCH_RESULTS]
+        with span("embed_query", queries=len(queries), query_chars=sum(len(q) for q in queries)):
+            vectors = call_embed_batch(list(queries), timeout_s=15 + 5 * len(queries))
+        todo = [i for i, vector in enumerate(vectors) if vector]
+        if not todo:
+            return out
+
+        entities, topics = _tag_filter(filters)
+        source_type = filters.get("source_type")
+        if entities or topics:
+            with span("tag_lookup"):
+                event_ids = list(lookup(session, entities=entities, topics=topics, match=filters.get("match", "all")))
+                refs = []
+                for i in range(0, len(event_ids), 500):
+                    q = session.query(MemoryEvent.embedding_ref).filter(
+                        MemoryEvent.id.in_(event_ids[i : i + 500]), MemoryEvent.embedding_ref.isnot(None)
+                    )
+                    if source_type:
+                        q = q.filter(MemoryEvent.source_type == source_type)
+                    refs.extend(int(ref) for (ref,) in q if ref.isdigit())
+                annotate(matches=len(event_ids), vectors=len(refs))
+            # returns (event_uuid, L2_distance)
+            with span("vector_search", mode="subset"):
+                results = [store.search_subset(vectors[i], refs, top_k=MAX_SEARCH_RESULTS * 2) for i in todo]
+                annotate(hits=sum(len(r) for r in results))
+        else:
+            # returns (event_uuid, L2_distance); over-fetch when post-filtering by source
+            with span("vector_search", mode="full", vectors=store.index.ntotal):
+                results = store.search_many([vectors[i] for i in todo], top_k=MAX_SEARCH_RESULTS * (8 if source_type else 2))
+                annotate(hits=sum(len(r) for r in results))
+
+        with span("hydrate"):
+            rows = _fetch_rows(session, [event_id for hits in results for event_id, _ in hits], source_type)
+            annotate(rows=len(rows))
+
+        for i, hits in zip(todo, results):
+            candidates = []
+            seen_ids = set()
+
+            for event_id, distance in hits:
+                if event_id in seen_ids:
+                    continue
+                seen_ids.add(event_id)
+
+                event = rows.get(event_id)
+                if not event:
+                    continue
+
+                similarity = 1.0 / (1.0 + distance)
+
+                candidates.append(_candidate(event, similarity, distance))
+
+            candidates.sort(key=lambda x: x["score"], reverse=True)
+            out[i] = candidates[:MAX_SEARCH_RESULTS]
+
+        if expand:
+            with span("graph_expand"):
+                added = 0
+                for candidates in out:
+                    if candidates:
+                        expanded = _expand(session, candidates, source_type)
+                        candidates += expanded
+                        added += len(expanded)
+                annotate(added=added)
+        return out
 
     finally:
         session.close()
+
+
+def _fetch_rows(session, event_ids: List[str], source_type: str = None) -> Dict[str, Any]:
+    """One query per 500 ids, hot columns only (raw_text holds at most the inline prefix)."""
+    event_ids = list(dict.fromkeys(event_ids))
+    rows = {}
+    for i in range(0, len(event_ids), 500):
+        q = session.query(
+            MemoryEvent.id, MemoryEvent.summary_1line, MemoryEvent.raw_text, MemoryEvent.created_at,
+            MemoryEvent.source_type, MemoryEvent.entities,
+        ).filter(MemoryEvent.id.in_(event_ids[i : i + 500]))
+        if source_type:
+            q = q.filter(MemoryEvent.source_type == source_type)
+        rows.update((row.id, row) for row in q)
+    return rows
+
+
+def _candidate(event, score: float, distance: float = None) -> Dict[str, Any]:
+    return {
+        "id": event.id,
+        "score": score,
+        "distance": distance,
+        "summary": event.summary_1line,
+        "text": event.raw_text,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+        "source_type": event.source_type,
+        "entities": event.entities,
+    }
+
+
+def _expand(session, hits: List[Dict[str, Any]], source_type: str = None) -> List[Dict[str, Any]]:
+    """One hop over stored graph edges from the top hits; score = seed score x edge weight."""
+    seeds = hits[:GRAPH_EXPAND_SEEDS]
+    found = neighbors(session, [h["id"] for h in seeds], per_seed=GRAPH_EXPAND_PER_SEED)
+    seen = {h["id"] for h in hits}
+    picks = []
+    for seed in seeds:
+        for event_id, relation, weight in found.get(seed["id"], []):
+            if event_id not in seen:
+                seen.add(event_id)
+                picks.append((event_id, seed, relation, seed["score"] * weight))
+
+    rows = _fetch_rows(session, [p[0] for p in picks], source_type)
+    expanded = []
+    for event_id, seed, relation, score in picks:
+        event = rows.get(event_id)
+        if event:
+            expanded.append({**_candidate(event, score), "via": seed["id"], "relation": relation})
+    expanded.sort(key=lambda x: x["score"], reverse=True)
+    return expanded
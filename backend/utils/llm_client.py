@@ -2,9 +2,29 @@ import json
 import requests
 import re
 import base64
-from typing import Any, Dict, List, Optional
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Type
 
-from backend.config import OLLAMA_BASE_URL, MODEL_EMBEDDING, MODEL_VISION
+from pydantic import BaseModel, ValidationError
+
+from backend.config import OLLAMA_BASE_URL, MODEL_EMBEDDING, MODEL_VISION, TRACE_MODEL_LOAD_S
+from backend.utils.model_scheduler import scheduler
+from backend.utils.metrics import REGISTRY
+from backend.utils import tracing
+
+logger = logging.getLogger(__name__)
+
+LLM_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds", "Ollama call latency, including the wait for the model slot", ["model", "endpoint"]
+)
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "Ollama calls by outcome", ["model", "endpoint", "status"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by Ollama (prompt = evaluated input)", ["model", "kind"])
+
+# Structured-output bookkeeping: task -> counters
+_json_stats: Dict[str, Dict[str, int]] = {}
+_json_stats_lock = threading.Lock()
 
 
 def _strip_code_fences(text: str) -> str:
@@ -36,9 +56,63 @@ def clean_json_response(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def call_llm(model: str, prompt: str, json_mode: bool = False, timeout_s: int = 60) -> str:
-    url = f"{OLLAMA_BASE_URL}/api/generate"
+def _post_json(url: str, payload: Dict[str, Any], timeout_s: int) -> Dict[str, Any]:
+    r = requests.post(url, json=payload, timeout=timeout_s)
+    r.raise_for_status()
+    return r.json()
+
 
+def _ollama(model: str, endpoint: str, payload: Dict[str, Any], timeout_s: int) -> Dict[str, Any]:
+    """Every Ollama call goes through the model-affinity scheduler."""
+    payload["keep_alive"] = scheduler.keep_alive(model)
+    with tracing.span("llm", model=model, endpoint=endpoint):
+        if tracing.active():
+            tracing.annotate(prompt_chars=_prompt_chars(payload))
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            data = scheduler.run(model, _post_json, f"{OLLAMA_BASE_URL}{endpoint}", payload, timeout_s)
+            status = "ok"
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - t0, model=model, endpoint=endpoint)
+            LLM_REQUESTS.inc(model=model, endpoint=endpoint, status=status)
+        if data.get("prompt_eval_count"):
+            LLM_TOKENS.inc(data["prompt_eval_count"], model=model, kind="prompt")
+        if data.get("eval_count"):
+            LLM_TOKENS.inc(data["eval_count"], model=model, kind="completion")
+        if tracing.active():
+            # Ollama reports durations in ns; a long load_duration means the model was not resident
+            load_s = (data.get("load_duration") or 0) / 1e9
+            tracing.annotate(
+                prompt_tokens=data.get("prompt_eval_count"),
+                completion_tokens=data.get("eval_count"),
+                server_s=(data.get("total_duration") or 0) / 1e9,
+                load_s=load_s,
+                model_cache="miss" if load_s > TRACE_MODEL_LOAD_S else "hit",
+            )
+        return data
+
+
+def _prompt_chars(payload: Dict[str, Any]) -> int:
+    if "input" in payload:
+        return sum(len(t) for t in payload["input"])
+    return len(payload.get("prompt", "")) + len(payload.get("system", ""))
+
+
+def call_llm(
+    model: str,
+    prompt: str,
+    json_mode: bool = False,
+    timeout_s: int = 60,
+    system: Optional[str] = None,
+    schema: Optional[Type[BaseModel]] = None,
+) -> str:
+    """
+    Generate a completion. With a pydantic `schema`, Ollama's `format`
+    parameter constrains decoding to that JSON schema; plain `json_mode`
+    constrains output to any JSON object.
+    """
+    json_mode = json_mode or schema is not None
     if json_mode:
         prompt = (
             "Return ONLY valid JSON. No prose. No markdown.\n"
@@ -50,34 +124,123 @@ def call_llm(model: str, prompt: str, json_mode: bool = False, timeout_s: int =
         "model": model,
         "prompt": prompt,
         "stream": False,
-        "options": {"temperature": 0.2 if json_mode else 0.4},
+        "options": {"temperature": 0.0 if schema else (0.2 if json_mode else 0.4)},
     }
+    if schema is not None:
+        payload["format"] = schema.model_json_schema()
+    elif json_mode:
+        payload["format"] = "json"
+    if system:
+        payload["system"] = system
 
-    r = requests.post(url, json=payload, timeout=timeout_s)
-    r.raise_for_status()
-    return r.json().get("response", "")
+    return _ollama(model, "/api/generate", payload, timeout_s).get("response", "")
+
+
+def parse_structured(text: str, schema: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+    """Validate a structured generation against `schema`. Returns a plain dict or None."""
+    if not text:
+        return None
+    try:
+        data = json.loads(text)
+    except Exception:
+        # Constrained output is plain JSON; repair only as a fallback
+        data = clean_json_response(text)
+    if not isinstance(data, dict):
+        return None
+    try:
+        return schema.model_validate(data).model_dump()
+    except ValidationError:
+        return None
+
+
+def _record_json(task: str, **counts: int) -> None:
+    with _json_stats_lock:
+        st = _json_stats.setdefault(task, {"requests": 0, "generations": 0, "parse_failures": 0, "retries": 0, "failed": 0})
+        for key, n in counts.items():
+            st[key] += n
+
+
+def call_llm_json(
+    model: str,
+    prompt: str,
+    schema: Type[BaseModel],
+    task: str,
+    timeout_s: int = 60,
+    retries: int = 1,
+) -> Optional[Dict[str, Any]]:
+    """
+    Schema-constrained generation + validation. Normally finishes in one
+    generation; `retries` is a safety net whose use is tracked per task.
+    """
+    _record_json(task, requests=1)
+    for attempt in range(retries + 1):
+        if attempt:
+            _record_json(task, retries=1)
+            tracing.add("json_retries")
+        resp = call_llm(model, prompt, timeout_s=timeout_s, schema=schema)
+        _record_json(task, generations=1)
+        data = parse_structured(resp, schema)
+        if data is not None:
+            return data
+        _record_json(task, parse_failures=1)
+        logger.warning(f"Structured output failed validation task={task} attempt={attempt+1}")
+
+    _record_json(task, failed=1)
+    return None
+
+
+def json_generation_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-task parse-failure and retry rates for structured generations."""
+    with _json_stats_lock:
+        out = {}
+        for task, st in _json_stats.items():
+            gens = st["generations"] or 1
+            reqs = st["requests"] or 1
+            out[task] = dict(
+                st,
+                parse_failure_rate=round(st["parse_failures"] / gens, 4),
+                retry_rate=round(st["retries"] / reqs, 4),
+            )
+        return out
 
 
 def call_embed(text: str, model: str = MODEL_EMBEDDING, timeout_s: int = 20) -> Optional[List[float]]:
     if not text:
         return None
+    return call_embed_batch([text], model=model, timeout_s=timeout_s)[0]
 
-    url = f"{OLLAMA_BASE_URL}/api/embeddings"
-    payload = {"model": model, "prompt": text}
 
-    r = requests.post(url, json=payload, timeout=timeout_s)
-    r.raise_for_status()
-    return r.json().get("embedding")
+def call_embed_batch(
+    texts: List[str], model: str = MODEL_EMBEDDING, timeout_s: int = 60
+) -> List[Optional[List[float]]]:
+    """
+    Embed many texts in one /api/embed request. Empty texts map to None.
+    /api/embed returns L2-normalized vectors, so queries and documents must
+    both come through here to stay comparable (see EMBEDDING_VERSION).
+    """
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    todo = [(i, t) for i, t in enumerate(texts) if t]
+    if not todo:
+        return out
+
+    payload = {"model": model, "input": [t for _, t in todo], "truncate": True}
+    embeddings = _ollama(model, "/api/embed", payload, timeout_s).get("embeddings") or []
+    if len(embeddings) != len(todo):
+        raise ValueError(f"/api/embed returned {len(embeddings)} embeddings for {len(todo)} inputs")
+    for (i, _), vector in zip(todo, embeddings):
+        out[i] = vector
+    return out
 
 
-def call_vlm(image_path: str, prompt: str, timeout_s: int = 60) -> str:
+def call_vlm(image_path: str, prompt: str, timeout_s: int = 60, image_bytes: Optional[bytes] = None) -> str:
     """
     Calls Ollama Vision model (e.g., qwen2.5vl:3b).
+    Pass `image_bytes` to send a preprocessed (downscaled) image instead of the file.
     """
-    url = f"{OLLAMA_BASE_URL}/api/generate"
-
-    with open(image_path, "rb") as f:
-        image_base64 = base64.b64encode(f.read()).decode("utf-8")
+    if image_bytes is None:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
 
     payload = {
         "model": MODEL_VISION,
@@ -86,6 +249,33 @@ def call_vlm(image_path: str, prompt: str, timeout_s: int = 60) -> str:
         "stream": False,
     }
 
-    r = requests.post(url, json=payload, timeout=timeout_s)
+    return _ollama(MODEL_VISION, "/api/generate", payload, timeout_s).get("response", "")
+
+
+def preload_model(model: str, timeout_s: int = 120) -> None:
+    """Load a model into Ollama's memory (held for its keep_alive) so the first real call is not a cold start."""
+    if model == MODEL_EMBEDDING:
+        call_embed_batch(["warmup"], model=model, timeout_s=timeout_s)
+    else:
+        # A generate request without a prompt only loads the model
+        _ollama(model, "/api/generate", {"model": model, "stream": False}, timeout_s)
+
+
+def ollama_version(timeout_s: int = 2) -> str:
+    """Ollama server version; raises when the server is unreachable."""
+    r = requests.get(f"{OLLAMA_BASE_URL}/api/version", timeout=timeout_s)
     r.raise_for_status()
-    return r.json().get("response", "")
+    return r.json().get("version", "")
+
+
+def list_running_models(timeout_s: int = 2) -> List[Dict[str, Any]]:
+    """Models Ollama currently holds in memory (GET /api/ps). Empty if unreachable."""
+    try:
+        r = requests.get(f"{OLLAMA_BASE_URL}/api/ps", timeout=timeout_s)
+        r.raise_for_status()
+        return [
+            {"name": m.get("name"), "size_vram": m.get("size_vram"), "expires_at": m.get("expires_at")}
+            for m in r.json().get("models", [])
+        ]
+    except Exception:
+        return []
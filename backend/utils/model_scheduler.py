@@ -0,0 +1,214 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+from backend.config import (
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_DEFAULT_KEEP_ALIVE,
+    LLM_WORKERS,
+    MODEL_SWITCH_MAX_WAIT_S,
+)
+
+logger = logging.getLogger(__name__)
+
+_DURATION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def keep_alive_seconds(value: str) -> float:
+    """Ollama duration string -> seconds (negative = forever)."""
+    m = _DURATION_RE.match(str(value).strip())
+    if not m:
+        return 0.0
+    amount = float(m.group(1))
+    if amount < 0:
+        return float("inf")
+    return amount * _UNIT_SECONDS[m.group(2)]
+
+
+class _Job:
+    __slots__ = ("model", "fn", "args", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, model: str, fn: Callable, args: tuple, kwargs: dict):
+        self.model = model
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+
+
+class ModelScheduler:
+    """
+    Model-affinity scheduler for Ollama calls.
+
+    Pending work is grouped per model. Only one model is "active" at a time:
+    workers keep draining its queue while it is hot, and a different model is
+    admitted only once in-flight work for the active one has finished. A job
+    for another model that has waited longer than max_wait_s stops new
+    admissions for the active model, so nothing starves.
+    """
+
+    def __init__(
+        self,
+        workers: int = LLM_WORKERS,
+        keep_alive: Optional[Dict[str, str]] = None,
+        max_wait_s: float = MODEL_SWITCH_MAX_WAIT_S,
+    ):
+        self.workers = max(1, workers)
+        self.keep_alive_map = dict(OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive)
+        self.max_wait_s = max_wait_s
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Job]] = {}
+        self._active: Optional[str] = None
+        self._in_flight = 0
+        self._swaps = 0
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._threads = []
+        self._local = threading.local()
+
+    # --------------------
+    # Public API
+    # --------------------
+    def keep_alive(self, model: str) -> str:
+        return self.keep_alive_map.get(model, OLLAMA_DEFAULT_KEEP_ALIVE)
+
+    def submit(self, model: str, fn: Callable, *args, **kwargs) -> Future:
+        self._ensure_started()
+        job = _Job(model, fn, args, kwargs)
+        with self._cond:
+            self._queues.setdefault(model, deque()).append(job)
+            self._model_stats(model)
+            self._cond.notify_all()
+        return job.future
+
+    def run(self, model: str, fn: Callable, *args, **kwargs) -> Any:
+        """Submit and wait. Nested calls from a scheduler worker run inline."""
+        if getattr(self._local, "in_worker", False):
+            return fn(*args, **kwargs)
+        return self.submit(model, fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            models = {}
+            for model, st in self._stats.items():
+                last_used = st["last_used"]
+                models[model] = {
+                    "calls": st["calls"],
+                    "errors": st["errors"],
+                    "loads": st["loads"],
+                    "queued": len(self._queues.get(model, ())),
+                    "avg_wait_s": round(st["wait_s"] / st["calls"], 3) if st["calls"] else 0.0,
+                    "avg_run_s": round(st["run_s"] / st["calls"], 3) if st["calls"] else 0.0,
+                    "keep_alive": self.keep_alive(model),
+                    "last_used": last_used,
+                    # Estimate only: Ollama may still evict earlier under memory pressure
+                    "resident": bool(last_used)
+                    and now - last_used < keep_alive_seconds(self.keep_alive(model)),
+                }
+            return {
+                "active_model": self._active,
+                "in_flight": self._in_flight,
+                "swaps": self._swaps,
+                "workers": self.workers,
+                "models": models,
+            }
+
+    # --------------------
+    # Internals
+    # --------------------
+    def _model_stats(self, model: str) -> Dict[str, Any]:
+        st = self._stats.get(model)
+        if st is None:
+            st = {"calls": 0, "errors": 0, "loads": 0, "wait_s": 0.0, "run_s": 0.0, "last_used": None}
+            self._stats[model] = st
+        return st
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"model-sched-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _pick(self) -> Optional[_Job]:
+        """Select the next job (caller holds the lock)."""
+        now = time.time()
+        waiting = {m: q for m, q in self._queues.items() if q}
+        if not waiting:
+            return None
+
+        others = [q[0].enqueued_at for m, q in waiting.items() if m != self._active]
+        starving = any(now - ts > self.max_wait_s for ts in others)
+
+        active_q = waiting.get(self._active) if self._active else None
+        if active_q and not starving:
+            return active_q.popleft()
+
+        if self._in_flight > 0:
+            # Let the active model drain before loading another one
+            return None
+
+        if starving:
+            # Oldest waiting job wins
+            model = min(waiting, key=lambda m: waiting[m][0].enqueued_at)
+        else:
+            # Most pending work per load
+            model = max(waiting, key=lambda m: (len(waiting[m]), -waiting[m][0].enqueued_at))
+
+        if model != self._active:
+            if self._active is not None:
+                self._swaps += 1
+            logger.info(f"Model scheduler: switching {self._active} -> {model} (pending={len(waiting[model])})")
+            self._active = model
+            self._model_stats(model)["loads"] += 1
+        return waiting[model].popleft()
+
+    def _worker(self) -> None:
+        self._local.in_worker = True
+        while True:
+            with self._cond:
+                job = self._pick()
+                while job is None:
+                    self._cond.wait(timeout=0.5)
+                    job = self._pick()
+                self._in_flight += 1
+                st = self._model_stats(job.model)
+
+            if not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+                continue
+
+            started = time.time()
+            error = False
+            try:
+                job.future.set_result(job.fn(*job.args, **job.kwargs))
+            except BaseException as e:
+                error = True
+                job.future.set_exception(e)
+            finally:
+                finished = time.time()
+                with self._cond:
+                    self._in_flight -= 1
+                    st["calls"] += 1
+                    st["errors"] += int(error)
+                    st["wait_s"] += started - job.enqueued_at
+                    st["run_s"] += finished - started
+                    st["last_used"] = finished
+                    self._cond.notify_all()
+
+
+# Singleton shared by every llm_client call
+scheduler = ModelScheduler()
@@ -0,0 +1,26 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque keyset cursor from the sort key of the last row on a page."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, n: int) -> Optional[List[Any]]:
+    """Inverse of encode_cursor; None when the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != n:
+        return None
+    return values
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
@@ -0,0 +1,56 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+# Output schemas for structured (schema-constrained) Ollama generations.
+# The JSON schema of each model is sent as the `format` parameter, so the
+# model can only emit objects that validate against it.
+
+
+class ActionItemSchema(BaseModel):
+    task: str
+    owner: str = "user"
+    priority: Literal["high", "medium", "low"] = "medium"
+
+
+class MetadataSchema(BaseModel):
+    summary_1line: str
+    summary_bullets: List[str] = Field(default_factory=list)
+    entities: List[str] = Field(default_factory=list)
+    topics: List[str] = Field(default_factory=list)
+    action_items: List[ActionItemSchema] = Field(default_factory=list)
+    intent: Literal["informational", "task", "reminder", "general"] = "general"
+
+
+class SummarySchema(BaseModel):
+    summary_1line: str
+    summary_bullets: List[str] = Field(default_factory=list)
+
+
+class ClusterSummarySchema(BaseModel):
+    label: str
+    summary: str
+
+
+class SupportedClaim(BaseModel):
+    claim: str
+    evidence_ids: List[str] = Field(default_factory=list)
+
+
+class UnsupportedClaim(BaseModel):
+    claim: str
+    reason: str = "Unsupported"
+
+
+class Contradiction(BaseModel):
+    claim: str
+    conflicting_evidence_ids: List[str] = Field(default_factory=list)
+
+
+class VerificationSchema(BaseModel):
+    supported_claims: List[SupportedClaim] = Field(default_factory=list)
+    unsupported_claims: List[UnsupportedClaim] = Field(default_factory=list)
+    contradictions: List[Contradiction] = Field(default_factory=list)
+    needs_followup_questions: List[str] = Field(default_factory=list)
+    confidence_score: int = Field(ge=0, le=100)
+    uncertainty_flags: List[str] = Field(default_factory=list)
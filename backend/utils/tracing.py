@@ -0,0 +1,155 @@
+"""
+Opt-in per-request tracing: nested, timed spans with attributes (token
+counts, prompt sizes, cache hits, SQL statements) for one query.
+
+    with tracing.trace("query", query=q) as t:
+        with tracing.span("retrieval"):
+            tracing.annotate(candidates=12)
+    t.to_dict()
+
+The active span lives in a context variable, so span()/annotate()/add()
+are no-ops (one ContextVar lookup) when no trace is running, and
+instrumented code does not need to know whether it is traced. Work handed
+to other threads (e.g. the model scheduler's workers) is attributed to the
+span of the thread that waits for it.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from backend.config import TRACE_RECENT
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "attrs", "children")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.children: List["Span"] = []
+
+    @property
+    def duration_s(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        attrs = {k: round(v, 4) if isinstance(v, float) else v for k, v in self.attrs.items()}
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round(self.duration_s * 1000, 1),
+            **({"attrs": attrs} if attrs else {}),
+            **({"children": [c.to_dict(origin) for c in self.children]} if self.children else {}),
+        }
+
+
+class Trace:
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.started_at = datetime.utcnow()
+        self.root = Span(name, attrs)
+
+    @property
+    def duration_s(self) -> float:
+        return self.root.duration_s
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.root.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_s * 1000, 1),
+            "attrs": self.root.attrs,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "started_at": self.started_at.isoformat(), **self.root.to_dict(self.root.start)}
+
+
+class TraceLog:
+    """Ring buffer of the most recent finished traces."""
+
+    def __init__(self, size: int = TRACE_RECENT):
+        self._traces: Deque[Trace] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, t: Trace) -> None:
+        with self._lock:
+            self._traces.append(t)
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces)
+        return [t.summary() for t in sorted(traces, key=lambda t: -t.duration_s)[:limit]]
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            found = next((t for t in self._traces if t.id == trace_id), None)
+        return found.to_dict() if found else None
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+# Singleton read by the /traces admin endpoints
+recent_traces = TraceLog()
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    """Start a trace rooted at this block; it is kept in recent_traces when the block ends."""
+    t = Trace(name, attrs)
+    token = _current.set(t.root)
+    try:
+        yield t
+    except Exception as e:
+        t.root.attrs["error"] = repr(e)
+        raise
+    finally:
+        t.root.end = time.perf_counter()
+        _current.reset(token)
+        recent_traces.add(t)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """A child of the active span; yields None (and records nothing) outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(name, attrs)
+    parent.children.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.attrs["error"] = repr(e)
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current.reset(token)
+
+
+def annotate(**attrs: Any) -> None:
+    """Set attributes on the active span (None values are skipped)."""
+    s = _current.get()
+    if s is not None:
+        s.attrs.update((k, v) for k, v in attrs.items() if v is not None)
+
+
+def add(key: str, amount: float = 1) -> None:
+    """Accumulate a counter attribute on the active span (e.g. SQL statements)."""
+    s = _current.get()
+    if s is not None:
+        s.attrs[key] = s.attrs.get(key, 0) + amount
+
+
+def active() -> bool:
+    return _current.get() is not None
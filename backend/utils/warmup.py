@@ -0,0 +1,82 @@
+"""
+Background warmup for the API: loads the vector index and preloads the
+query-path Ollama models so the first query does not pay for them.
+/ready reports ready() and stays 503 until every step has succeeded;
+failed steps (typically Ollama still starting) are retried.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.config import WARMUP_MODELS, WARMUP_TIMEOUT_S, WARMUP_RETRY_S
+from backend.memory.vector_store import store
+from backend.utils.llm_client import ollama_version, preload_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    def __init__(self, models: Optional[List[str]] = None, retry_s: float = WARMUP_RETRY_S):
+        self.models = list(WARMUP_MODELS if models is None else models)
+        self.retry_s = retry_s
+        self.state = "idle"  # idle -> running -> done
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Warmup":
+        self.state = "running"
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _plan(self) -> List[Tuple[str, Callable[[], Any]]]:
+        plan = [("vector_store", store.ensure_loaded), ("ollama", ollama_version)]
+        plan += [(f"model:{m}", lambda m=m: preload_model(m, timeout_s=WARMUP_TIMEOUT_S)) for m in self.models]
+        return plan
+
+    def _run(self) -> None:
+        t0 = time.time()
+        pending = self._plan()
+        while pending and not self._stop.is_set():
+            failed = []
+            for name, func in pending:
+                if not self._step(name, func):
+                    failed.append((name, func))
+                    if name == "ollama":
+                        # Model loads cannot succeed either; retry from here next round
+                        failed += pending[pending.index((name, func)) + 1 :]
+                        break
+            pending = failed
+            if pending:
+                self._stop.wait(self.retry_s)
+        if not pending:
+            self.state = "done"
+            logger.info(f"Warmup finished in {time.time() - t0:.1f}s")
+
+    def _step(self, name: str, func: Callable[[], Any]) -> bool:
+        t0 = time.time()
+        try:
+            func()
+            self.steps[name] = {"ok": True, "duration_s": round(time.time() - t0, 2)}
+            return True
+        except Exception as e:
+            attempts = self.steps.get(name, {}).get("attempts", 0) + 1
+            self.steps[name] = {"ok": False, "error": str(e), "attempts": attempts}
+            logger.warning(f"Warmup step {name} failed (attempt {attempts}): {e}")
+            return False
+
+    def ready(self) -> bool:
+        return self.state == "done"
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "steps": dict(self.steps)}
+
+
+# Singleton started by the API lifespan (WARMUP_ON_START)
+warmup = Warmup()
@@ -1,46 +1,98 @@
 import subprocess
 import os
+import hashlib
 import logging
-from backend.config import WHISPER_EXE, WHISPER_MODEL
+import tempfile
+from typing import Optional
+from backend.config import (
+    WHISPER_EXE,
+    WHISPER_MODEL,
+    WHISPER_THREADS,
+    WHISPER_SEGMENT_TIMEOUT_S,
+    WHISPER_FILE_TIMEOUT_S,
+    TRANSCRIPT_CACHE_DIR,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def audio_cache_key(data: bytes) -> str:
+    """Cache key for a transcript: audio bytes + the model that transcribed them."""
+    h = hashlib.sha256(data)
+    h.update(os.path.basename(WHISPER_MODEL).encode("utf-8"))
+    return h.hexdigest()
+
+
+def cached_transcript(key: str) -> Optional[str]:
+    path = os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.txt")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store_transcript(key: str, text: str) -> None:
+    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.txt")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)  # atomic: concurrent readers never see a partial file
+
+
+def run_whisper(audio_path: str, threads: int = WHISPER_THREADS, timeout_s: int = WHISPER_SEGMENT_TIMEOUT_S) -> str:
+    """Run whisper.cpp on one file; output goes to a temp dir, not next to the input."""
+    with tempfile.TemporaryDirectory(prefix="whisper_") as tmp:
+        out_base = os.path.join(tmp, "out")
+        command = [
+            WHISPER_EXE,
+            "-m", WHISPER_MODEL,
+            "-f", audio_path,
+            "-t", str(threads),
+            "-otxt",            # write <out_base>.txt
+            "-of", out_base,
+            "-np"   # No progress bar to keep stdout clean
+        ]
+        logger.info(f"Running Whisper: {' '.join(command)}")
+        subprocess.run(command, check=True, timeout=timeout_s, capture_output=True)
+
+        txt_path = out_base + ".txt"
+        if not os.path.exists(txt_path):
+            logger.error(f"Whisper output file not found: {txt_path}")
+            return ""
+        with open(txt_path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+
+
+def transcribe_file_cached(
+    audio_path: str, data: Optional[bytes] = None, timeout_s: int = WHISPER_SEGMENT_TIMEOUT_S
+) -> str:
+    """Transcribe one audio file (or segment), reusing the transcript cache by audio hash."""
+    if data is None:
+        with open(audio_path, "rb") as f:
+            data = f.read()
+    key = audio_cache_key(data)
+    cached = cached_transcript(key)
+    if cached is not None:
+        return cached
+
+    text = run_whisper(audio_path, timeout_s=timeout_s)
+    store_transcript(key, text)
+    return text
+
+
 def transcribe_audio(audio_path: str) -> str:
-    """Uses local whisper.cpp to transcribe audio file."""
+    """Uses local whisper.cpp to transcribe a whole audio file (cached by audio hash)."""
     if not os.path.exists(audio_path):
         logger.error(f"File not found: {audio_path}")
         return ""
-    
-    # Run whisper with text output to stdout or file
-    # Using subprocess to capture output
-    command = [
-        WHISPER_EXE,
-        "-m", WHISPER_MODEL,
-        "-f", audio_path,
-        "-otxt", # Outputs .txt file alongside input
-        "-np"   # No progress bar to keep stdout clean
-    ]
-    
+
     try:
-        logger.info(f"Running Whisper: {' '.join(command)}")
-        subprocess.run(command, check=True, timeout=600, capture_output=True)
-        
-        # Read the generated .txt file
-        txt_path = audio_path + ".txt"
-        if os.path.exists(txt_path):
-            with open(txt_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            # Clean up default txt output if desired, or keep it as artifact? 
-            # User wants persistent audio files, maybe keep text too as cache.
-            # But we return the content for ingestion.
-            return content.strip()
-        else:
-            logger.error(f"Whisper output file not found: {txt_path}")
-            return ""
-            
+        return transcribe_file_cached(audio_path, timeout_s=WHISPER_FILE_TIMEOUT_S)
     except subprocess.CalledProcessError as e:
-        logger.error(f"Whisper command failed: {e.stderr.decode('utf-8')}")
+        logger.error(f"Whisper command failed: {e.stderr.decode('utf-8', 'ignore') if e.stderr else e}")
         return ""
     except Exception as e:
         logger.error(f"Unexpected error in whisper transcription: {e}")
@@ -1,6 +1,8 @@
 from typing import Dict, Any, List
-from backend.utils.llm_client import call_llm
-from backend.config import MODEL_BACKUP
+from backend.utils.llm_client import call_llm_json
+from backend.utils.schemas import VerificationSchema
+from backend.utils.tracing import span, annotate
+from backend.config import MODEL_MAIN, MODEL_BACKUP, VERIFY_WITH_MAIN_MODEL
 
 class Validator:
     def verify(self, query: str, answer: str, evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -48,16 +50,17 @@ class Validator:
         }}
         """
         
-        # Use Backup model (Phi) for validation logic
-        model = MODEL_BACKUP
+        # Use Backup model (Phi) for validation logic, unless configured to
+        # reuse the already-resident main model and avoid a model swap
+        model = MODEL_MAIN if VERIFY_WITH_MAIN_MODEL else MODEL_BACKUP
         
-        # Retry logic for JSON validation
-        for _ in range(2):
-            response_str = call_llm(model, prompt, json_mode=True)
-            data = self._parse_json(response_str)
-            if data and "confidence_score" in data:
-                return self._finalize_result(data)
-                
+        # Schema-constrained generation: one round trip in the normal case
+        with span("validator.check", model=model, evidence_docs=len(evidence), evidence_chars=len(evidence_content)):
+            data = call_llm_json(model, prompt, VerificationSchema, task="verification")
+            annotate(parsed=bool(data))
+        if data:
+            return self._finalize_result(data)
+
         # Final fallback
         return {
             "confidence": 35, 
@@ -67,19 +70,6 @@ class Validator:
             "reasoning": "Validator produced invalid JSON."
         }
 
-    def _parse_json(self, text: str) -> Dict[str, Any]:
-        """Robust JSON extraction."""
-        import json
-        try:
-            # Try finding first { and last }
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1:
-                return json.loads(text[start:end+1])
-            return json.loads(text)
-        except:
-            return None
-
     def _finalize_result(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Consistent scoring policy."""
         score = 85 # Base score
@@ -0,0 +1,263 @@
+"""
+Deterministic stand-in for the Ollama HTTP API.
+
+Implements the endpoints the backend uses (/api/generate incl. streaming and
+`format` schemas, /api/embeddings, /api/embed, /api/ps, /api/tags) with
+configurable latency, token rate and model-swap cost. Same input -> same
+output, so benchmark runs are comparable between versions.
+
+    python -m bench.fake_ollama --port 11434 --latency-ms 20 --tokens-per-s 200
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+_WORDS = (
+    "project deadline meeting review budget design memory report draft team "
+    "schedule notes client update plan research summary invoice release task "
+    "friday monday alpha beta roadmap decision risk owner milestone"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8", "ignore")).digest()[:8], "big")
+
+
+def fake_embedding(text: str, dim: int = 768) -> List[float]:
+    """Unit-norm pseudo-random vector keyed on the text."""
+    rng = random.Random(_seed(text))
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def fake_text(prompt: str, n_words: int) -> str:
+    rng = random.Random(_seed(prompt))
+    return " ".join(rng.choice(_WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def fake_structured(prompt: str, schema: Any) -> Dict[str, Any]:
+    """Canned object that validates against the backend's output schemas."""
+    props = schema.get("properties", {}) if isinstance(schema, dict) else {}
+    rng = random.Random(_seed(prompt))
+    words = lambda n: " ".join(rng.choice(_WORDS) for _ in range(n))
+
+    if "confidence_score" in props:
+        return {
+            "supported_claims": [{"claim": words(6), "evidence_ids": []}],
+            "unsupported_claims": [],
+            "contradictions": [],
+            "needs_followup_questions": [],
+            "confidence_score": 80,
+            "uncertainty_flags": [],
+        }
+    if "summary_1line" in props:
+        return {
+            "summary_1line": words(8).capitalize(),
+            "summary_bullets": [words(6) for _ in range(3)],
+            "entities": sorted({rng.choice(_WORDS).title() for _ in range(3)}),
+            "topics": sorted({rng.choice(_WORDS) for _ in range(2)}),
+            "action_items": [{"task": words(5), "owner": "user", "priority": "medium"}],
+            "intent": "informational",
+        }
+    # Unknown schema: fill declared properties with plausible values
+    out: Dict[str, Any] = {}
+    for key, spec in props.items():
+        kind = spec.get("type") if isinstance(spec, dict) else None
+        out[key] = [] if kind == "array" else 0 if kind in ("integer", "number") else words(4)
+    return out
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 20.0,
+        tokens_per_s: float = 200.0,
+        swap_ms: float = 0.0,
+        response_words: int = 48,
+        dim: int = 768,
+    ):
+        self.latency_s = latency_ms / 1000.0
+        self.tokens_per_s = tokens_per_s
+        self.swap_s = swap_ms / 1000.0
+        self.response_words = response_words
+        self.dim = dim
+
+        self._lock = threading.Lock()
+        self._loaded: Optional[str] = None
+        self._last_used: Dict[str, float] = {}
+        self.stats = {"requests": 0, "swaps": 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # --------------------
+    # Simulated cost model
+    # --------------------
+    def _use_model(self, model: str) -> None:
+        """Single-slot residency: switching models costs swap_ms."""
+        with self._lock:
+            self.stats["requests"] += 1
+            swap = self._loaded is not None and self._loaded != model
+            if swap:
+                self.stats["swaps"] += 1
+            self._loaded = model
+            self._last_used[model] = time.time()
+        time.sleep(self.latency_s + (self.swap_s if swap else 0.0))
+
+    def _token_delay(self, n_tokens: int) -> float:
+        return n_tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):  # keep benchmark output clean
+                pass
+
+            def _send_json(self, obj: Dict[str, Any], status: int = 200) -> None:
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/api/ps":
+                    with fake._lock:
+                        models = [{"name": fake._loaded, "size_vram": 0}] if fake._loaded else []
+                    self._send_json({"models": models})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                elif self.path == "/api/tags":
+                    with fake._lock:
+                        names = sorted(fake._last_used)
+                    self._send_json({"models": [{"name": n} for n in names]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                try:
+                    payload = self._read_json()
+                except Exception:
+                    self._send_json({"error": "bad json"}, status=400)
+                    return
+
+                model = payload.get("model", "")
+                if self.path == "/api/generate":
+                    self._generate(model, payload)
+                elif self.path == "/api/embeddings":
+                    fake._use_model(model)
+                    self._send_json({"embedding": fake_embedding(payload.get("prompt", ""), fake.dim)})
+                elif self.path == "/api/embed":
+                    fake._use_model(model)
+                    inputs = payload.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    self._send_json({"model": model, "embeddings": [fake_embedding(t, fake.dim) for t in inputs]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def _generate(self, model: str, payload: Dict[str, Any]) -> None:
+                prompt = payload.get("prompt", "")
+                fmt = payload.get("format")
+                fake._use_model(model)
+
+                if isinstance(fmt, dict):
+                    text = json.dumps(fake_structured(prompt, fmt))
+                elif fmt == "json":
+                    text = "{}"
+                else:
+                    text = fake_text(prompt, fake.response_words)
+
+                tokens = text.split(" ")
+                prompt_tokens = len(prompt.split())
+
+                if not payload.get("stream", True):
+                    time.sleep(fake._token_delay(len(tokens)))
+                    self._send_json({
+                        "model": model,
+                        "response": text,
+                        "done": True,
+                        "prompt_eval_count": prompt_tokens,
+                        "eval_count": len(tokens),
+                    })
+                    return
+
+                # Streaming: NDJSON chunks paced at tokens_per_s
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                per_token = fake._token_delay(1)
+                for i, tok in enumerate(tokens):
+                    time.sleep(per_token)
+                    piece = tok if i == 0 else " " + tok
+                    self._chunk({"model": model, "response": piece, "done": False})
+                self._chunk({
+                    "model": model,
+                    "response": "",
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": len(tokens),
+                })
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, obj: Dict[str, Any]) -> None:
+                data = (json.dumps(obj) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fixed cost per request")
+    parser.add_argument("--tokens-per-s", type=float, default=200.0, help="generation rate (0 = instant)")
+    parser.add_argument("--swap-ms", type=float, default=0.0, help="extra cost when the model changes")
+    parser.add_argument("--response-words", type=int, default=48)
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.host, args.port, args.latency_ms, args.tokens_per_s, args.swap_ms, args.response_words)
+    print(f"Fake Ollama listening on {fake.url}")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the whisper.cpp `main` binary.
+
+Accepts the flags the backend passes (-m, -f, -otxt, -of, -np, -t) and writes
+a deterministic transcript to <input>.txt (or <-of>.txt), like whisper.cpp.
+Point AI_MINDS_WHISPER_EXE at this file (it must be executable).
+
+Cost model (env): FAKE_WHISPER_DELAY_S fixed startup cost (default 0.05),
+FAKE_WHISPER_S_PER_MB time per MB of audio (default 0.5).
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+_WORDS = "okay so the meeting about the project deadline moved to friday please send the report".split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-m", dest="model")
+    parser.add_argument("-f", dest="file", required=True)
+    parser.add_argument("-of", dest="output_base")
+    parser.add_argument("-t", dest="threads", type=int, default=4)
+    parser.add_argument("-otxt", action="store_true")
+    parser.add_argument("-np", action="store_true")
+    args, _ = parser.parse_known_args()
+
+    if not os.path.exists(args.file):
+        print(f"error: failed to open '{args.file}'", file=sys.stderr)
+        return 1
+
+    with open(args.file, "rb") as f:
+        data = f.read()
+
+    delay = float(os.environ.get("FAKE_WHISPER_DELAY_S", "0.05"))
+    per_mb = float(os.environ.get("FAKE_WHISPER_S_PER_MB", "0.5"))
+    time.sleep(delay + per_mb * len(data) / (1024 * 1024))
+
+    rng = random.Random(hashlib.sha256(data).hexdigest())
+    n_words = 20 + len(data) // 2048
+    text = " ".join(rng.choice(_WORDS) for _ in range(n_words))
+
+    if args.otxt:
+        out_path = (args.output_base or args.file) + ".txt"
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+End-to-end benchmark suite against the fake Ollama server and fake whisper.
+
+Each corpus size runs in its own subprocess with scratch DB/vector store/inbox,
+so peak RSS is per size and nothing touches the real memory store.
+
+    python -m bench.run_bench --sizes 1000 10000 100000 --out bench_results.json
+    python -m bench.run_bench --sizes 1000 --compare bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+
+_QUERIES = [
+    "What did I decide about the project deadline?",
+    "Summarize the last meeting notes",
+    "Which tasks are open for the alpha release?",
+    "What is in the budget report?",
+    "Who owns the roadmap review?",
+]
+
+
+# --------------------
+# Measurement helpers
+# --------------------
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float], wall_s: float) -> Dict[str, Any]:
+    return {
+        "n": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "throughput_per_s": round(len(samples) / wall_s, 3) if wall_s > 0 else 0.0,
+    }
+
+
+def timed(fn: Callable[[int], Any], n: int) -> Dict[str, Any]:
+    samples = []
+    wall0 = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - wall0)
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        try:
+            import psutil
+
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except Exception:
+            return None
+
+
+# --------------------
+# Child: one corpus size
+# --------------------
+def _prepare_env(scratch: Path, ollama_url: str) -> None:
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    os.environ["AI_MINDS_DB_PATH"] = str(scratch / "ai_minds.db")
+    os.environ["AI_MINDS_VECTOR_STORE_PATH"] = str(scratch / "vector_store")
+    os.environ["AI_MINDS_INBOX_DIR"] = str(scratch / "inbox")
+    os.environ["AI_MINDS_WHISPER_EXE"] = str(BENCH_DIR / "fake_whisper.py")
+    os.environ["AI_MINDS_WHISPER_MODEL"] = "fake-model.bin"
+    os.environ["AI_MINDS_TRANSCRIPT_CACHE_DIR"] = str(scratch / "transcripts")
+    os.environ["AI_MINDS_BACKFILL_DIR"] = str(scratch / "backfill")
+
+
+def _seed_corpus(n: int, dim: int) -> float:
+    """Insert n memories (rows + vectors) directly, bypassing the LLM path."""
+    import numpy as np
+    from backend.database import SessionLocal, MemoryEvent, ActionItem
+    from backend.memory.vector_store import store
+
+    t0 = time.perf_counter()
+    rng = random.Random(1234)
+    np_rng = np.random.default_rng(1234)
+    words = "project deadline meeting review budget design memory report draft team plan".split()
+    chunk = 5000
+
+    session = SessionLocal()
+    try:
+        for start in range(0, n, chunk):
+            count = min(chunk, n - start)
+            events, actions, ids = [], [], []
+            for i in range(start, start + count):
+                event_id = f"seed-{i:08d}"
+                ids.append(event_id)
+                text = " ".join(rng.choice(words) for _ in range(80))
+                events.append({
+                    "id": event_id,
+                    "created_at": datetime(2024, 1, 1) + (datetime(2024, 1, 2) - datetime(2024, 1, 1)) * (i / 100.0),
+                    "source_type": "text",
+                    "source_path": f"seed/{i}.txt",
+                    "content_hash": f"seed-hash-{i}",
+                    "raw_text": text,
+                    "metadata_json": {},
+                    "summary_1line": text[:60],
+                    "summary_short": "- seeded",
+                    "entities": [rng.choice(words).title()],
+                    "topics": [rng.choice(words)],
+                    "intent_label": "informational",
+                    "embedding_ref": str(store.next_id + (i - start)),
+                })
+                if i % 10 == 0:
+                    actions.append({
+                        "id": f"seed-action-{i:08d}",
+                        "task": f"Follow up on {rng.choice(words)}",
+                        "owner": "user",
+                        "priority": rng.choice(["high", "medium", "low"]),
+                        "status": rng.choice(["open", "done"]),
+                        "evidence_event_id": event_id,
+                        "created_at": datetime(2024, 1, 1),
+                    })
+
+            vectors = np_rng.standard_normal((count, dim)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            with store.lock:
+                store.index.add(vectors)
+                for offset, event_id in enumerate(ids):
+                    store.id_map[store.next_id + offset] = event_id
+                store.next_id += count
+
+            session.execute(MemoryEvent.__table__.insert(), events)
+            if actions:
+                session.execute(ActionItem.__table__.insert(), actions)
+            session.commit()
+    finally:
+        session.close()
+
+    store.save()
+    return time.perf_counter() - t0
+
+
+def _make_inbox_files(scratch: Path, n_text: int, n_audio: int) -> List[tuple]:
+    from backend.config import WATCH_DIRS
+
+    rng = random.Random(99)
+    files = []
+    for i in range(n_text):
+        path = Path(WATCH_DIRS["text"]) / "bench" / f"note_{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"Bench note {i}: " + " ".join(str(rng.random()) for _ in range(200)), encoding="utf-8")
+        files.append((str(path), "text"))
+    for i in range(n_audio):
+        path = Path(WATCH_DIRS["audio"]) / "bench" / f"clip_{i}.wav"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_speechlike_wav(str(path), seconds=90, seed=i)
+        files.append((str(path), "audio"))
+    return files
+
+
+def write_speechlike_wav(path: str, seconds: int, seed: int = 0, rate: int = 16000) -> None:
+    """16 kHz mono PCM: noisy 'utterances' of 2-8 s separated by 0.5-1.5 s pauses."""
+    import wave
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    out, total = [], 0
+    while total < seconds * rate:
+        talk = int(rng.uniform(2, 8) * rate)
+        pause = int(rng.uniform(0.5, 1.5) * rate)
+        out.append((rng.standard_normal(talk) * 6000).astype(np.int16))
+        out.append((rng.standard_normal(pause) * 30).astype(np.int16))
+        total += talk + pause
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.concatenate(out)[: seconds * rate].tobytes())
+
+
+def _start_api(port: int):
+    import requests
+    import uvicorn
+    from backend.app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    if not server.started:
+        raise RuntimeError("API server did not start")
+    # Measure warm queries only: wait until the warmup has loaded the index and models
+    while time.time() < deadline:
+        if requests.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+            break
+        time.sleep(0.1)
+    return server
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_size(args: argparse.Namespace) -> Dict[str, Any]:
+    # Make the repo importable when run as a file, not only as `-m bench.run_bench`
+    sys.path.insert(0, str(ROOT_DIR))
+    from bench.fake_ollama import FakeOllama
+
+    scratch = Path(tempfile.mkdtemp(prefix=f"ai_minds_bench_{args.size}_"))
+    fake = FakeOllama(latency_ms=args.latency_ms, tokens_per_s=args.tokens_per_s, swap_ms=args.swap_ms).start()
+    _prepare_env(scratch, fake.url)
+
+    import logging
+
+    logging.disable(logging.WARNING)  # backend logs at INFO per stage; keep output machine-readable
+
+    # Backend imports must follow _prepare_env: config is read at import time
+    import requests
+    from backend.database import init_db
+    from backend.ingest.processor import IngestionProcessor
+    from backend.retrieval.search import search_memory
+    from backend.retrieval.reasoning import ReasoningEngine
+    from backend.memory.vector_store import store
+
+    init_db()
+    result: Dict[str, Any] = {"size": args.size, "benchmarks": {}}
+    result["seed_s"] = round(_seed_corpus(args.size, store.dimension), 3)
+    benches = result["benchmarks"]
+
+    files = _make_inbox_files(scratch, args.ingest_files, args.audio_files if os.name != "nt" else 0)
+    processor = IngestionProcessor()
+    benches["ingest_file"] = timed(lambda i: processor.process_file(*files[i]), len(files))
+
+    benches["search_memory"] = timed(lambda i: search_memory(_QUERIES[i % len(_QUERIES)]), args.queries)
+
+    engine = ReasoningEngine()
+    benches["reasoning_process_query"] = timed(
+        lambda i: engine.process_query(_QUERIES[i % len(_QUERIES)]), max(1, args.queries // 4)
+    )
+
+    port = _free_port()
+    server = _start_api(port)
+    api = f"http://127.0.0.1:{port}"
+    http = requests.Session()
+    try:
+        benches["api_query"] = timed(
+            lambda i: http.post(f"{api}/query", json={"query": _QUERIES[i % len(_QUERIES)]}).raise_for_status(),
+            max(1, args.queries // 4),
+        )
+        benches["api_timeline"] = timed(lambda i: http.get(f"{api}/timeline", params={"limit": 50}).raise_for_status(), args.queries)
+        benches["api_actions"] = timed(lambda i: http.get(f"{api}/actions").raise_for_status(), args.queries)
+    finally:
+        server.should_exit = True
+
+    result["fake_ollama"] = dict(fake.stats)
+    result["peak_rss_mb"] = peak_rss_mb()
+    fake.stop()
+    return result
+
+
+# --------------------
+# Parent: orchestrate + compare
+# --------------------
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    old_by_size = {r["size"]: r for r in baseline.get("results", [])}
+    print(f"{'size':>8} {'benchmark':<26} {'p50 ms':>18} {'p99 ms':>18} {'ops/s':>18}")
+    for res in current.get("results", []):
+        old = old_by_size.get(res["size"])
+        if not old:
+            continue
+        for name, cur in res["benchmarks"].items():
+            prev = old["benchmarks"].get(name)
+            if not prev:
+                continue
+            cells = []
+            for key in ("p50_ms", "p99_ms", "throughput_per_s"):
+                a, b = prev[key], cur[key]
+                delta = f"{(b - a) / a * 100:+.0f}%" if a else "n/a"
+                cells.append(f"{b:>10.1f} ({delta:>5})")
+            print(f"{res['size']:>8} {name:<26} " + " ".join(cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI MINDS end-to-end benchmarks (fake models)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ingest-files", type=int, default=20)
+    parser.add_argument("--audio-files", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--swap-ms", type=float, default=0.0)
+    parser.add_argument("--out", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)  # child mode
+    args = parser.parse_args()
+
+    if args.size is not None:
+        print(json.dumps(run_size(args)))
+        return
+
+    results = []
+    for size in args.sizes:
+        cmd = [sys.executable, "-m", "bench.run_bench", "--size", str(size)]
+        for flag in ("ingest_files", "audio_files", "queries", "latency_ms", "tokens_per_s", "swap_ms"):
+            cmd += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+        print(f"[bench] size={size} ...", file=sys.stderr)
+        proc = subprocess.run(cmd, cwd=ROOT_DIR, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            raise SystemExit(f"benchmark for size={size} failed")
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "git_rev": _git_rev(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: getattr(args, k) for k in ("ingest_files", "audio_files", "queries", "latency_ms", "tokens_per_s", "swap_ms")},
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,69 @@ from datetime import datetime
 
 # Config
 API_URL = "http://127.0.0.1:8000"
+TIMELINE_MAX_ROWS = 2000  # newest events kept in the session
+PAGE_LIMITS = {"/timeline": 500, "/actions": 1000}  # the endpoints' max page sizes
+
+
+def fetch_feed(path, params, max_rows=None):
+    """
+    Rows of /timeline or /actions kept in st.session_state across reruns.
+
+    The first call pages through the feed once; later reruns send ?since=,
+    so an unchanged feed is an empty answer without a scan and a changed one
+    returns only the rows written since (merged by id). Returns the feed
+    dict; feed["version"] changes whenever its rows did.
+    """
+    key = f"feed:{path}:{sorted(params.items())}"
+    feed = st.session_state.get(key)
+    limit = PAGE_LIMITS[path]
+
+    if feed is not None:
+        changed = False
+        while True:
+            res = requests.get(f"{API_URL}{path}", params={**params, "since": feed["cursor"], "limit": limit}, timeout=5)
+            if res.status_code == 410:  # backend database was reset: reload from scratch
+                feed = None
+                break
+            res.raise_for_status()
+            for row in res.json():
+                if row.get("deleted"):
+                    feed["rows"].pop(row["id"], None)
+                else:
+                    feed["rows"][row["id"]] = row
+                changed = True
+            feed["cursor"] = res.headers["X-Feed-Cursor"]
+            if "X-Next-Cursor" not in res.headers:
+                break
+        if feed is not None:
+            if changed:
+                feed["version"] += 1
+            return feed
+
+    rows, cursor, feed_cursor = {}, None, None
+    while True:
+        res = requests.get(f"{API_URL}{path}", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})},
+                           timeout=10)
+        res.raise_for_status()
+        feed_cursor = feed_cursor or res.headers["X-Feed-Cursor"]  # changes while paging arrive as deltas
+        rows.update((row["id"], row) for row in res.json())
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor or (max_rows and len(rows) >= max_rows):
+            break
+    feed = {"rows": rows, "cursor": feed_cursor, "version": 0}
+    st.session_state[key] = feed
+    return feed
+
+
+def timeline_frame(feed):
+    """Newest-first DataFrame of the timeline, rebuilt only when the feed changed."""
+    if feed.get("frame_version") != feed["version"]:
+        df = pd.DataFrame(list(feed["rows"].values()), columns=["id", "created_at", "source_type", "summary", "topics"])
+        df["created_at"] = pd.to_datetime(df["created_at"])
+        df = df.sort_values(["created_at", "id"], ascending=False).head(TIMELINE_MAX_ROWS)
+        feed["rows"] = {row_id: feed["rows"][row_id] for row_id in df["id"]}
+        feed["frame"], feed["frame_version"] = df.reset_index(drop=True), feed["version"]
+    return feed["frame"]
 
 st.set_page_config(page_title="AI MINDS", layout="wide")
 
@@ -59,13 +122,11 @@ with tab2:
 
         
     try:
-        events = requests.get(f"{API_URL}/timeline").json()
-        if events:
-            df = pd.DataFrame(events)
-            df['created_at'] = pd.to_datetime(df['created_at'])
+        df = timeline_frame(fetch_feed("/timeline", {}, max_rows=TIMELINE_MAX_ROWS))
+        if not df.empty:
             st.dataframe(df[['created_at', 'source_type', 'summary', 'topics']], use_container_width=True)
             
-            for evt in events[:5]:
+            for evt in df.head(5).to_dict("records"):
                 with st.expander(f"{evt['created_at']} - {evt['summary']}"):
                     st.write(f"Source: {evt['source_type']}")
                     st.write(f"Topics: {evt['topics']}")
@@ -84,7 +145,9 @@ with tab3:
         params["status"] = filter_status
         
     try:
-        actions = requests.get(f"{API_URL}/actions", params=params).json()
+        feed = fetch_feed("/actions", params)
+        # Soonest due first, undated last (the /actions order)
+        actions = sorted(feed["rows"].values(), key=lambda a: (a["due_date"] is None, a["due_date"] or "", a["id"]))
         if actions:
             for action in actions:
                 col1, col2, col3 = st.columns([3, 1, 1])